@@ -0,0 +1,508 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import Future
+import git
+from linters import parse_eslint_output
+import governor
+from governor import process_tree_rss
+
+PYRIGHT_SEVERITIES = {1: "error", 2: "warning", 3: "information"}
+
+# Lints files named on stdin, one JSON request per line, with an ESLint
+# instance loaded once from the workspace's own node_modules.
+ESLINT_DAEMON_SCRIPT = """
+const readline = require("readline");
+const cwd = process.cwd();
+const reply = (message) => process.stdout.write(JSON.stringify(message) + "\\n");
+let eslint;
+try {
+  eslint = require(require.resolve("eslint", { paths: [cwd] }));
+} catch (error) {
+  reply({ error: String(error) });
+  process.exit(1);
+}
+const ready = (eslint.loadESLint ? eslint.loadESLint({ cwd }) : Promise.resolve(eslint.ESLint))
+  .then((ESLint) => new ESLint({ cwd }));
+ready.then(() => reply({ ready: true }), (error) => {
+  reply({ error: String(error) });
+  process.exit(1);
+});
+let queue = ready;
+readline.createInterface({ input: process.stdin }).on("line", (line) => {
+  queue = queue.then(async (linter) => {
+    try {
+      reply({ results: await linter.lintFiles(JSON.parse(line).files) });
+    } catch (error) {
+      reply({ error: String(error) });
+    }
+    return linter;
+  });
+});
+"""
+
+
+class DaemonError(Exception):
+    pass
+
+
+def config_digest(repo_path, config_files):
+    """Hashes the analyzer config files present in a checkout."""
+    digest = hashlib.sha256()
+    for name in config_files:
+        path = os.path.join(repo_path, name)
+        if os.path.isfile(path):
+            digest.update(name.encode() + b"\0")
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:16]
+
+
+class AnalyzerDaemon:
+    """
+    A long-lived analyzer process for one repository. It works in a
+    worktree of its own that is moved to each job's commit in place, so the
+    process keeps its loaded configuration, plugins and project index
+    between jobs and only re-reads what changed. Results are mapped back to
+    the job's checkout.
+    """
+
+    def __init__(self, repo_cache, env_cache, repo_name, setup, timeout):
+        self.repo_cache = repo_cache
+        self.env_cache = env_cache
+        self.repo_name = repo_name
+        self.setup = setup
+        self.timeout = timeout
+        self.workspace = None
+        self.process = None
+        self.jobs = 0
+        self.healthy = True
+        self.last_used = time.monotonic()
+
+    def start(self, commit):
+        self.workspace = self.repo_cache.add_worktree(self.repo_name, commit)
+        self._launch()
+
+    def check(self, repo_path, files):
+        """Returns diagnostics for repo-relative files of the checkout at repo_path."""
+        commit = git.Repo(repo_path).head.commit.hexsha
+        changes = self.repo_cache.move_worktree(self.repo_name, self.workspace, commit)
+        # The daemon's memory counts against the job like any child's.
+        with governor.watch(self.process):
+            diagnostics = self._check(changes, files)
+        self.jobs += 1
+        for diag in diagnostics:
+            relative_path = os.path.relpath(diag["file"], self.workspace)
+            diag["file"] = os.path.join(repo_path, relative_path)
+        return diagnostics
+
+    def rss(self):
+        if self.process is None:
+            return 0
+        return process_tree_rss(self.process.pid)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self._shutdown()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.workspace is not None:
+            self.repo_cache.remove_worktree(self.repo_name, self.workspace)
+            self.workspace = None
+
+    def _launch(self):
+        raise NotImplementedError
+
+    def _check(self, changes, files):
+        raise NotImplementedError
+
+    def _shutdown(self):
+        self.process.terminate()
+
+
+class LanguageServer:
+    """Minimal JSON-RPC client for a language server on a child's stdio."""
+
+    def __init__(self, command, cwd, settings):
+        self.settings = settings
+        self.process = subprocess.Popen(
+            command,
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        self.next_id = 0
+        self.pending = {}
+        self.write_lock = threading.Lock()
+        self.lock = threading.Lock()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def request(self, method, params, timeout):
+        with self.lock:
+            self.next_id += 1
+            request_id = self.next_id
+            future = self.pending[request_id] = Future()
+        self._send({"id": request_id, "method": method, "params": params})
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            with self.lock:
+                self.pending.pop(request_id, None)
+            raise DaemonError(f"{method} timed out") from None
+
+    def notify(self, method, params):
+        self._send({"method": method, "params": params})
+
+    def _send(self, message):
+        body = json.dumps({"jsonrpc": "2.0", **message}).encode()
+        with self.write_lock:
+            try:
+                self.process.stdin.write(
+                    b"Content-Length: %d\r\n\r\n" % len(body) + body
+                )
+                self.process.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                raise DaemonError("Language server exited.") from None
+
+    def _read(self):
+        stdout = self.process.stdout
+        while True:
+            length = None
+            while line := stdout.readline():
+                if not line.strip():
+                    break
+                name, _, value = line.decode().partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            if not line or length is None:
+                break
+            self._dispatch(json.loads(stdout.read(length)))
+
+        with self.lock:
+            for future in self.pending.values():
+                future.set_exception(DaemonError("Language server exited."))
+            self.pending.clear()
+
+    def _dispatch(self, message):
+        method = message.get("method")
+        if method is not None and "id" in message:
+            # Server-to-client requests: settings lookups get ours, the rest
+            # (capability registration, progress tokens) only need a reply.
+            result = None
+            if method == "workspace/configuration":
+                result = [
+                    self.settings.get(item.get("section"), {})
+                    for item in message["params"]["items"]
+                ]
+            self._send({"id": message["id"], "result": result})
+        elif method is None:
+            with self.lock:
+                future = self.pending.pop(message.get("id"), None)
+            if future is None:
+                return
+            if "error" in message:
+                future.set_exception(DaemonError(message["error"].get("message")))
+            else:
+                future.set_result(message.get("result"))
+
+
+class PyrightDaemon(AnalyzerDaemon):
+    """
+    pyright-langserver over LSP. Only the files being checked are opened;
+    files that changed between jobs are reported as watched-file changes so
+    Pyright invalidates just those modules and their dependents.
+    """
+
+    def _launch(self):
+        settings = {
+            "python": {"pythonPath": self.setup} if self.setup else {},
+            "python.analysis": {"diagnosticMode": "openFilesOnly"},
+        }
+        self.server = LanguageServer(
+            ["pyright-langserver", "--stdio"], self.workspace, settings
+        )
+        self.process = self.server.process
+        root_uri = Path(self.workspace).as_uri()
+        self.server.request(
+            "initialize",
+            {
+                "processId": os.getpid(),
+                "rootUri": root_uri,
+                "workspaceFolders": [{"uri": root_uri, "name": self.repo_name}],
+                "capabilities": {
+                    "workspace": {
+                        "configuration": True,
+                        "didChangeWatchedFiles": {"dynamicRegistration": True},
+                    },
+                    "textDocument": {"diagnostic": {"dynamicRegistration": False}},
+                },
+            },
+            self.timeout,
+        )
+        self.server.notify("initialized", {})
+        self.version = 0
+
+    def _check(self, changes, files):
+        if changes:
+            change_types = {"A": 1, "M": 2, "D": 3}
+            self.server.notify(
+                "workspace/didChangeWatchedFiles",
+                {
+                    "changes": [
+                        {
+                            "uri": Path(self.workspace, path).as_uri(),
+                            "type": change_types.get(status[0], 2),
+                        }
+                        for status, path in changes
+                    ]
+                },
+            )
+
+        self.version += 1
+        uris = {}
+        for path in files:
+            file_path = os.path.join(self.workspace, path)
+            uri = Path(file_path).as_uri()
+            with open(file_path, errors="replace") as f:
+                text = f.read()
+            self.server.notify(
+                "textDocument/didOpen",
+                {
+                    "textDocument": {
+                        "uri": uri,
+                        "languageId": "python",
+                        "version": self.version,
+                        "text": text,
+                    }
+                },
+            )
+            uris[uri] = file_path
+        # Pulled rather than published diagnostics: the reply comes once the
+        # file is fully checked.
+        try:
+            pulled = {
+                uri: self.server.request(
+                    "textDocument/diagnostic",
+                    {"textDocument": {"uri": uri}},
+                    self.timeout,
+                )["items"]
+                for uri in uris
+            }
+        finally:
+            for uri in uris:
+                self.server.notify(
+                    "textDocument/didClose", {"textDocument": {"uri": uri}}
+                )
+
+        # Same shape as `pyright --outputjson` diagnostics.
+        diagnostics = []
+        for uri, items in pulled.items():
+            for item in items:
+                severity = PYRIGHT_SEVERITIES.get(item.get("severity", 1))
+                if severity is None:
+                    continue
+                diagnostics.append(
+                    {
+                        "file": uris[uri],
+                        "severity": severity,
+                        "message": item["message"],
+                        "range": item["range"],
+                        "rule": item.get("code", ""),
+                    }
+                )
+        return diagnostics
+
+    def _shutdown(self):
+        try:
+            self.server.request("shutdown", None, 5)
+            self.server.notify("exit", None)
+        except DaemonError:
+            self.process.terminate()
+
+
+class ESLintDaemon(AnalyzerDaemon):
+    """A Node process holding one ESLint instance loaded from the repository."""
+
+    def _launch(self):
+        self.env_cache.install_node_modules(self.workspace)
+        self.process = subprocess.Popen(
+            ["node", "-e", ESLINT_DAEMON_SCRIPT],
+            cwd=self.workspace,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            text=True,
+        )
+        self._receive()
+
+    def _receive(self):
+        result = {}
+
+        def read():
+            line = self.process.stdout.readline()
+            result["message"] = json.loads(line) if line else {"error": "exited"}
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        reader.join(self.timeout)
+        if reader.is_alive():
+            raise DaemonError("ESLint daemon timed out.")
+        message = result["message"]
+        if "error" in message:
+            raise DaemonError(f"ESLint daemon failed: {message['error']}")
+        return message
+
+    def _check(self, changes, files):
+        try:
+            self.process.stdin.write(json.dumps({"files": files}) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            raise DaemonError("ESLint daemon exited.") from None
+        results = self._receive()["results"]
+        return parse_eslint_output(json.dumps(results), self.workspace)
+
+
+DAEMONS = {"pyright": PyrightDaemon, "eslint": ESLintDaemon}
+
+
+class AnalyzerHost:
+    """
+    Pool of warm analyzer daemons, reused by later jobs for the same
+    repository, Python environment and analyzer config. Each daemon serves
+    one job at a time and is recycled after max_jobs jobs or once it grows
+    past max_rss_bytes. check() returns None whenever a daemon cannot be
+    used, for the caller to fall back to a one-off subprocess.
+    """
+
+    def __init__(
+        self,
+        repo_cache,
+        env_cache,
+        max_daemons,
+        max_jobs,
+        max_rss_bytes,
+        idle_seconds,
+        timeout,
+    ):
+        self.repo_cache = repo_cache
+        self.env_cache = env_cache
+        self.max_daemons = max_daemons
+        self.max_jobs = max_jobs
+        self.max_rss_bytes = max_rss_bytes
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        # Idle daemons by key; busy ones are only counted.
+        self.idle = {}
+        self.busy = 0
+        self.lock = threading.Lock()
+        self.counts = {"started": 0, "reused": 0, "recycled": 0, "fallbacks": 0}
+
+    def check(self, analyzer_name, repo_name, repo_path, config_files, setup, files):
+        daemon_class = DAEMONS.get(analyzer_name)
+        if daemon_class is None:
+            return None
+        key = (analyzer_name, repo_name, setup, config_digest(repo_path, config_files))
+        leased, daemon = self._lease(key)
+        if not leased:
+            self._count("fallbacks")
+            return None
+
+        try:
+            if daemon is None:
+                daemon = daemon_class(
+                    self.repo_cache, self.env_cache, repo_name, setup, self.timeout
+                )
+                self._count("started")
+                daemon.start(git.Repo(repo_path).head.commit.hexsha)
+            else:
+                self._count("reused")
+            print(f"Checking {len(files)} files with a warm {analyzer_name} daemon...")
+            return daemon.check(repo_path, files)
+        except Exception as e:
+            # Whatever went wrong, the daemon may be mid-request; it is
+            # stopped rather than handed to the next job.
+            print(f"The {analyzer_name} daemon failed, running it directly: {e}")
+            if daemon is not None:
+                daemon.healthy = False
+            self._count("fallbacks")
+            return None
+        finally:
+            self._release(key, daemon)
+
+    def reap_idle(self):
+        """Stops daemons that have not served a job for idle_seconds."""
+        cutoff = time.monotonic() - self.idle_seconds
+        expired = []
+        with self.lock:
+            for key, daemons in list(self.idle.items()):
+                expired += [daemon for daemon in daemons if daemon.last_used < cutoff]
+                daemons[:] = [d for d in daemons if d.last_used >= cutoff]
+                if not daemons:
+                    del self.idle[key]
+        for daemon in expired:
+            daemon.stop()
+
+    def close(self):
+        with self.lock:
+            daemons = [daemon for group in self.idle.values() for daemon in group]
+            self.idle.clear()
+        for daemon in daemons:
+            daemon.stop()
+
+    def _lease(self, key):
+        """
+        Returns (True, idle daemon for key or None to start one), stopping the
+        least recently used idle daemon if the pool is full, or (False, None)
+        when every daemon is busy.
+        """
+        evicted = None
+        with self.lock:
+            if self.idle.get(key):
+                self.busy += 1
+                return True, self.idle[key].pop()
+            idle = [
+                (d.last_used, k, d) for k, group in self.idle.items() for d in group
+            ]
+            if self.busy + len(idle) >= self.max_daemons:
+                if not idle:
+                    return False, None
+                _, evicted_key, evicted = min(idle, key=lambda entry: entry[0])
+                self.idle[evicted_key].remove(evicted)
+            self.busy += 1
+        if evicted is not None:
+            evicted.stop()
+        return True, None
+
+    def _release(self, key, daemon):
+        if daemon is None:
+            with self.lock:
+                self.busy -= 1
+            return
+        retire = (
+            not daemon.healthy
+            or daemon.jobs >= self.max_jobs
+            or daemon.rss() > self.max_rss_bytes
+        )
+        with self.lock:
+            self.busy -= 1
+            if not retire:
+                daemon.last_used = time.monotonic()
+                self.idle.setdefault(key, []).append(daemon)
+        if retire:
+            if daemon.healthy:
+                self._count("recycled")
+            daemon.stop()
+
+    def _count(self, name):
+        with self.lock:
+            self.counts[name] += 1
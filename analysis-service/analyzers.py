@@ -0,0 +1,285 @@
+import os
+import re
+import shutil
+from collections import Counter
+from diagnostics_cache import tool_version, sources_hash
+from python_imports import python_dependency_keys
+from linters import (
+    run_pyright_analysis,
+    run_clang_tidy_analysis,
+    run_eslint_analysis,
+    run_shellcheck_analysis,
+    PYTHON_EXTENSIONS,
+    C_EXTENSIONS,
+    JS_EXTENSIONS,
+    SHELL_EXTENSIONS,
+)
+
+ESLINT_CONFIG_FILES = (
+    "package.json",
+    "package-lock.json",
+    "eslint.config.js",
+    "eslint.config.mjs",
+    "eslint.config.cjs",
+    ".eslintrc",
+    ".eslintrc.js",
+    ".eslintrc.cjs",
+    ".eslintrc.json",
+    ".eslintrc.yml",
+)
+
+HEADER_PATTERNS = ("*.h", "*.hh", "*.hpp", "*.hxx", "*.inc")
+
+
+class AnalysisContext:
+    """What an analyzer can use while it lints one checkout."""
+
+    __slots__ = (
+        "repo_name",
+        "repo_path",
+        "env_cache",
+        "enter_context",
+        "run_in_pool",
+        "map_in_pool",
+        "analyzer_host",
+    )
+
+    def __init__(
+        self,
+        repo_name,
+        repo_path,
+        env_cache,
+        enter_context,
+        run_in_pool,
+        map_in_pool,
+        analyzer_host=None,
+    ):
+        self.repo_name = repo_name
+        self.repo_path = repo_path
+        self.env_cache = env_cache
+        # Keeps a context manager open until the job is done.
+        self.enter_context = enter_context
+        # Run linter processes in the worker's process pool.
+        self.run_in_pool = run_in_pool
+        self.map_in_pool = map_in_pool
+        # Pool of warm analyzer daemons, if the worker keeps one.
+        self.analyzer_host = analyzer_host
+
+
+class Analyzer:
+    """
+    A linter plugin. Subclasses name the tool, the language it covers, the
+    file extensions and shebang interpreters it handles and the config files
+    its results depend on, and implement run(). Decorating a subclass with
+    @register makes every PR job run it on its share of the changed files.
+    """
+
+    name = None
+    language = None
+    extensions = ()
+    interpreters = ()
+    config_files = ()
+    # Program that must be on PATH for the analyzer to run; defaults to name.
+    executable = None
+
+    def available(self):
+        return shutil.which(self.executable or self.name) is not None
+
+    def version(self):
+        return tool_version(self.name, "--version")
+
+    def prepare(self, context):
+        """Installs what run() needs and returns it, e.g. an interpreter path."""
+        return None
+
+    def cache_extra(self, context, setup):
+        """Extra cache key for results that depend on more than each file."""
+        return ""
+
+    def cache_keys(self, context, blobs):
+        """
+        Maps {path: blob SHA} to the key each file's results are cached under;
+        by default its blob SHA.
+        """
+        return blobs
+
+    def run_in_daemon(self, context, files, setup):
+        """
+        Checks files in a warm daemon of this analyzer, if it has one. Returns
+        None when no daemon can be used, for run() to fall back to a fresh
+        process.
+        """
+        if files is None or context.analyzer_host is None:
+            return None
+        return context.analyzer_host.check(
+            self.name,
+            context.repo_name,
+            context.repo_path,
+            self.config_files,
+            setup,
+            files,
+        )
+
+    def run(self, context, files, setup):
+        """
+        Returns diagnostics for the repo-relative files, or for the whole
+        repository when files is None, or None if the tool itself failed.
+        """
+        raise NotImplementedError
+
+
+ANALYZERS = {}
+
+
+def register(analyzer_class):
+    analyzer = analyzer_class()
+    ANALYZERS[analyzer.name] = analyzer
+    return analyzer_class
+
+
+@register
+class PyrightAnalyzer(Analyzer):
+    name = "pyright"
+    language = "python"
+    extensions = PYTHON_EXTENSIONS
+    interpreters = ("python",)
+    config_files = ("pyrightconfig.json", "pyproject.toml")
+
+    def prepare(self, context):
+        return context.enter_context(context.env_cache.python_env(context.repo_path))
+
+    # The environment is keyed by the requirements it was installed from.
+    def cache_extra(self, context, setup):
+        return str(setup)
+
+    # Pyright's results for a file also depend on the modules it imports.
+    def cache_keys(self, context, blobs):
+        return python_dependency_keys(context.repo_path, blobs)
+
+    def run(self, context, files, setup):
+        diagnostics = self.run_in_daemon(context, files, setup)
+        if diagnostics is not None:
+            return diagnostics
+        return context.run_in_pool(
+            run_pyright_analysis, context.repo_path, setup, files
+        )
+
+
+@register
+class ClangTidyAnalyzer(Analyzer):
+    name = "clang-tidy"
+    language = "c"
+    extensions = C_EXTENSIONS
+    config_files = (
+        ".clang-tidy",
+        "compile_commands.json",
+        "build/compile_commands.json",
+    )
+
+    # Headers a file includes change its results too. Any header change
+    # invalidates every file, but edits to source files alone do not.
+    def cache_extra(self, context, setup):
+        return sources_hash(context.repo_path, HEADER_PATTERNS)
+
+    def run(self, context, files, setup):
+        return run_clang_tidy_analysis(
+            context.repo_path, files, map_func=context.map_in_pool
+        )
+
+
+@register
+class ESLintAnalyzer(Analyzer):
+    name = "eslint"
+    language = "javascript"
+    extensions = JS_EXTENSIONS
+    interpreters = ("node",)
+    executable = "npx"
+    # The lockfile pins the ESLint version and its plugins.
+    config_files = ESLINT_CONFIG_FILES
+
+    def version(self):
+        return "npx"
+
+    def prepare(self, context):
+        context.env_cache.install_node_modules(context.repo_path)
+
+    def run(self, context, files, setup):
+        diagnostics = self.run_in_daemon(context, files, setup)
+        if diagnostics is not None:
+            return diagnostics
+        return context.run_in_pool(run_eslint_analysis, context.repo_path, files)
+
+
+@register
+class ShellCheckAnalyzer(Analyzer):
+    name = "shellcheck"
+    language = "shell"
+    extensions = SHELL_EXTENSIONS
+    interpreters = ("sh", "bash", "dash", "ksh")
+    config_files = (".shellcheckrc",)
+
+    def run(self, context, files, setup):
+        return context.run_in_pool(run_shellcheck_analysis, context.repo_path, files)
+
+
+def installed_analyzers():
+    """Returns the names of the registered analyzers whose tool is installed."""
+    return [name for name, analyzer in ANALYZERS.items() if analyzer.available()]
+
+
+def shebang_interpreter(path):
+    """Returns the interpreter named on a file's #! line, without its version."""
+    try:
+        with open(path, "rb") as f:
+            first_line = f.readline(256)
+    except OSError:
+        return None
+    if not first_line.startswith(b"#!"):
+        return None
+    words = first_line[2:].decode(errors="replace").split()
+    if words and os.path.basename(words[0]) == "env":
+        words = [word for word in words[1:] if not word.startswith("-")]
+    if not words:
+        return None
+    # python3.12 -> python
+    return re.sub(r"[\d.]+$", "", os.path.basename(words[0]))
+
+
+def analyzer_for(path, repo_path=None):
+    """
+    Returns the analyzer for a repo-relative path by its extension or, for
+    files without one in a checkout at repo_path, by its shebang line.
+    """
+    for analyzer in ANALYZERS.values():
+        if path.endswith(analyzer.extensions):
+            return analyzer
+    if repo_path is None or os.path.splitext(path)[1]:
+        return None
+    interpreter = shebang_interpreter(os.path.join(repo_path, path))
+    if interpreter:
+        for analyzer in ANALYZERS.values():
+            if interpreter in analyzer.interpreters:
+                return analyzer
+    return None
+
+
+def assign_files(changed_files, repo_path):
+    """Maps analyzer names to the changed files each lints, skipping deleted ones."""
+    assigned = {}
+    for path in changed_files:
+        if not os.path.isfile(os.path.join(repo_path, path)):
+            continue
+        analyzer = analyzer_for(path, repo_path)
+        if analyzer is not None:
+            assigned.setdefault(analyzer.name, []).append(path)
+    return assigned
+
+
+def primary_language(assigned):
+    """Returns the language most of the assigned files are in, or "unknown"."""
+    counts = Counter()
+    for name, files in assigned.items():
+        counts[ANALYZERS[name].language] += len(files)
+    if not counts:
+        return "unknown"
+    return counts.most_common(1)[0][0]
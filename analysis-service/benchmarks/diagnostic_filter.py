@@ -0,0 +1,146 @@
+"""
+Micro-benchmark of filtering linter diagnostics down to the lines a PR added.
+
+Compares the per-diagnostic loop the worker used to run (relpath, nested
+dict lookups and a set of added line numbers per file) with
+diagnostics.filter_to_added_lines on a synthetic PR.
+
+    python benchmarks/diagnostic_filter.py [--files N] [--diagnostics N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diff_index import parse_diff_stream  # noqa: E402
+from diagnostics import filter_to_added_lines  # noqa: E402
+
+REPO_PATH = "/tmp/clones/example"
+
+
+def build_diff(files, lines_per_file, hunks_per_file, rng):
+    """Returns a unified diff adding hunks_per_file blocks of 1-20 lines per file."""
+    parts = []
+    for n in range(files):
+        path = f"src/module_{n}.py"
+        parts.append(f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n")
+        starts = sorted(rng.sample(range(1, lines_per_file, 25), hunks_per_file))
+        offset = 0
+        for start in starts:
+            added = rng.randint(1, 20)
+            parts.append(
+                f"@@ -{start},1 +{start + offset},{added + 1} @@\n"
+                + " context\n"
+                + "".join(f"+new line {i}\n" for i in range(added))
+            )
+            offset += added
+    return "".join(parts).encode()
+
+
+def build_diagnostics(count, files, lines_per_file, rng):
+    diagnostics = []
+    for _ in range(count):
+        path = f"src/module_{rng.randrange(files)}.py"
+        line = rng.randrange(lines_per_file)
+        span = 0 if rng.random() < 0.8 else rng.randint(1, 10)
+        diagnostics.append(
+            {
+                "file": os.path.join(REPO_PATH, path),
+                "range": {
+                    "start": {"line": line, "character": 0},
+                    "end": {"line": line + span, "character": 0},
+                },
+                "message": "Something is off.",
+                "severity": "error",
+                "rule": "reportGeneralTypeIssues",
+            }
+        )
+    return diagnostics
+
+
+def legacy_filter(diagnostics, added_lines_map, repo_path):
+    relevant = []
+    for diag in diagnostics:
+        file_path = diag.get("file", "")
+        if file_path.startswith(repo_path):
+            relative_path = os.path.relpath(file_path, repo_path)
+            start_line = diag.get("range", {}).get("start", {}).get("line")
+            if relative_path in added_lines_map:
+                if (start_line + 1) in added_lines_map[relative_path]:
+                    relevant.append(diag)
+    return relevant
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--lines-per-file", type=int, default=5000)
+    parser.add_argument("--hunks-per-file", type=int, default=20)
+    parser.add_argument("--diagnostics", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    diff = build_diff(args.files, args.lines_per_file, args.hunks_per_file, rng)
+    diff_index = parse_diff_stream([diff], max_file_bytes=len(diff))
+    diagnostics = build_diagnostics(
+        args.diagnostics, args.files, args.lines_per_file, rng
+    )
+    added_lines_map = {
+        path: {
+            line
+            for start, end in zip(f.starts, f.ends)
+            for line in range(start, end + 1)
+        }
+        for path, f in diff_index.files.items()
+    }
+
+    legacy_time, legacy = best_of(
+        args.repeat, legacy_filter, diagnostics, added_lines_map, REPO_PATH
+    )
+    engine_time, relevant = best_of(
+        args.repeat, filter_to_added_lines, diagnostics, diff_index, REPO_PATH
+    )
+
+    # The engine keeps everything the legacy loop did, plus multi-line
+    # diagnostics that start before an added line but reach into it.
+    expected = [
+        d
+        for d in diagnostics
+        if any(
+            line + 1 in added_lines_map.get(os.path.relpath(d["file"], REPO_PATH), ())
+            for line in range(
+                d["range"]["start"]["line"], d["range"]["end"]["line"] + 1
+            )
+        )
+    ]
+    assert len(relevant) == len(expected) >= len(legacy)
+
+    print(
+        f"{args.diagnostics} diagnostics over {args.files} files, "
+        f"{sum(len(f.starts) for f in diff_index.files.values())} added-line ranges"
+    )
+    print(f"legacy loop:   {legacy_time * 1000:7.1f} ms  {len(legacy)} kept")
+    print(
+        f"filter engine: {engine_time * 1000:7.1f} ms  {len(relevant)} kept "
+        "(multi-line spans included)"
+    )
+    print(f"speedup: {legacy_time / engine_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+"""
+End-to-end benchmark of the poller and the analysis worker against local
+stand-ins for GitHub, Gemini, MongoDB and Redis.
+
+Generates synthetic repositories with one commit per PR (published as
+refs/pull/N/head and cloned over file://), serves their PR listings and
+diffs from a fake GitHub REST server, lets the orchestrator's poller queue
+them and drains the queue with the worker's job handler. The LLM is the
+gateway's fake backend with a configurable latency; MongoDB is mongomock
+and Redis is fakeredis unless --mongo-uri / --redis-url point at real ones.
+Only analyzers whose tool is installed are run; --analyzers narrows the
+set further.
+
+Reports jobs/s, p50/p95/p99 latency per pipeline stage, peak RSS and the
+resources used by the jobs' child processes. With --repush, every PR then
+gets one more commit touching one of its files and is reviewed again, and
+the diagnostics cache hit rate of that second pass is reported.
+
+    python benchmarks/end_to_end.py [--repos N] [--prs-per-repo N] \\
+        [--files-per-pr N] [--languages python:3,javascript:1,c:1,shell:1] \\
+        [--llm-latency S] [--concurrency N] [--repush] [--json results.json]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import importlib
+import threading
+import subprocess
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ORCHESTRATOR_DIR = os.path.join(os.path.dirname(SERVICE_DIR), "orchestrator-service")
+sys.path.insert(0, SERVICE_DIR)
+
+# Modules both services have their own copy of.
+SHADOWED_MODULES = ("pr_dedup", "github_client", "clients")
+
+SOURCE_TEMPLATES = {
+    "python": (
+        ".py",
+        "def handler_{n}(value: int) -> int:\n"
+        '    result: int = "not a number"\n'
+        "    return value + {n}\n",
+    ),
+    "javascript": (
+        ".js",
+        "function handler{n}(value) {{\n  var unused{n} = {n};\n  return value == {n};\n}}\n",
+    ),
+    "c": (
+        ".c",
+        "int handler_{n}(int value) {{\n  int *p = 0;\n  return *p + value + {n};\n}}\n",
+    ),
+    "shell": (".sh", "handler_{n}() {{\n  echo $1 {n}\n}}\n"),
+}
+
+
+def git(repo_path, *args):
+    return subprocess.run(
+        ["git", "-C", repo_path, *args], check=True, capture_output=True, text=True
+    ).stdout
+
+
+def write_source(repo_path, path, language, blocks, seed):
+    extension, template = SOURCE_TEMPLATES[language]
+    full_path = os.path.join(repo_path, path + extension)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "a") as f:
+        f.write("".join(template.format(n=seed + i) for i in range(blocks)))
+    return path + extension
+
+
+def build_repository(root, name, args, languages, rng):
+    """
+    Creates a repository with a base commit and one commit per PR on top of
+    it, and returns [(PR number, head SHA, diff)].
+    """
+    repo_path = os.path.join(root, name)
+    os.makedirs(repo_path)
+    git(repo_path, "init", "-q", "-b", "main")
+    git(repo_path, "config", "user.email", "bench@example.com")
+    git(repo_path, "config", "user.name", "bench")
+    base_files = []
+    for n in range(args.files_per_pr * 2):
+        language = rng.choices(*zip(*languages))[0]
+        base_files.append(
+            (write_source(repo_path, f"src/base_{n}", language, 20, 0), language)
+        )
+    git(repo_path, "add", "-A")
+    git(repo_path, "commit", "-q", "-m", "base")
+    base_sha = git(repo_path, "rev-parse", "HEAD").strip()
+
+    prs = []
+    for number in range(1, args.prs_per_repo + 1):
+        git(repo_path, "checkout", "-q", "--detach", base_sha)
+        for n in range(args.files_per_pr):
+            if rng.random() < 0.5:
+                path, language = rng.choice(base_files)
+                path = os.path.splitext(path)[0]
+            else:
+                language = rng.choices(*zip(*languages))[0]
+                path = f"src/pr{number}_{n}"
+            blocks = max(1, args.lines_per_file // 4)
+            write_source(repo_path, path, language, blocks, number * 1000 + n * 100)
+        git(repo_path, "add", "-A")
+        git(repo_path, "commit", "-q", "-m", f"PR {number}")
+        head_sha = git(repo_path, "rev-parse", "HEAD").strip()
+        git(repo_path, "update-ref", f"refs/pull/{number}/head", head_sha)
+        prs.append((number, head_sha, git(repo_path, "diff", base_sha, head_sha)))
+    git(repo_path, "checkout", "-q", "main")
+    return repo_path, prs
+
+
+def repush(repo_path, prs, rng):
+    """
+    Adds a commit to each PR that appends to one of the files it changed and
+    returns the updated [(PR number, head SHA, diff)].
+    """
+    base_sha = git(repo_path, "rev-parse", "main").strip()
+    languages = {
+        extension: language for language, (extension, _) in SOURCE_TEMPLATES.items()
+    }
+    pushed = []
+    for number, head_sha, _ in prs:
+        git(repo_path, "checkout", "-q", "--detach", head_sha)
+        changed = git(repo_path, "diff", "--name-only", base_sha, head_sha).split()
+        path, extension = os.path.splitext(rng.choice(changed))
+        write_source(repo_path, path, languages[extension], 1, number * 1000 + 999)
+        git(repo_path, "commit", "-q", "-am", f"PR {number} again")
+        head_sha = git(repo_path, "rev-parse", "HEAD").strip()
+        git(repo_path, "update-ref", f"refs/pull/{number}/head", head_sha)
+        pushed.append((number, head_sha, git(repo_path, "diff", base_sha, head_sha)))
+    git(repo_path, "checkout", "-q", "main")
+    return pushed
+
+
+class FakeGitHub(BaseHTTPRequestHandler):
+    """Serves PR listings, diffs and review endpoints for the synthetic repos."""
+
+    repositories = {}
+    reviews = []
+    latency = 0.0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        time.sleep(self.latency)
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-RateLimit-Remaining", "5000")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        host = f"http://{self.headers['Host']}"
+        if match := re.fullmatch(r"/repos/([^/]+/[^/]+)/pulls", path):
+            repo = self.repositories[match.group(1)]
+            pulls = [
+                {
+                    "number": number,
+                    "head": {"sha": sha, "ref": f"pr-{number}"},
+                    "base": {"repo": {"clone_url": repo["clone_url"]}},
+                    "diff_url": f"{host}/{match.group(1)}/pull/{number}.diff",
+                }
+                for number, sha, _ in repo["prs"]
+            ]
+            return self._send(200, pulls)
+        if match := re.fullmatch(r"/([^/]+/[^/]+)/pull/(\d+)\.diff", path):
+            for number, _, diff in self.repositories[match.group(1)]["prs"]:
+                if number == int(match.group(2)):
+                    return self._send(200, diff, "text/plain")
+        if re.fullmatch(r"/repos/[^/]+/[^/]+/pulls/\d+/comments", path):
+            return self._send(200, [])
+        self._send(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if re.fullmatch(r"/repos/[^/]+/[^/]+/pulls/\d+/reviews", self.path):
+            with self.lock:
+                self.reviews.append(json.loads(body))
+            return self._send(200, {"id": len(self.reviews)})
+        self._send(404, {"message": "Not Found"})
+
+
+def use_local_backends(args):
+    """Points every Redis and MongoDB client the services create at stand-ins."""
+    import redis
+    import pymongo
+
+    if not args.redis_url:
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        redis.Redis.from_url = classmethod(
+            lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server, **kwargs)
+        )
+        redis.asyncio.from_url = lambda url, **kwargs: fakeredis.aioredis.FakeRedis(
+            server=server, **kwargs
+        )
+    if not args.mongo_uri:
+        import mongomock
+        import mongomock.collection
+
+        client = mongomock.MongoClient()
+        pymongo.MongoClient = lambda *args, **kwargs: client
+        # pymongo's UpdateOne passes a `sort` option mongomock does not know.
+        add_update = mongomock.collection.BulkOperationBuilder.add_update
+        mongomock.collection.BulkOperationBuilder.add_update = (
+            lambda self, *args, sort=None, **kwargs: add_update(self, *args, **kwargs)
+        )
+
+
+def import_service_module(name, directory):
+    """Imports a module of another service alongside this one's namesakes."""
+    saved = {m: sys.modules.pop(m) for m in SHADOWED_MODULES if m in sys.modules}
+    sys.path.insert(0, directory)
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.remove(directory)
+        for module in SHADOWED_MODULES:
+            sys.modules.pop(module, None)
+        sys.modules.update(saved)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def drain(worker, queue, expected, concurrency):
+    """Runs the worker's job handler on `concurrency` threads until all jobs are done."""
+    handled = []
+    lock = threading.Lock()
+
+    def run():
+        while True:
+            with lock:
+                if len(handled) >= expected:
+                    return
+            job_json = queue.claim(timeout=1)
+            if job_json is None:
+                queue.promote_due()
+                continue
+            worker.handle_job(queue, job_json)
+            with lock:
+                handled.append(job_json)
+
+    threads = [
+        threading.Thread(target=run, name=f"job-{n}", daemon=True)
+        for n in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repos", type=int, default=4)
+    parser.add_argument("--prs-per-repo", type=int, default=10)
+    parser.add_argument("--files-per-pr", type=int, default=5)
+    parser.add_argument("--lines-per-file", type=int, default=40)
+    parser.add_argument(
+        "--languages",
+        default="python:3,javascript:1,c:1,shell:1",
+        help="Weights of the languages of generated files.",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--github-latency", type=float, default=0.02)
+    parser.add_argument(
+        "--analyzers",
+        help="Comma-separated analyzers to run (default: those installed).",
+    )
+    parser.add_argument("--redis-url", help="Use this Redis instead of fakeredis.")
+    parser.add_argument("--mongo-uri", help="Use this MongoDB instead of mongomock.")
+    parser.add_argument(
+        "--repush",
+        action="store_true",
+        help="Push to every PR once more and review them again.",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--verbose", action="store_true", help="Show service logs.")
+    args = parser.parse_args()
+
+    languages = [
+        (language, int(weight))
+        for language, weight in (item.split(":") for item in args.languages.split(","))
+    ]
+    rng = random.Random(args.seed)
+    root = tempfile.mkdtemp(prefix="e2e-bench-")
+
+    print(f"Generating {args.repos} repositories in {root}...")
+    for n in range(args.repos):
+        name = f"bench/repo-{n}"
+        repo_path, prs = build_repository(
+            os.path.join(root, "src"), name, args, languages, rng
+        )
+        FakeGitHub.repositories[name] = {
+            "clone_url": f"file://{repo_path}",
+            "path": repo_path,
+            "prs": prs,
+        }
+    FakeGitHub.latency = args.github_latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ.update(
+        {
+            "GITHUB_PAT": "bench",
+            "GITHUB_API_URL": f"http://127.0.0.1:{server.server_port}",
+            "REDIS_URL": args.redis_url or "redis://fake",
+            "MONGO_ATLAS_URI": args.mongo_uri or "mongodb://fake",
+            "LLM_BACKEND": "fake",
+            "FAKE_LLM_LATENCY": str(args.llm_latency),
+            "LLM_REQUESTS_PER_MINUTE": "1000000",
+            "WORKER_CONCURRENCY": str(args.concurrency),
+            "ENV_CACHE_DIR": os.path.join(root, "env-cache"),
+            "JOB_VISIBILITY_TIMEOUT": "3600",
+            "JOB_MAX_ATTEMPTS": "1",
+            "JOB_REPO_CONCURRENCY": str(args.concurrency),
+            "LOG_FORMAT": "text",
+        }
+    )
+    use_local_backends(args)
+
+    stages = {}
+    job_resources = []
+    log = sys.stdout if args.verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(log):
+        import telemetry
+        import analyzers
+        from repo_cache import RepoCache
+        from job_queue import ReliableQueue
+        from prometheus_client import REGISTRY
+
+        def record_stage(event, stage=None, seconds=None, **fields):
+            if event == "stage":
+                stages.setdefault(stage, []).append(seconds)
+            elif event == "job_resources":
+                job_resources.append(fields)
+
+        telemetry.log_event = record_stage
+
+        wanted = (
+            args.analyzers.split(",")
+            if args.analyzers
+            else analyzers.installed_analyzers()
+        )
+        for name in list(analyzers.ANALYZERS):
+            if name not in wanted:
+                del analyzers.ANALYZERS[name]
+
+        worker = importlib.import_module("worker")
+        worker.repo_cache = RepoCache(os.path.join(root, "repos"), 10 * 1024**3)
+        if worker.analyzer_host is not None:
+            worker.analyzer_host.repo_cache = worker.repo_cache
+        scheduler = import_service_module("scheduler", ORCHESTRATOR_DIR)
+        for name in FakeGitHub.repositories:
+            scheduler.repositores_collection.insert_one(
+                {"full_name": name, "status": "active"}
+            )
+
+        poll_started = time.perf_counter()
+        scheduler.check_repositories()
+        poll_seconds = time.perf_counter() - poll_started
+
+        queue = ReliableQueue(
+            worker.connect_to_redis(),
+            worker.PR_QUEUE_NAME,
+            "bench",
+            visibility_timeout=worker.JOB_VISIBILITY_TIMEOUT,
+            max_attempts=worker.JOB_MAX_ATTEMPTS,
+            backoff_base=worker.JOB_RETRY_BACKOFF_SECONDS,
+            lane_weights=worker.JOB_LANE_WEIGHTS,
+            repo_concurrency=worker.JOB_REPO_CONCURRENCY,
+        )
+        expected = args.repos * args.prs_per_repo
+        worker.start_lint_pool()
+        started = time.perf_counter()
+        drain(worker, queue, expected, args.concurrency)
+        elapsed = time.perf_counter() - started
+
+        repush_cache = None
+        if args.repush:
+            for repo in FakeGitHub.repositories.values():
+                repo["prs"] = repush(repo["path"], repo["prs"], rng)
+            before = dict(worker.diagnostics_cache.counts)
+            scheduler.check_repositories()
+            drain(worker, queue, expected, args.concurrency)
+            repush_cache = {
+                name: worker.diagnostics_cache.counts[name] - before[name]
+                for name in ("hits", "misses")
+            }
+        worker.lint_pool.shutdown()
+        if worker.analyzer_host is not None:
+            worker.analyzer_host.close()
+
+    outcomes = {
+        outcome: int(
+            REGISTRY.get_sample_value(
+                "analysis_jobs_total",
+                {"event_type": "pull_request", "outcome": outcome},
+            )
+            or 0
+        )
+        for outcome in ("ok", "dropped", "retry", "dead")
+    }
+    results = {
+        "prs": expected,
+        "analyzers": sorted(analyzers.ANALYZERS),
+        "concurrency": args.concurrency,
+        "poll_seconds": round(poll_seconds, 3),
+        "drain_seconds": round(elapsed, 3),
+        "jobs_per_second": round(expected / elapsed, 3),
+        "outcomes": outcomes,
+        "reviews_posted": len(FakeGitHub.reviews),
+        "stages": {},
+        "peak_rss_mib": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "peak_child_rss_mib": round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1
+        ),
+        "child_processes": sum(job["processes"] for job in job_resources),
+        "child_cpu_seconds": round(sum(job["cpu_seconds"] for job in job_resources), 3),
+        "child_limits_hit": sum(job["limits_hit"] for job in job_resources),
+        "repush_cache": repush_cache,
+    }
+    for stage, timings in stages.items():
+        timings.sort()
+        results["stages"][stage] = {
+            "count": len(timings),
+            **{
+                name: round(percentile(timings, fraction), 4)
+                for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+            },
+        }
+
+    print(
+        f"{expected} PRs in {args.repos} repositories, analyzers: "
+        f"{', '.join(results['analyzers']) or 'none'}, concurrency {args.concurrency}"
+    )
+    print(f"poll tick:  {poll_seconds:7.2f} s")
+    print(
+        f"drain:      {elapsed:7.2f} s  {results['jobs_per_second']:.2f} jobs/s  "
+        + " ".join(f"{k}={v}" for k, v in outcomes.items())
+        + f"  reviews posted={len(FakeGitHub.reviews)}"
+    )
+    print(f"{'stage':<22} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage, row in sorted(results["stages"].items()):
+        print(
+            f"{stage:<22} {row['count']:>6} {row['p50']:>8.3f}s "
+            f"{row['p95']:>8.3f}s {row['p99']:>8.3f}s"
+        )
+    print(
+        f"peak RSS:   {results['peak_rss_mib']} MiB "
+        f"(largest child {results['peak_child_rss_mib']} MiB)"
+    )
+    print(
+        f"children:   {results['child_processes']} governed processes, "
+        f"{results['child_cpu_seconds']} CPU s, "
+        f"{results['child_limits_hit']} killed at a limit"
+    )
+    if repush_cache is not None:
+        total = repush_cache["hits"] + repush_cache["misses"]
+        print(
+            f"re-push:    diagnostics cache {repush_cache['hits']} hits, "
+            f"{repush_cache['misses']} misses "
+            f"({repush_cache['hits'] / total if total else 0:.0%} hit rate)"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    server.shutdown()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
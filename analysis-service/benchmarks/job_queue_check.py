@@ -0,0 +1,210 @@
+"""
+Smoke check of the job queue's Redis scripts against fakeredis, or a real
+Redis given with --redis-url.
+
+Pushes jobs the way the ingestion service does and walks them through
+claim, ack, retry with backoff, lease renewal and reaping and the dead-letter list,
+including payloads that are valid JSON but not objects. Exits with status 1
+if any step leaves the queue in the wrong state or raises, and skips with
+status 0 if the Redis cannot run Lua scripts (fakeredis without lupa).
+
+    python benchmarks/job_queue_check.py [--redis-url redis://...] [--verbose]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import contextlib
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import ReliableQueue  # noqa: E402
+
+
+def pr_job(number, repo="octo/widgets"):
+    return json.dumps(
+        {
+            "eventType": "pull_request",
+            "enqueuedAt": time.time(),
+            "payload": {"number": number, "repository": {"full_name": repo}},
+        }
+    )
+
+
+def make_queue(redis_client, name, worker_id="check-worker"):
+    return ReliableQueue(
+        redis_client,
+        name,
+        worker_id,
+        visibility_timeout=30,
+        max_attempts=3,
+        backoff_base=1,
+        repo_concurrency=1,
+    )
+
+
+def expect(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_claim_and_ack(r, queue):
+    job = pr_job(1)
+    r.lpush(queue.name, job)
+    expect(queue.claim(timeout=1) == job, "claim did not return the pushed job")
+    expect(r.lrange(queue.processing, 0, -1) == [job], "job is not being processed")
+    expect(r.hget(queue.leases, job) is not None, "claimed job has no lease")
+    expect(queue.ack(job) == 1, "ack did not remove the job")
+    expect(r.llen(queue.processing) == 0, "acked job is still being processed")
+    expect(not r.hget(queue.running, "octo/widgets"), "repository slot not released")
+
+
+def check_repo_cap(r, queue):
+    first, second = pr_job(2), pr_job(3)
+    r.lpush(queue.name, first, second)
+    claimed = queue.claim(timeout=1)
+    expect(claimed == first, "jobs were not claimed in push order")
+    expect(
+        queue.claim(timeout=1) is None,
+        "a second job of a repository at its concurrency cap was claimed",
+    )
+    queue.ack(claimed)
+    expect(queue.claim(timeout=1) == second, "job not claimable after the ack")
+    queue.ack(second)
+
+
+def check_retry(r, queue):
+    job = pr_job(4)
+    r.lpush(queue.name, job)
+    claimed = queue.claim(timeout=1)
+    expect(queue.retry(claimed, "boom") == 1, "retry did not move the job")
+    delayed = r.zrange(queue.delayed, 0, -1)
+    expect(len(delayed) == 1, "retried job is not in the delay set")
+    expect(json.loads(delayed[0])["_attempts"] == 1, "attempt count not recorded")
+    # Make the retry due now instead of after its backoff.
+    r.zadd(queue.delayed, {delayed[0]: 0})
+    queue.promote_due()
+    retried = queue.claim(timeout=1)
+    expect(retried == delayed[0], "due retry was not claimed again")
+
+    # The last allowed attempt buries the job instead of retrying it.
+    queue.retry(retried, "boom again")
+    again = r.zrange(queue.delayed, 0, -1)[0]
+    r.zadd(queue.delayed, {again: 0})
+    queue.promote_due()
+    queue.retry(queue.claim(timeout=1), "boom for good")
+    expect(r.zcard(queue.delayed) == 0, "job retried past max_attempts")
+    expect(r.llen(queue.dead) == 1, "job that ran out of attempts was not buried")
+    r.delete(queue.dead)
+
+
+def check_reap(r, queue):
+    job = pr_job(5)
+    r.lpush(queue.name, job)
+    claimed = queue.claim(timeout=1)
+    # Another worker's reaper finds the lease expired.
+    r.hset(queue.leases, claimed, 0)
+    reaper = make_queue(r, queue.name, worker_id="check-reaper")
+    expect(reaper.reap_expired() == 1, "expired lease was not reaped")
+    expect(r.llen(queue.processing) == 0, "reaped job is still being processed")
+    expect(r.zcard(queue.delayed) == 1, "reaped job was not scheduled for retry")
+    expect(queue.ack(claimed) == 0, "ack of a reaped job removed it twice")
+    r.delete(queue.delayed)
+
+
+def check_extend(r, queue):
+    job = pr_job(6)
+    r.lpush(queue.name, job)
+    claimed = queue.claim(timeout=1)
+    r.hset(queue.leases, claimed, 0)
+    expect(queue.extend([claimed]) == 1, "lease of a running job not renewed")
+    expect(float(r.hget(queue.leases, claimed)) > time.time(), "lease not pushed out")
+    # The heartbeat listed the job just before it was acked.
+    queue.ack(claimed)
+    expect(queue.extend([claimed]) == 0, "lease of an acked job renewed")
+    expect(r.hlen(queue.leases) == 0, "acked job's lease was recreated")
+
+
+def check_poison(r, queue):
+    for payload in ("[]", "null", '"x"', "{not json"):
+        for settle in ("retry", "reroute", "reap"):
+            r.lpush(queue.name, payload)
+            claimed = queue.claim(timeout=1)
+            expect(claimed == payload, f"poison job {payload} was not claimable")
+            if settle == "retry":
+                queue.retry(claimed, "poison")
+            elif settle == "reroute":
+                queue.reroute(claimed, ["pyright"], 60)
+            else:
+                r.hset(queue.leases, claimed, 0)
+                make_queue(r, queue.name, "check-reaper").reap_expired()
+            expect(
+                r.llen(queue.processing) == 0,
+                f"poison job {payload} left in the processing list by {settle}",
+            )
+            dead = json.loads(r.lpop(queue.dead) or "null")
+            expect(
+                dead is not None and dead["job"] == payload,
+                f"poison job {payload} was not buried by {settle}",
+            )
+
+
+CHECKS = (
+    check_claim_and_ack,
+    check_repo_cap,
+    check_retry,
+    check_reap,
+    check_extend,
+    check_poison,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--redis-url", help="Use this Redis instead of fakeredis.")
+    parser.add_argument("--verbose", action="store_true", help="Show queue logs.")
+    args = parser.parse_args()
+
+    if args.redis_url:
+        import redis
+
+        r = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        import fakeredis
+
+        r = fakeredis.FakeRedis(decode_responses=True)
+    try:
+        r.eval("return 1", 0)
+    except Exception as e:
+        # fakeredis runs scripts only with lupa installed.
+        print(
+            f"skip  Redis cannot run Lua scripts ({e}); install lupa or pass --redis-url."
+        )
+        sys.exit(0)
+
+    log = sys.stdout if args.verbose else open(os.devnull, "w")
+    failures = 0
+    for check in CHECKS:
+        # A fresh queue per check, so a failure cannot leak into the next one.
+        name = f"queue_check:{uuid.uuid4().hex[:8]}"
+        try:
+            with contextlib.redirect_stdout(log):
+                check(r, make_queue(r, name))
+            print(f"ok    {check.__name__}")
+        except Exception:
+            failures += 1
+            print(f"FAIL  {check.__name__}")
+            traceback.print_exc()
+        finally:
+            keys = list(r.scan_iter(match=f"{name}*"))
+            if keys:
+                r.delete(*keys)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
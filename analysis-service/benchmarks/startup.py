@@ -0,0 +1,158 @@
+"""
+Startup benchmark of the analysis worker and the orchestrator's scheduler.
+
+Imports each service module in fresh interpreters, with every backend URL
+pointing at a local listener that counts connections, and reports the
+median import time and the connections made during and shortly after the
+import. Importing a service must not connect to anything; clients are
+created on first use (see clients.py).
+
+Exits with status 1 if a service connects to a backend at import, takes longer
+than --max-seconds, or is more than --tolerance slower than the numbers
+in --baseline (a file written earlier with --json).
+
+    python benchmarks/startup.py [--runs N] [--max-seconds S] \\
+        [--baseline startup.json] [--tolerance 0.25] [--json startup.json]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import statistics
+import subprocess
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ORCHESTRATOR_DIR = os.path.join(os.path.dirname(SERVICE_DIR), "orchestrator-service")
+SERVICES = {"worker": SERVICE_DIR, "scheduler": ORCHESTRATOR_DIR}
+
+# How long after the import background threads (e.g. MongoDB's server
+# monitors) get to connect before the connections are counted.
+SETTLE_SECONDS = 0.5
+
+PROBE = """
+import time, json
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - started}}))
+"""
+
+
+class ConnectionCounter:
+    """Accepts and holds TCP connections on a local port, counting them."""
+
+    def __init__(self):
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.address = "127.0.0.1:%d" % self.listener.getsockname()[1]
+        self.count = 0
+        self.held = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            connection, _ = self.listener.accept()
+            self.count += 1
+            self.held.append(connection)
+
+    def reset(self):
+        for connection in self.held:
+            connection.close()
+        self.held = []
+        self.count = 0
+
+
+def measure(module, directory, runs, timeout, backend):
+    env = {
+        **os.environ,
+        "GITHUB_PAT": "startup-bench",
+        "GITHUB_API_URL": f"http://{backend.address}",
+        "REDIS_URL": f"redis://{backend.address}",
+        "MONGO_ATLAS_URI": f"mongodb://{backend.address}/?serverSelectionTimeoutMS=100",
+        "LLM_BACKEND": "gemini",
+        "GEMINI_API_KEY": "startup-bench",
+        "LOG_FORMAT": "text",
+    }
+    samples = []
+    for _ in range(runs):
+        backend.reset()
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                PROBE.format(module=module) + f"time.sleep({SETTLE_SECONDS})",
+            ],
+            cwd=directory,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        # Let the listener thread catch up with connections made just now.
+        time.sleep(0.05)
+        samples.append({**sample, "connections": backend.count})
+    return {
+        "median_seconds": round(statistics.median(s["seconds"] for s in samples), 4),
+        "max_seconds": round(max(s["seconds"] for s in samples), 4),
+        "connections": max(s["connections"] for s in samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=3.0)
+    parser.add_argument("--baseline", help="Results of an earlier run to compare to.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    backend = ConnectionCounter()
+    results = {}
+    failures = []
+    print(f"{'service':<12} {'median':>9} {'max':>9} {'connections':>12}")
+    for module, directory in SERVICES.items():
+        row = results[module] = measure(
+            module, directory, args.runs, args.timeout, backend
+        )
+        print(
+            f"{module:<12} {row['median_seconds']:>8.3f}s "
+            f"{row['max_seconds']:>8.3f}s {row['connections']:>12}"
+        )
+        if row["connections"]:
+            failures.append(
+                f"{module} made {row['connections']} backend connections at import"
+            )
+        if row["median_seconds"] > args.max_seconds:
+            failures.append(
+                f"{module} took {row['median_seconds']:.3f}s to import "
+                f"(limit {args.max_seconds}s)"
+            )
+        previous = baseline.get(module, {}).get("median_seconds")
+        if previous and row["median_seconds"] > previous * (1 + args.tolerance):
+            failures.append(
+                f"{module} import regressed from {previous:.3f}s "
+                f"to {row['median_seconds']:.3f}s"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class Diagnostic:
+    """
+    A linter finding in the shape every tool is normalized to. path is
+    repo-relative and line/end_line are 1-based and inclusive, so a finding
+    spanning several lines covers [line, end_line].
+    """
+
+    path: str
+    line: int
+    end_line: int
+    column: int
+    message: str
+    severity: str
+    rule: str
+
+    @classmethod
+    def from_raw(cls, raw, path):
+        """Builds a Diagnostic from a linter's LSP-style dict."""
+        line, end_line = raw_line_span(raw)
+        start = raw.get("range", {}).get("start", {})
+        return cls(
+            path=path,
+            line=line,
+            end_line=end_line,
+            column=start.get("character", 0),
+            message=raw.get("message") or "No message provided.",
+            severity=str(raw.get("severity", "")),
+            rule=raw.get("rule") or "general",
+        )
+
+
+def raw_line_span(raw):
+    """Returns the 1-based (first, last) lines of an LSP-style diagnostic dict."""
+    diag_range = raw.get("range", {})
+    line = diag_range.get("start", {}).get("line", 0) + 1
+    end_line = diag_range.get("end", {}).get("line", line - 1) + 1
+    return line, max(line, end_line)
+
+
+def filter_to_added_lines(raw_diagnostics, diff_index, repo_path):
+    """
+    Keeps the diagnostics that touch at least one line the pull request
+    added and returns them as Diagnostic objects. Paths are resolved once per
+    distinct file, not once per diagnostic, and each span is matched against
+    the file's added-line intervals by binary search, so the cost is
+    O(diagnostics * log(intervals)) with no per-diagnostic allocation for
+    the ones that are dropped.
+    """
+    prefix = os.path.join(repo_path, "")
+    file_diffs = {}
+    relevant = []
+    for raw in raw_diagnostics:
+        file_path = raw.get("file", "")
+        if file_path in file_diffs:
+            path, file_diff = file_diffs[file_path]
+        else:
+            path, file_diff = None, None
+            if file_path.startswith(prefix):
+                path = os.path.relpath(file_path, repo_path)
+                file_diff = diff_index.files.get(path)
+            file_diffs[file_path] = (path, file_diff)
+        if file_diff is None:
+            continue
+
+        line, end_line = raw_line_span(raw)
+        if file_diff.overlaps(line, end_line):
+            relevant.append(Diagnostic.from_raw(raw, path))
+    return relevant
@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+import threading
+import functools
+import git
+import governor
+
+STATS_KEY = "diag_cache:stats"
+# Seconds a tool gets to print its version before it counts as unavailable.
+VERSION_TIMEOUT = 30
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version(*command):
+    """Returns the version string a tool reports, cached for the process lifetime."""
+    try:
+        result = governor.run(
+            list(command), capture_output=True, text=True, timeout=VERSION_TIMEOUT
+        )
+        return result.stdout.strip() or result.stderr.strip()
+    except (OSError, governor.ResourceLimitExceeded):
+        return "unavailable"
+
+
+def blob_hashes(repo_path, files):
+    """Maps repo-relative paths to the blob SHAs checked out in the worktree."""
+    if not files:
+        return {}
+    # NUL-terminated, so unusual paths come back verbatim instead of quoted.
+    output = git.Repo(repo_path).git.ls_files("-s", "-z", "--", *files)
+    hashes = {}
+    for entry in output.split("\0"):
+        if entry:
+            meta, path = entry.split("\t", 1)
+            hashes[path] = meta.split()[1]
+    return hashes
+
+
+def sources_hash(repo_path, patterns):
+    """Hashes the paths and blob SHAs of the tracked files matching patterns."""
+    output = git.Repo(repo_path).git.ls_files("-s", "-z", "--", *patterns)
+    return hashlib.sha256(output.encode()).hexdigest()
+
+
+class DiagnosticsCache:
+    """
+    Redis cache of linter output per file. Entries are keyed by a namespace
+    (repository, tool, tool version, hash of the tool's config files and any
+    extra scope) plus the file's blob SHA, so re-pushed PRs and commits seen
+    by both the webhook and the poller only re-lint files whose content
+    changed. Hit, miss and bytes-saved counters are kept in-process and in
+    the diag_cache:stats hash.
+    """
+
+    def __init__(self, redis_client, ttl):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.counts = {"hits": 0, "misses": 0, "bytes_saved": 0}
+        self._counts_lock = threading.Lock()
+
+    def namespace(self, repo_name, tool, version, repo_path, config_files, extra=""):
+        digest = hashlib.sha256()
+        for part in (repo_name, tool, version, extra):
+            digest.update(str(part).encode() + b"\0")
+        for name in config_files:
+            path = os.path.join(repo_path, name)
+            if os.path.isfile(path):
+                digest.update(name.encode() + b"\0")
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+        return f"diag_cache:{tool}:{digest.hexdigest()[:32]}"
+
+    def lookup(self, namespace, blobs):
+        """
+        Returns ({path: diagnostics} for cached files, [paths] to re-lint).
+        Cached diagnostics carry repo-relative "file" paths.
+        """
+        paths = list(blobs)
+        if not paths:
+            return {}, []
+        values = self.redis.mget([f"{namespace}:{blobs[p]}" for p in paths])
+
+        cached, missing, bytes_saved = {}, [], 0
+        for path, value in zip(paths, values):
+            if value is None:
+                missing.append(path)
+            else:
+                cached[path] = json.loads(value)
+                bytes_saved += len(value)
+        self._record(len(cached), len(missing), bytes_saved)
+        return cached, missing
+
+    def store(self, namespace, blobs, diagnostics_by_path):
+        """Caches diagnostics (including empty results) for each linted path."""
+        pipe = self.redis.pipeline(transaction=False)
+        for path, diagnostics in diagnostics_by_path.items():
+            if path in blobs:
+                pipe.set(
+                    f"{namespace}:{blobs[path]}", json.dumps(diagnostics), ex=self.ttl
+                )
+        pipe.execute()
+
+    def _record(self, hits, misses, bytes_saved):
+        with self._counts_lock:
+            self.counts["hits"] += hits
+            self.counts["misses"] += misses
+            self.counts["bytes_saved"] += bytes_saved
+            counts = dict(self.counts)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hincrby(STATS_KEY, "hits", hits)
+            pipe.hincrby(STATS_KEY, "misses", misses)
+            pipe.hincrby(STATS_KEY, "bytes_saved", bytes_saved)
+            pipe.execute()
+        except Exception as e:
+            print(f"Failed to update diagnostics cache stats: {e}")
+
+        total = counts["hits"] + counts["misses"]
+        hit_rate = counts["hits"] / total if total else 0
+        print(
+            f"Diagnostics cache: {hits} hits, {misses} misses this run. "
+            f"Hit rate {hit_rate:.0%}, {counts['bytes_saved']} bytes saved."
+        )
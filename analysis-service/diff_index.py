@@ -0,0 +1,251 @@
+import re
+import fnmatch
+from array import array
+from bisect import bisect_left, bisect_right
+
+HUNK_HEADER = re.compile(rb"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)")
+
+# Paths whose changes are neither linted nor shown to the model.
+SKIPPED_PATH_PATTERNS = (
+    "vendor/*",
+    "*/vendor/*",
+    "node_modules/*",
+    "*/node_modules/*",
+    "third_party/*",
+    "*/third_party/*",
+    "dist/*",
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "package-lock.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "poetry.lock",
+    "Pipfile.lock",
+    "Cargo.lock",
+    "go.sum",
+    "*_pb2.py",
+    "*.pb.go",
+    "*.generated.*",
+)
+
+
+def iter_lines(chunks):
+    """Splits a stream of byte chunks into lines without their trailing newline."""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def is_skipped_path(path):
+    return any(fnmatch.fnmatch(path, pattern) for pattern in SKIPPED_PATH_PATTERNS)
+
+
+def _strip_prefix(raw_path):
+    path = raw_path.decode("utf-8", errors="replace").strip()
+    if path.startswith('"') and path.endswith('"'):
+        path = path[1:-1]
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+
+class FileDiff:
+    """
+    Added lines of one file as sorted, disjoint, inclusive [start, end]
+    ranges in two int arrays, plus the bounded hunk text kept for review.
+    hunks_dropped counts hunks left out of review by the hunk size limit;
+    the file is still linted.
+    """
+
+    __slots__ = (
+        "path",
+        "starts",
+        "ends",
+        "hunks",
+        "hunks_dropped",
+        "size",
+        "skipped_reason",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.starts = array("I")
+        self.ends = array("I")
+        self.hunks = []
+        self.hunks_dropped = 0
+        self.size = 0
+        self.skipped_reason = None
+
+    def add_line(self, line_no):
+        if self.ends and self.ends[-1] + 1 == line_no:
+            self.ends[-1] = line_no
+        else:
+            self.starts.append(line_no)
+            self.ends.append(line_no)
+
+    def overlaps(self, first_line, last_line):
+        """Tells whether any line in [first_line, last_line] was added."""
+        i = bisect_right(self.starts, last_line) - 1
+        return i >= 0 and first_line <= self.ends[i]
+
+    def first_added_line(self, first_line, last_line):
+        """Returns the first added line in [first_line, last_line], or None."""
+        i = bisect_left(self.ends, first_line)
+        if i < len(self.starts) and self.starts[i] <= last_line:
+            return max(first_line, self.starts[i])
+        return None
+
+    def skip(self, reason):
+        self.skipped_reason = reason
+        self.starts = array("I")
+        self.ends = array("I")
+        self.hunks = []
+
+
+class DiffIndex:
+    """Compact result of streaming a unified diff; see parse_diff_stream."""
+
+    def __init__(self):
+        self.files = {}
+        self.excerpt_parts = []
+        self.excerpt_size = 0
+        self.excerpt_truncated = False
+        self.hunk_bytes = 0
+        self.max_hunk_bytes = 0
+        self.total_bytes = 0
+
+    @property
+    def excerpt(self):
+        return "".join(self.excerpt_parts)
+
+    @property
+    def changed_files(self):
+        return [path for path, f in self.files.items() if len(f.starts)]
+
+    @property
+    def skipped_files(self):
+        return {p: f.skipped_reason for p, f in self.files.items() if f.skipped_reason}
+
+    @property
+    def unreviewed_files(self):
+        """
+        Maps the files whose diff is not, or only partly, in the hunks kept
+        for review to the reason, for the prompt to name them.
+        """
+        unreviewed = self.skipped_files
+        for path, f in self.files.items():
+            if f.hunks_dropped and not f.skipped_reason:
+                extent = "partly reviewed" if f.hunks else "not reviewed"
+                unreviewed[path] = (
+                    f"{extent}, diff past the {self.max_hunk_bytes}-byte review limit"
+                )
+        return unreviewed
+
+    def file_hunks(self):
+        """Returns (path, [hunk text]) pairs of the hunks kept for review."""
+        return [(f.path, f.hunks) for f in self.files.values() if f.hunks]
+
+
+def parse_diff_stream(
+    chunks,
+    max_excerpt_bytes=16 * 1024,
+    max_hunk_bytes=256 * 1024,
+    max_file_bytes=1024 * 1024,
+):
+    """
+    Builds a DiffIndex from a unified diff delivered as byte chunks, without
+    ever holding the whole diff. Keeps:
+    - added-line ranges for every file that is not vendored/generated and
+      whose diff is at most max_file_bytes,
+    - the first max_excerpt_bytes of the diff text for single-prompt review,
+    - up to max_hunk_bytes of hunk text, rendered without @@ line ranges, for
+      chunked review.
+    """
+    index = DiffIndex()
+    index.max_hunk_bytes = max_hunk_bytes
+    current = None
+    hunk_lines = None
+    target_line = source_left = target_left = 0
+
+    def flush_hunk():
+        nonlocal hunk_lines
+        if hunk_lines is not None and current and not current.skipped_reason:
+            text = "".join(hunk_lines)
+            if index.hunk_bytes + len(text) <= max_hunk_bytes:
+                current.hunks.append(text)
+                index.hunk_bytes += len(text)
+            else:
+                current.hunks_dropped += 1
+        hunk_lines = None
+
+    for raw_line in iter_lines(chunks):
+        line_size = len(raw_line) + 1
+        index.total_bytes += line_size
+        in_hunk = source_left > 0 or target_left > 0
+
+        if not in_hunk and raw_line.startswith(b"diff --git "):
+            flush_hunk()
+            current = None
+        elif not in_hunk and raw_line.startswith(b"+++ "):
+            flush_hunk()
+            if raw_line[4:].strip() == b"/dev/null":
+                current = None
+                continue
+            path = _strip_prefix(raw_line[4:])
+            current = index.files.setdefault(path, FileDiff(path))
+            if is_skipped_path(path):
+                current.skip("vendored or generated")
+        elif not in_hunk and raw_line.startswith(b"@@ "):
+            flush_hunk()
+            match = HUNK_HEADER.match(raw_line)
+            if not match or current is None:
+                continue
+            source_left = int(match.group(2) or 1)
+            target_line = int(match.group(3))
+            target_left = int(match.group(4) or 1)
+            section = match.group(5).decode("utf-8", errors="replace").strip()
+            hunk_lines = [f"@@ {section} @@\n" if section else "@@\n"]
+        elif in_hunk and current is not None:
+            marker = raw_line[:1]
+            if marker == b"+":
+                if not current.skipped_reason:
+                    current.add_line(target_line)
+                target_line += 1
+                target_left -= 1
+            elif marker == b"-":
+                source_left -= 1
+            elif marker == b"\\":
+                pass
+            else:
+                target_line += 1
+                source_left -= 1
+                target_left -= 1
+            if hunk_lines is not None and not current.skipped_reason:
+                hunk_lines.append(raw_line.decode("utf-8", errors="replace") + "\n")
+        else:
+            source_left = target_left = 0
+
+        if current is not None and not current.skipped_reason:
+            current.size += line_size
+            if current.size > max_file_bytes:
+                current.skip(f"diff larger than {max_file_bytes} bytes")
+                hunk_lines = None
+                continue
+
+        if current is None or not current.skipped_reason:
+            if index.excerpt_size + line_size <= max_excerpt_bytes:
+                index.excerpt_parts.append(
+                    raw_line.decode("utf-8", errors="replace") + "\n"
+                )
+                index.excerpt_size += line_size
+            else:
+                index.excerpt_truncated = True
+
+    flush_hunk()
+    return index
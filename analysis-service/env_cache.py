@@ -0,0 +1,268 @@
+import os
+import sys
+import time
+import shutil
+import hashlib
+import threading
+import subprocess
+import contextlib
+from functools import partial
+import governor
+from governor import ResourceLimitExceeded, dir_size
+from repo_cache import file_lock
+
+SKIPPED_DIRS = {".git", "node_modules", ".venv", "venv", "__pycache__"}
+
+
+class EnvCache:
+    """
+    Content-addressed cache of dependency installs. Each distinct set of
+    requirements.txt files gets one virtualenv and each distinct
+    package.json/package-lock.json pair gets one node_modules tree, shared by
+    every job whose manifests hash the same. Entries are built under an
+    exclusive lock, used under a shared one, and evicted least-recently-used
+    once the cache exceeds max_bytes. A failed install is remembered for
+    failure_ttl seconds, during which jobs with the same manifests go without
+    instead of retrying it.
+    """
+
+    def __init__(self, root, max_bytes, failure_ttl=900):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.failure_ttl = failure_ttl
+        self.locks_dir = os.path.join(root, "locks")
+        self.counts = {
+            "python_hits": 0,
+            "python_misses": 0,
+            "node_hits": 0,
+            "node_misses": 0,
+        }
+        self._counts_lock = threading.Lock()
+
+    def _record(self, kind, hit):
+        with self._counts_lock:
+            self.counts[f"{kind}_{'hits' if hit else 'misses'}"] += 1
+            counts = dict(self.counts)
+        print(
+            f"Dependency cache {'hit' if hit else 'miss'} for {kind}. "
+            f"Totals: {counts[kind + '_hits']} hits, {counts[kind + '_misses']} misses."
+        )
+
+    def _lock(self, kind, key, **kwargs):
+        return file_lock(os.path.join(self.locks_dir, f"{kind}-{key}.lock"), **kwargs)
+
+    def _hash_files(self, repo_path, relative_paths):
+        digest = hashlib.sha256()
+        for relative_path in relative_paths:
+            digest.update(relative_path.encode() + b"\0")
+            with open(os.path.join(repo_path, relative_path), "rb") as f:
+                digest.update(f.read())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _is_ready(self, entry_path):
+        return os.path.exists(os.path.join(entry_path, ".ready"))
+
+    def _mark_ready(self, entry_path):
+        with open(os.path.join(entry_path, ".ready"), "w"):
+            pass
+
+    def _touch(self, entry_path):
+        os.utime(os.path.join(entry_path, ".ready"))
+
+    def _mark_failed(self, entry_path):
+        shutil.rmtree(entry_path, ignore_errors=True)
+        os.makedirs(entry_path, exist_ok=True)
+        with open(os.path.join(entry_path, ".failed"), "w"):
+            pass
+
+    def _failed_recently(self, entry_path):
+        try:
+            failed_at = os.path.getmtime(os.path.join(entry_path, ".failed"))
+        except OSError:
+            return False
+        return time.time() - failed_at < self.failure_ttl
+
+    @contextlib.contextmanager
+    def _use_entry(self, kind, key, entry_path, build):
+        """
+        Holds a shared lock on an entry for the duration of the block and
+        yields whether it is ready. A hit only ever takes the shared lock, so
+        jobs using the same entry never wait for each other; a miss builds
+        it under the exclusive lock first, re-checking once it has the lock
+        in case another job built it meanwhile. An entry whose build failed
+        within failure_ttl is not built again.
+        """
+        with self._lock(kind, key, shared=True):
+            if self._is_ready(entry_path):
+                self._record(kind, hit=True)
+                self._touch(entry_path)
+                yield True
+                return
+            if self._failed_recently(entry_path):
+                print(f"Installing {kind} dependencies failed recently. Skipping.")
+                yield False
+                return
+
+        with self._lock(kind, key):
+            if self._is_ready(entry_path):
+                self._record(kind, hit=True)
+            elif self._failed_recently(entry_path):
+                print(f"Installing {kind} dependencies failed recently. Skipping.")
+            else:
+                self._record(kind, hit=False)
+                build()
+
+        with self._lock(kind, key, shared=True):
+            ready = self._is_ready(entry_path)
+            if ready:
+                self._touch(entry_path)
+            yield ready
+
+    def find_requirements(self, repo_path):
+        """Returns the repo-relative paths of every requirements.txt, sorted."""
+        found = []
+        for root, dirs, files in os.walk(repo_path):
+            dirs[:] = [d for d in dirs if d not in SKIPPED_DIRS]
+            if "requirements.txt" in files:
+                found.append(
+                    os.path.relpath(os.path.join(root, "requirements.txt"), repo_path)
+                )
+        return sorted(found)
+
+    @contextlib.contextmanager
+    def python_env(self, repo_path):
+        """
+        Yields the interpreter of a virtualenv with every requirements.txt of
+        the repository installed, or None if there are none or installing
+        failed.
+        """
+        print("Searching for Python dependencies...")
+        requirements = self.find_requirements(repo_path)
+        if not requirements:
+            print("No requirements.txt found anywhere in the repository.")
+            yield None
+            return
+
+        key = self._hash_files(repo_path, requirements)
+        env_path = os.path.join(self.root, "python", key)
+
+        build = partial(self._build_python_env, repo_path, requirements, env_path)
+        with self._use_entry("python", key, env_path, build) as ready:
+            yield os.path.join(env_path, "bin", "python") if ready else None
+
+        self.evict()
+
+    def _build_python_env(self, repo_path, requirements, env_path):
+        shutil.rmtree(env_path, ignore_errors=True)
+        governor.run(
+            [sys.executable, "-m", "venv", env_path],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        pip = os.path.join(env_path, "bin", "pip")
+        for relative_path in requirements:
+            requirements_file = os.path.join(repo_path, relative_path)
+            print(f"Found dependencies file: {requirements_file}. Installing...")
+            try:
+                governor.run(
+                    [pip, "install", "-r", requirements_file],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                    disk_path=env_path,
+                )
+                print(f"Successfully installed dependencies from {requirements_file}.")
+            except (subprocess.CalledProcessError, ResourceLimitExceeded) as e:
+                print(
+                    f"Failed to install dependencies from {requirements_file}: {e.stderr}"
+                )
+                self._mark_failed(env_path)
+                return
+        self._mark_ready(env_path)
+
+    def install_node_modules(self, repo_path):
+        """
+        Materializes a cached node_modules tree for the repository's root
+        package.json into the worktree, building it on a miss. The tree is
+        copied, as reflinks where the filesystem supports them: hardlinks
+        would let a job change the cached files other jobs use.
+        """
+        print("Checking for Node.js dependencies...")
+        manifests = [
+            name
+            for name in ("package.json", "package-lock.json")
+            if os.path.exists(os.path.join(repo_path, name))
+        ]
+        if "package.json" not in manifests:
+            print("No package.json found. Skipping npm install.")
+            return
+
+        key = self._hash_files(repo_path, manifests)
+        entry_path = os.path.join(self.root, "node", key)
+
+        build = partial(self._build_node_modules, repo_path, manifests, entry_path)
+        with self._use_entry("node", key, entry_path, build) as ready:
+            if not ready:
+                return
+            source = os.path.join(entry_path, "node_modules")
+            target = os.path.join(repo_path, "node_modules")
+            if not os.path.isdir(source):
+                print("Package has no dependencies to install.")
+                return
+            subprocess.run(["cp", "-a", "--reflink=auto", source, target], check=True)
+            print("Node dependencies installed from cache.")
+
+        self.evict()
+
+    def _build_node_modules(self, repo_path, manifests, entry_path):
+        print("Found package.json. Installing dependencies...")
+        shutil.rmtree(entry_path, ignore_errors=True)
+        os.makedirs(entry_path)
+        for name in manifests:
+            shutil.copy2(os.path.join(repo_path, name), entry_path)
+
+        if "package-lock.json" in manifests:
+            command = ["npm", "ci", "--ignore-scripts", "--legacy-peer-deps"]
+        else:
+            command = ["npm", "install", "--ignore-scripts", "--legacy-peer-deps"]
+        try:
+            governor.run(
+                command,
+                cwd=entry_path,
+                check=True,
+                capture_output=True,
+                text=True,
+                disk_path=entry_path,
+            )
+            self._mark_ready(entry_path)
+        except (subprocess.CalledProcessError, ResourceLimitExceeded) as e:
+            print(f"Failed to install Node dependencies: {e.stderr}")
+            self._mark_failed(entry_path)
+
+    def evict(self):
+        """Deletes least-recently-used entries until the cache fits in max_bytes."""
+        entries = []
+        for kind in ("python", "node"):
+            kind_dir = os.path.join(self.root, kind)
+            if not os.path.isdir(kind_dir):
+                continue
+            for key in os.listdir(kind_dir):
+                path = os.path.join(kind_dir, key)
+                try:
+                    last_used = os.path.getmtime(os.path.join(path, ".ready"))
+                except OSError:
+                    last_used = 0
+                entries.append((last_used, kind, key, path, dir_size(path)))
+
+        total = sum(entry[-1] for entry in entries)
+        for _, kind, key, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with self._lock(kind, key, blocking=False) as acquired:
+                if not acquired:
+                    continue
+                print(f"Evicting {kind} environment {key} ({size} bytes).")
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
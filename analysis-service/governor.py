@@ -0,0 +1,417 @@
+import os
+import time
+import signal
+import resource
+import threading
+import contextlib
+import contextvars
+import subprocess
+
+# Seconds between checks of a child's memory and, less often, its disk use.
+# Checks start FIRST_POLL_SECONDS apart and back off to POLL_SECONDS, so
+# short commands such as most git calls are not held up by the polling.
+FIRST_POLL_SECONDS = 0.002
+POLL_SECONDS = 0.1
+DISK_CHECK_SECONDS = 2.0
+
+
+class ResourceLimits:
+    """
+    Limits applied to every child process started through run(). None means
+    unlimited. memory_bytes caps the resident memory of the child and all of
+    its descendants, disk_bytes the size of the directory run() is told to
+    watch and of any single file the child writes.
+    """
+
+    __slots__ = ("timeout", "memory_bytes", "cpu_seconds", "disk_bytes")
+
+    def __init__(
+        self, timeout=None, memory_bytes=None, cpu_seconds=None, disk_bytes=None
+    ):
+        self.timeout = timeout
+        self.memory_bytes = memory_bytes
+        self.cpu_seconds = cpu_seconds
+        self.disk_bytes = disk_bytes
+
+
+limits = ResourceLimits()
+
+
+def configure(**kwargs):
+    """Sets the process-wide limits; pool workers forked later inherit them."""
+    global limits
+    limits = ResourceLimits(**kwargs)
+
+
+class ResourceLimitExceeded(subprocess.SubprocessError):
+    def __init__(self, command, limit, stdout=None, stderr=None):
+        self.command = command
+        self.limit = limit
+        self.stdout = stdout
+        self.stderr = stderr
+        super().__init__(f"{os.path.basename(command[0])} was killed: {limit}.")
+
+
+class JobUsage:
+    """Peak resource use of the child processes one job started."""
+
+    def __init__(self):
+        self.peak_rss_bytes = 0
+        self.cpu_seconds = 0.0
+        self.peak_disk_bytes = 0
+        self.processes = 0
+        self.limits_hit = 0
+        self.lock = threading.Lock()
+
+    def add(self, usage):
+        with self.lock:
+            self.peak_rss_bytes = max(self.peak_rss_bytes, usage["peak_rss_bytes"])
+            self.cpu_seconds += usage["cpu_seconds"]
+            self.peak_disk_bytes = max(self.peak_disk_bytes, usage["peak_disk_bytes"])
+            self.processes += usage["processes"]
+            self.limits_hit += usage["limits_hit"]
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "peak_rss_bytes": self.peak_rss_bytes,
+                "cpu_seconds": round(self.cpu_seconds, 3),
+                "peak_disk_bytes": self.peak_disk_bytes,
+                "processes": self.processes,
+                "limits_hit": self.limits_hit,
+            }
+
+
+job_usage_var = contextvars.ContextVar("job_usage", default=None)
+
+
+@contextlib.contextmanager
+def track_job():
+    """Collects the usage of every child process run() starts in this context."""
+    usage = JobUsage()
+    token = job_usage_var.set(usage)
+    try:
+        yield usage
+    finally:
+        job_usage_var.reset(token)
+
+
+def record(usage):
+    """Adds usage measured elsewhere, e.g. in a pool worker, to the current job."""
+    job = job_usage_var.get()
+    if job is not None:
+        job.add(usage)
+
+
+def call_tracked(func, *args):
+    """
+    Runs func in a pool worker and returns its result with the usage of the
+    child processes it started, for the job thread to record().
+    """
+    with track_job() as usage:
+        result = func(*args)
+    return result, usage.as_dict()
+
+
+def process_tree_rss(pid):
+    """Returns the resident memory in bytes of a process and its descendants."""
+    total = 0
+    pending = [pid]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            with open(f"/proc/{pid}/task/{pid}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def dir_size(path):
+    """Returns the total size in bytes of all files below a directory."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _set_rlimits(pid):
+    # Applied right after the child starts rather than in a preexec_fn,
+    # which is unsafe in a threaded process. Node reserves far more address
+    # space than it uses, so memory is policed by the watchdog instead of
+    # RLIMIT_AS.
+    try:
+        if limits.cpu_seconds:
+            cpu = int(limits.cpu_seconds)
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu, cpu + 5))
+        if limits.disk_bytes:
+            size = int(limits.disk_bytes)
+            resource.prlimit(pid, resource.RLIMIT_FSIZE, (size, size))
+    except ProcessLookupError:
+        pass
+
+
+def _read_pipe(pipe, outputs, name):
+    with pipe:
+        outputs[name] = pipe.read()
+
+
+def run(
+    command,
+    cwd=None,
+    env=None,
+    check=False,
+    capture_output=False,
+    text=False,
+    timeout=None,
+    disk_path=None,
+    stdin=None,
+):
+    """
+    subprocess.run() under the configured limits. The child gets its own
+    process group, which is killed as a whole if it runs past the timeout,
+    uses more than memory_bytes, or grows disk_path by more than disk_bytes;
+    that raises ResourceLimitExceeded. The child's peak RSS, CPU time and
+    disk growth are added to the current job's usage.
+    """
+    timeout = timeout or limits.timeout
+    pipe = subprocess.PIPE if capture_output else None
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        env=env,
+        stdin=stdin,
+        stdout=pipe,
+        stderr=pipe,
+        text=text,
+        start_new_session=True,
+    )
+    _set_rlimits(process.pid)
+
+    outputs = {"stdout": None, "stderr": None}
+    readers = [
+        threading.Thread(target=_read_pipe, args=(stream, outputs, name), daemon=True)
+        for name, stream in (("stdout", process.stdout), ("stderr", process.stderr))
+        if stream is not None
+    ]
+    for reader in readers:
+        reader.start()
+
+    started = time.monotonic()
+    next_disk_check = started + DISK_CHECK_SECONDS
+    # Only what the child adds counts, not what disk_path already held.
+    disk_baseline = dir_size(disk_path) if disk_path and limits.disk_bytes else 0
+    peak_disk = 0
+    exceeded = None
+    delay = FIRST_POLL_SECONDS
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        now = time.monotonic()
+        if timeout and now - started > timeout:
+            exceeded = f"ran longer than {timeout}s"
+        elif (
+            limits.memory_bytes and process_tree_rss(process.pid) > limits.memory_bytes
+        ):
+            exceeded = f"used more than {limits.memory_bytes >> 20} MiB of memory"
+        elif disk_path and limits.disk_bytes and now >= next_disk_check:
+            next_disk_check = now + DISK_CHECK_SECONDS
+            peak_disk = max(peak_disk, dir_size(disk_path) - disk_baseline)
+            if peak_disk > limits.disk_bytes:
+                exceeded = f"wrote more than {limits.disk_bytes >> 20} MiB to disk"
+        if exceeded:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+            _, status, rusage = os.wait4(process.pid, 0)
+            break
+        time.sleep(delay)
+        delay = min(POLL_SECONDS, delay * 2)
+
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode == -signal.SIGXCPU:
+        exceeded = f"used more than {limits.cpu_seconds}s of CPU time"
+    elif process.returncode == -signal.SIGXFSZ:
+        exceeded = f"wrote a file larger than {limits.disk_bytes >> 20} MiB"
+    if exceeded:
+        # Descendants still holding the output pipes open would keep the
+        # readers waiting.
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGKILL)
+    for reader in readers:
+        reader.join()
+
+    record(
+        {
+            # ru_maxrss is in KiB and covers the child's waited-for descendants.
+            "peak_rss_bytes": rusage.ru_maxrss * 1024,
+            "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+            "peak_disk_bytes": peak_disk,
+            "processes": 1,
+            "limits_hit": int(exceeded is not None),
+        }
+    )
+    if exceeded:
+        raise ResourceLimitExceeded(
+            command, exceeded, outputs["stdout"], outputs["stderr"]
+        )
+    completed = subprocess.CompletedProcess(
+        command, process.returncode, outputs["stdout"], outputs["stderr"]
+    )
+    if check:
+        completed.check_returncode()
+    return completed
+
+
+@contextlib.contextmanager
+def watch(process):
+    """
+    Polices a long-lived child, such as an analyzer daemon, while it works
+    for the current job: its process group is killed once it uses more than
+    memory_bytes, which raises ResourceLimitExceeded when the block exits.
+    Its peak RSS and the CPU time it spent in the block are added to the
+    job's usage.
+    """
+    done = threading.Event()
+    state = {"peak_rss": 0, "exceeded": None}
+
+    def poll():
+        while not done.wait(POLL_SECONDS):
+            rss = process_tree_rss(process.pid)
+            state["peak_rss"] = max(state["peak_rss"], rss)
+            if limits.memory_bytes and rss > limits.memory_bytes:
+                state["exceeded"] = (
+                    f"used more than {limits.memory_bytes >> 20} MiB of memory"
+                )
+                with contextlib.suppress(ProcessLookupError):
+                    os.killpg(process.pid, signal.SIGKILL)
+                return
+
+    cpu_before = _cpu_seconds(process.pid)
+    watchdog = threading.Thread(target=poll, daemon=True)
+    watchdog.start()
+    try:
+        yield
+    except Exception as e:
+        if state["exceeded"] is None:
+            raise
+        raise ResourceLimitExceeded(process.args, state["exceeded"]) from e
+    finally:
+        done.set()
+        watchdog.join()
+        record(
+            {
+                "peak_rss_bytes": state["peak_rss"],
+                "cpu_seconds": max(0.0, _cpu_seconds(process.pid) - cpu_before),
+                "peak_disk_bytes": 0,
+                "processes": 1,
+                "limits_hit": int(state["exceeded"] is not None),
+            }
+        )
+    if state["exceeded"] is not None:
+        raise ResourceLimitExceeded(process.args, state["exceeded"])
+
+
+def _cpu_seconds(pid):
+    """Returns the user and system CPU time a running process has used so far."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces; the fields after it do not.
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def memory_pressure():
+    """
+    Returns the share of the last 10s in which some tasks stalled on memory
+    (PSI "some avg10", in percent), for this container's cgroup when it has
+    one, else for the host; 0 where PSI is unavailable.
+    """
+    for path in ("/sys/fs/cgroup/memory.pressure", "/proc/pressure/memory"):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith("some"):
+                        fields = dict(item.split("=") for item in line.split()[1:])
+                        return float(fields["avg10"])
+        except (OSError, ValueError, KeyError):
+            continue
+    return 0.0
+
+
+def memory_available():
+    """
+    Returns the fraction of memory still available: against the cgroup's
+    memory.max when the container has a limit (reclaimable page cache
+    counted as available), else MemAvailable of /proc/meminfo.
+    """
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            maximum = f.read().strip()
+        if maximum != "max":
+            with open("/sys/fs/cgroup/memory.current") as f:
+                current = int(f.read())
+            inactive_file = 0
+            with open("/sys/fs/cgroup/memory.stat") as f:
+                for line in f:
+                    if line.startswith("inactive_file "):
+                        inactive_file = int(line.split()[1])
+                        break
+            return max(0.0, 1 - (current - inactive_file) / int(maximum))
+    except (OSError, ValueError):
+        pass
+
+    meminfo = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                name, value = line.split(":", 1)
+                meminfo[name] = int(value.split()[0])
+        return meminfo["MemAvailable"] / meminfo["MemTotal"]
+    except (OSError, ValueError, KeyError, ZeroDivisionError):
+        return 1.0
+
+
+class AdaptiveConcurrency:
+    """
+    The number of jobs the worker should run at once. Each update() lowers it
+    by one while memory is under pressure (PSI above high_pressure or less
+    than min_available left) and raises it by one, up to maximum, once
+    pressure has eased.
+    """
+
+    def __init__(
+        self, maximum, high_pressure=10.0, low_pressure=1.0, min_available=0.1
+    ):
+        self.maximum = maximum
+        self.high_pressure = high_pressure
+        self.low_pressure = low_pressure
+        self.min_available = min_available
+        self.limit = maximum
+
+    def update(self):
+        pressure = memory_pressure()
+        available = memory_available()
+        limit = self.limit
+        if pressure >= self.high_pressure or available < self.min_available:
+            limit = max(1, limit - 1)
+        elif pressure < self.low_pressure and available >= 2 * self.min_available:
+            limit = min(self.maximum, limit + 1)
+        if limit != self.limit:
+            print(
+                f"Memory pressure {pressure:.1f}%, {available:.0%} available: "
+                f"running up to {limit} jobs at once."
+            )
+            self.limit = limit
+        return limit
@@ -0,0 +1,453 @@
+import json
+import time
+import random
+from datetime import datetime, timezone
+
+# Lane and repository of a raw job, read by the scripts below. Jobs are
+# decoded but never re-encoded, so the stored JSON stays byte-identical.
+JOB_INFO_LUA = """
+local function job_info(job)
+    local ok, data = pcall(cjson.decode, job)
+    if not ok or type(data) ~= 'table' then
+        return 'webhook', '', nil
+    end
+    local payload = data['payload']
+    if type(payload) ~= 'table' then
+        payload = data
+    end
+    local repo = payload['repo_name']
+    if type(payload['repository']) == 'table' then
+        repo = payload['repository']['full_name']
+    end
+    if type(repo) ~= 'string' then
+        repo = ''
+    end
+    local lane = 'webhook'
+    if data['eventType'] == 'repository_analysis' then
+        lane = 'analysis'
+    elseif data['source'] == 'poll' then
+        lane = 'poll'
+    end
+    return lane, string.lower(repo), tonumber(data['enqueuedAt'])
+end
+"""
+
+# Atomically takes a job out of a worker's processing list and, only if it was
+# still there, releases its repository's concurrency slot and forwards it to
+# its next list or delay set. The LREM guard makes ack/retry/reap safe to race
+# between a worker and any number of reapers.
+MOVE_SCRIPT = (
+    JOB_INFO_LUA
+    + """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+local _, repo = job_info(ARGV[1])
+if redis.call('HINCRBY', KEYS[4], repo, -1) <= 0 then
+    redis.call('HDEL', KEYS[4], repo)
+end
+if ARGV[3] == 'lpush' then
+    redis.call('LPUSH', KEYS[3], ARGV[2])
+elseif ARGV[3] == 'rpush' then
+    redis.call('RPUSH', KEYS[3], ARGV[2])
+elseif ARGV[3] == 'zadd' then
+    redis.call('ZADD', KEYS[3], ARGV[4], ARGV[2])
+end
+return 1
+"""
+)
+
+# Routes newly pushed jobs from the main queue into per-lane, per-repository
+# lists, then claims one job for a worker: lanes are served by weighted
+# round-robin in priority order, repositories within a lane round-robin, and
+# repositories already running repo_cap jobs are passed over, as are jobs
+# requiring tools the worker lacks. The claimed job is leased in the same
+# step. Returns {job, lane} or nil.
+CLAIM_SCRIPT = (
+    JOB_INFO_LUA
+    + """
+local queue = ARGV[1]
+local now = tonumber(ARGV[2])
+local route_batch = tonumber(ARGV[4])
+local repo_cap = tonumber(ARGV[5])
+local running_key = queue .. ':running'
+local stats_key = queue .. ':lane_stats'
+local credits_key = queue .. ':lane_credits'
+local tools = {}
+for tool in string.gmatch(ARGV[6], '[^,]+') do
+    tools[tool] = true
+end
+local lanes, weights = {}, {}
+for i = 7, #ARGV, 2 do
+    lanes[#lanes + 1] = ARGV[i]
+    weights[ARGV[i]] = ARGV[i + 1]
+end
+
+for _ = 1, route_batch do
+    local job = redis.call('RPOP', KEYS[1])
+    if not job then
+        break
+    end
+    local lane, repo = job_info(job)
+    local repo_jobs = queue .. ':lane:' .. lane .. ':repo:' .. repo
+    if redis.call('RPUSH', repo_jobs, job) == 1 then
+        redis.call('RPUSH', queue .. ':lane:' .. lane .. ':repos', repo)
+    end
+    redis.call('HINCRBY', stats_key, lane .. ':depth', 1)
+end
+
+-- Whether this worker has every tool a rerouted job requires. The
+-- requirement lapses at requiresUntil so jobs cannot starve.
+local function capable(job)
+    local ok, data = pcall(cjson.decode, job)
+    if not ok or type(data) ~= 'table' or type(data['requires']) ~= 'table' then
+        return true
+    end
+    if (tonumber(data['requiresUntil']) or 0) < now then
+        return true
+    end
+    for _, tool in ipairs(data['requires']) do
+        if not tools[tool] then
+            return false
+        end
+    end
+    return true
+end
+
+local function pick(lane)
+    local ring = queue .. ':lane:' .. lane .. ':repos'
+    for _ = 1, redis.call('LLEN', ring) do
+        local repo = redis.call('LMOVE', ring, ring, 'LEFT', 'RIGHT')
+        local running = tonumber(redis.call('HGET', running_key, repo) or '0')
+        if repo_cap <= 0 or running < repo_cap then
+            local repo_jobs = queue .. ':lane:' .. lane .. ':repo:' .. repo
+            local job = redis.call('LINDEX', repo_jobs, 0)
+            if not job then
+                redis.call('LREM', ring, -1, repo)
+            elseif capable(job) then
+                redis.call('LPOP', repo_jobs)
+                if redis.call('LLEN', repo_jobs) == 0 then
+                    redis.call('LREM', ring, -1, repo)
+                end
+                return job, repo
+            end
+        end
+    end
+    return nil
+end
+
+for _ = 1, 2 do
+    for _, lane in ipairs(lanes) do
+        if tonumber(redis.call('HGET', credits_key, lane) or '0') > 0 then
+            local job, repo = pick(lane)
+            if job then
+                redis.call('HINCRBY', credits_key, lane, -1)
+                redis.call('LPUSH', KEYS[2], job)
+                redis.call('HSET', KEYS[3], job, ARGV[3])
+                redis.call('HINCRBY', running_key, repo, 1)
+                redis.call('HINCRBY', stats_key, lane .. ':depth', -1)
+                redis.call('HINCRBY', stats_key, lane .. ':claimed', 1)
+                local _, _, enqueued_at = job_info(job)
+                if enqueued_at then
+                    local wait = math.max(0, now - enqueued_at)
+                    redis.call('HINCRBY', stats_key, lane .. ':timed', 1)
+                    redis.call('HINCRBYFLOAT', stats_key, lane .. ':wait_seconds', wait)
+                    redis.call('HSET', stats_key, lane .. ':last_wait_seconds', wait)
+                end
+                return {job, lane}
+            end
+        end
+    end
+    for _, lane in ipairs(lanes) do
+        redis.call('HSET', credits_key, lane, weights[lane])
+    end
+end
+return nil
+"""
+)
+
+# Moves delayed jobs whose retry time has come back onto the main queue.
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+# Renews the leases of jobs still in a worker's processing list. A job acked
+# or reaped since the worker listed it is skipped, so its lease is not
+# recreated with nothing left to clear it.
+EXTEND_SCRIPT = """
+local renewed = 0
+for i = 2, #ARGV do
+    if redis.call('LPOS', KEYS[1], ARGV[i]) then
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[1])
+        renewed = renewed + 1
+    end
+end
+return renewed
+"""
+
+
+def decode_job(job_json):
+    """Returns a raw job as a dict, or None if it is not a JSON object."""
+    try:
+        job_data = json.loads(job_json)
+    except json.JSONDecodeError:
+        return None
+    return job_data if isinstance(job_data, dict) else None
+
+
+# Lanes in priority order with their share of claims while all are backlogged.
+DEFAULT_LANE_WEIGHTS = (("webhook", 6), ("poll", 3), ("analysis", 1))
+
+
+class ReliableQueue:
+    """
+    At-least-once consumer for a Redis list that producers LPUSH JSON jobs to.
+
+    Claiming routes pushed jobs into lanes (webhook PRs, polled PRs with
+    "source": "poll", and repository analyses) and per-repository lists, then
+    picks one by weighted round-robin over lanes and round-robin over
+    repositories, skipping repositories that already run repo_concurrency
+    jobs (0 means no cap) and jobs rerouted to workers with tools this one
+    lacks. The job moves into a per-worker processing list
+    with a lease in a per-worker hash. A job leaves the processing list only when it
+    is acked, scheduled for retry with exponential backoff, buried in the
+    dead-letter list, or returned to the queue by a reaper after its lease
+    expired (the worker died without renewing it).
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        name,
+        worker_id,
+        visibility_timeout=60,
+        max_attempts=5,
+        backoff_base=10,
+        backoff_max=900,
+        lane_weights=DEFAULT_LANE_WEIGHTS,
+        repo_concurrency=0,
+        route_batch=100,
+        tools=(),
+    ):
+        self.redis = redis_client
+        self.name = name
+        self.worker_id = worker_id
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lane_weights = lane_weights
+        self.repo_concurrency = repo_concurrency
+        self.route_batch = route_batch
+        self.tools = tools
+
+        self.processing = self.processing_key(worker_id)
+        self.leases = self.leases_key(worker_id)
+        self.delayed = f"{name}:delayed"
+        self.dead = f"{name}:dead"
+        self.running = f"{name}:running"
+        self.lane_stats_key = f"{name}:lane_stats"
+
+        self._move = redis_client.register_script(MOVE_SCRIPT)
+        self._claim = redis_client.register_script(CLAIM_SCRIPT)
+        self._promote = redis_client.register_script(PROMOTE_SCRIPT)
+        self._extend = redis_client.register_script(EXTEND_SCRIPT)
+
+    def processing_key(self, worker_id):
+        return f"{self.name}:processing:{worker_id}"
+
+    def leases_key(self, worker_id):
+        return f"{self.name}:leases:{worker_id}"
+
+    def claim(self, timeout=1):
+        """
+        Claims the next job, waiting up to timeout seconds for new pushes if
+        nothing can be claimed. Returns the raw job or None.
+        """
+        job_json = self._claim_once()
+        if job_json is None:
+            # Block until a job is pushed without consuming it: BLMOVE pops
+            # the oldest job and puts it back on the same end of the list.
+            if self.redis.blmove(self.name, self.name, timeout, "RIGHT", "RIGHT"):
+                job_json = self._claim_once()
+        return job_json
+
+    def _claim_once(self):
+        now = time.time()
+        args = [
+            self.name,
+            now,
+            now + self.visibility_timeout,
+            self.route_batch,
+            self.repo_concurrency,
+            ",".join(self.tools),
+        ]
+        for lane, weight in self.lane_weights:
+            args += [lane, weight]
+        claimed = self._claim(keys=[self.name, self.processing, self.leases], args=args)
+        if claimed is None:
+            return None
+        job_json, lane = claimed
+        print(f"Claimed a job from the {lane} lane.")
+        return job_json
+
+    def lane_stats(self):
+        """
+        Returns {lane: {depth, claimed, avg_wait_seconds, last_wait_seconds}}.
+        Wait times cover jobs whose producer stamped them with enqueuedAt.
+        """
+        raw = self.redis.hgetall(self.lane_stats_key)
+        stats = {}
+        for lane, _ in self.lane_weights:
+            timed = int(raw.get(f"{lane}:timed", 0))
+            wait_seconds = float(raw.get(f"{lane}:wait_seconds", 0))
+            stats[lane] = {
+                "depth": int(raw.get(f"{lane}:depth", 0)),
+                "claimed": int(raw.get(f"{lane}:claimed", 0)),
+                "avg_wait_seconds": wait_seconds / timed if timed else 0.0,
+                "last_wait_seconds": float(raw.get(f"{lane}:last_wait_seconds", 0)),
+            }
+        return stats
+
+    def extend(self, job_jsons):
+        """
+        Renews the leases of jobs this worker is still working on. Returns how
+        many were still in its processing list.
+        """
+        if not job_jsons:
+            return 0
+        deadline = time.time() + self.visibility_timeout
+        return self._extend(
+            keys=[self.processing, self.leases], args=[deadline, *job_jsons]
+        )
+
+    def ack(self, job_json):
+        """Marks a job as done."""
+        return self._move(
+            keys=[self.processing, self.leases, self.name, self.running],
+            args=[job_json, job_json, "ack"],
+        )
+
+    def requeue(self, job_json):
+        """Hands an unfinished job back to the consuming end of the queue."""
+        return self._move(
+            keys=[self.processing, self.leases, self.name, self.running],
+            args=[job_json, job_json, "rpush"],
+        )
+
+    def reroute(self, job_json, tools, timeout):
+        """
+        Hands a job back to the queue for a worker that has all of tools.
+        Any worker may claim it again after timeout seconds.
+        """
+        job_data = decode_job(job_json)
+        if job_data is None:
+            return self.bury(job_json, "job is not a JSON object")
+        job_data["requires"] = sorted(tools)
+        job_data["requiresUntil"] = time.time() + timeout
+        return self._move(
+            keys=[self.processing, self.leases, self.name, self.running],
+            args=[job_json, json.dumps(job_data), "rpush"],
+        )
+
+    def retry(self, job_json, error, worker_id=None):
+        """
+        Schedules a failed job for another attempt after an exponential,
+        jittered backoff, or buries it once it has used up max_attempts.
+        """
+        worker_id = worker_id or self.worker_id
+        processing = self.processing_key(worker_id)
+        leases = self.leases_key(worker_id)
+
+        job_data = decode_job(job_json)
+        if job_data is None:
+            return self.bury(job_json, error, worker_id)
+
+        try:
+            attempts = int(job_data.get("_attempts", 0)) + 1
+        except (TypeError, ValueError, OverflowError):
+            return self.bury(job_json, f"invalid attempt count: {error}", worker_id)
+        if attempts >= self.max_attempts:
+            return self.bury(job_json, error, worker_id)
+
+        job_data["_attempts"] = attempts
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        retry_at = time.time() + delay * random.uniform(0.5, 1.0)
+        print(
+            f"Retrying job (attempt {attempts + 1}) in {retry_at - time.time():.0f}s."
+        )
+        return self._move(
+            keys=[processing, leases, self.delayed, self.running],
+            args=[job_json, json.dumps(job_data), "zadd", retry_at],
+        )
+
+    def bury(self, job_json, error, worker_id=None):
+        """Moves a poison job to the dead-letter list."""
+        worker_id = worker_id or self.worker_id
+        dead_letter = json.dumps(
+            {
+                "job": job_json,
+                "error": str(error),
+                "worker_id": worker_id,
+                "failed_at": datetime.now(timezone.utc).isoformat(),
+            }
+        )
+        print(f"Moving job to dead-letter list {self.dead}: {error}")
+        return self._move(
+            keys=[
+                self.processing_key(worker_id),
+                self.leases_key(worker_id),
+                self.dead,
+                self.running,
+            ],
+            args=[job_json, dead_letter, "lpush"],
+        )
+
+    def promote_due(self, batch_size=100):
+        """Moves delayed retries that are due back onto the main queue."""
+        return self._promote(
+            keys=[self.delayed, self.name], args=[time.time(), batch_size]
+        )
+
+    def reap_expired(self):
+        """
+        Scans every worker's processing list and retries jobs whose lease has
+        expired. Jobs without a lease (claimed but not yet leased, or leased by
+        a worker that crashed in between) are given one visibility timeout of
+        grace first.
+        """
+        now = time.time()
+        reaped = 0
+        prefix = self.processing_key("")
+        for processing in self.redis.scan_iter(match=f"{prefix}*"):
+            worker_id = processing[len(prefix) :]
+            leases = self.leases_key(worker_id)
+            for job_json in self.redis.lrange(processing, 0, -1):
+                deadline = self.redis.hget(leases, job_json)
+                if deadline is None:
+                    self.redis.hsetnx(leases, job_json, now + self.visibility_timeout)
+                    continue
+                if float(deadline) < now:
+                    print(f"Lease expired for a job held by worker {worker_id}.")
+                    reaped += self.retry(
+                        job_json, "visibility timeout expired", worker_id
+                    )
+        return reaped
+
+
+class PoisonJob(Exception):
+    """Raised for jobs that can never succeed; they skip retries and go to the dead-letter list."""
+
+
+class Reroute(Exception):
+    """Raised for jobs that need tools this worker lacks but another one has."""
+
+    def __init__(self, tools):
+        super().__init__(f"needs {', '.join(tools)}")
+        self.tools = tools
@@ -0,0 +1,292 @@
+import os
+import json
+import subprocess
+import glob
+import re
+from functools import partial
+import governor
+from governor import ResourceLimitExceeded
+
+PYTHON_EXTENSIONS = (".py", ".pyi")
+C_EXTENSIONS = (".c", ".cpp", ".h", ".hpp")
+JS_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx")
+SHELL_EXTENSIONS = (".sh", ".bash")
+COMPILE_COMMANDS_DIRS = (".", "build", "out", "cmake-build-debug")
+
+
+class PartialDiagnostics(list):
+    """Diagnostics of a run the tool failed on for some files, listed in failed."""
+
+    def __init__(self, diagnostics, failed):
+        super().__init__(diagnostics)
+        self.failed = failed
+
+
+def run_pyright_analysis(repo_path, python_path=None, files=None):
+    """
+    Executes the Pyright language server on the given path, resolving imports
+    against python_path's environment when one is given. When files is given,
+    only those repo-relative files are checked; Pyright still resolves their
+    imports from the whole project. Returns None if Pyright itself failed.
+    """
+    if files is not None and not files:
+        print("No changed Python files to analyze.")
+        return []
+
+    print("Starting Pyright analysis...")
+    try:
+        if files is None:
+            command = ["pyright", "--outputjson", repo_path]
+        else:
+            command = ["pyright", "--outputjson"] + [
+                os.path.join(repo_path, f) for f in files
+            ]
+        if python_path:
+            command += ["--pythonpath", python_path]
+        result = governor.run(
+            command, cwd=repo_path, capture_output=True, text=True, disk_path=repo_path
+        )
+        # Pyright exits with 1 when it reports errors; anything higher is fatal.
+        if result.returncode > 1:
+            raise subprocess.CalledProcessError(
+                result.returncode, command, result.stdout, result.stderr
+            )
+
+        pyright_output = json.loads(result.stdout)
+        diagnostics = pyright_output.get("generalDiagnostics", [])
+
+        print(f"Pyright analysis complete. Found {len(diagnostics)} diagnostics.")
+        return diagnostics
+    except ResourceLimitExceeded as e:
+        print(f"Pyright execution failed: {e}")
+        return None
+    except subprocess.CalledProcessError as e:
+        print(f"Pyright execution failed: {e}")
+        print(f"Stderr: {e.stderr}")
+        return None
+    except json.JSONDecodeError:
+        print("Failed to parse Pyright JSON output.")
+        return None
+
+
+def parse_clang_tidy_output(output_text, repo_path):
+    """Parses the raw text output of clang-tidy into our standard diagnostic format."""
+    diagnostics = []
+    pattern = re.compile(r"(.+?):(\d+):(\d+):\s+(warning|error):\s+(.+?)\s+\[(.+?)\]")
+
+    for line in output_text.splitlines():
+        match = pattern.match(line)
+        if match:
+            file_path, line_num, _, severity, message, rule = match.groups()
+
+            diagnostics.append(
+                {
+                    "file": os.path.join(repo_path, file_path),
+                    "range": {"start": {"line": int(line_num) - 1, "character": 0}},
+                    "message": message.strip(),
+                    "severity": severity.upper(),
+                    "rule": rule.strip(),
+                }
+            )
+    return diagnostics
+
+
+def find_compile_commands(repo_path):
+    """Returns the directory holding compile_commands.json, if the repo has one."""
+    for directory in COMPILE_COMMANDS_DIRS:
+        build_path = os.path.join(repo_path, directory)
+        if os.path.exists(os.path.join(build_path, "compile_commands.json")):
+            return os.path.normpath(build_path)
+    return None
+
+
+def run_clang_tidy_on_file(repo_path, file_path, build_path=None):
+    """Runs clang-tidy on a single file."""
+    if build_path:
+        command = ["clang-tidy", "-p", build_path, file_path]
+    else:
+        # Without a compilation database, skip the lookup and use default flags.
+        command = ["clang-tidy", file_path, "--"]
+    try:
+        result = governor.run(
+            command, cwd=repo_path, capture_output=True, text=True, disk_path=repo_path
+        )
+        return parse_clang_tidy_output(result.stdout, repo_path)
+    except Exception as e:
+        print(f"Failed to run clang-tidy on {file_path}: {e}")
+        return None
+
+
+def run_clang_tidy_analysis(repo_path, files=None, map_func=map):
+    """
+    Runs clang-tidy on the given repo-relative files, or on every C/C++ file
+    in the project when files is None. Each file is a separate clang-tidy
+    invocation dispatched through map_func, so callers can fan them out over
+    a process pool. Files clang-tidy fails on are left out and listed in the
+    result's failed attribute; returns None if it failed on every file.
+    """
+    if files is None:
+        print("Starting clang-tidy analysis on the full project...")
+        search_path = os.path.join(repo_path, "**")
+        files_to_check = [
+            f
+            for ext in C_EXTENSIONS
+            for f in glob.glob(os.path.join(search_path, "*" + ext), recursive=True)
+        ]
+    else:
+        print("Starting clang-tidy analysis on changed files...")
+        files_to_check = [os.path.join(repo_path, f) for f in files]
+
+    if not files_to_check:
+        print("No C/C++ files found to analyze.")
+        return []
+
+    build_path = find_compile_commands(repo_path)
+    if build_path:
+        print(f"Using compilation database in {build_path}.")
+
+    print(f"Found {len(files_to_check)} C/C++ files to analyze.")
+    check_file = partial(run_clang_tidy_on_file, repo_path, build_path=build_path)
+    results = list(map_func(check_file, files_to_check))
+    failed = [
+        os.path.relpath(path, repo_path)
+        for path, result in zip(files_to_check, results)
+        if result is None
+    ]
+    if len(failed) == len(results):
+        return None
+    diagnostics = [diag for result in results if result is not None for diag in result]
+    print(f"Parsed {len(diagnostics)} total diagnostics from clang-tidy.")
+    if failed:
+        print(f"clang-tidy failed on {len(failed)} files: {', '.join(failed)}")
+        return PartialDiagnostics(diagnostics, failed)
+    return diagnostics
+
+
+def parse_eslint_output(json_output, repo_path):
+    """Parse ESLint JSON output info standard diagnostics."""
+    diagnostics = []
+    try:
+        results = json.loads(json_output)
+        for file_result in results:
+            file_path = file_result.get("filePath", "")
+            for message in file_result.get("messages", []):
+                line = message.get("line", 1)
+                diagnostics.append(
+                    {
+                        "file": file_path,
+                        "range": {
+                            "start": {
+                                "line": line - 1,
+                                "character": message.get("column", 1),
+                            },
+                            "end": {
+                                "line": (message.get("endLine") or line) - 1,
+                                "character": message.get("endColumn", 1),
+                            },
+                        },
+                        "message": message.get("message"),
+                        "severity": "ERROR"
+                        if message.get("severity") == 2
+                        else "WARNING",
+                        "rule": message.get("ruleId", "unknown"),
+                    }
+                )
+    except json.JSONDecodeError:
+        print("Failed to parse ESLint JSON.")
+    return diagnostics
+
+
+def run_eslint_analysis(repo_path, files=None):
+    """
+    Runs ESLint on the given repo-relative files, or the whole repository.
+    Returns None if ESLint itself failed.
+    """
+    if files is not None and not files:
+        print("No changed JavaScript/TypeScript files to analyze.")
+        return []
+
+    print("Starting ESLint analysis...")
+    try:
+        # "--" so a changed file named like an option is linted, not parsed.
+        command = ["npx", "eslint", "--format", "json", "--"]
+        command += files if files is not None else ["."]
+
+        result = governor.run(
+            command, cwd=repo_path, capture_output=True, text=True, disk_path=repo_path
+        )
+
+        if result.stdout:
+            print("ESLint analysis complete. Parsing output...")
+            return parse_eslint_output(result.stdout, repo_path)
+        else:
+            print(f"ESLint produced no output. Stderr: {result.stderr}")
+            return None
+
+    except Exception as e:
+        print(f"Failed to run ESLint: {e}")
+        return None
+
+
+def parse_shellcheck_output(json_output, repo_path):
+    """Parses ShellCheck's JSON output into standard diagnostics."""
+    diagnostics = []
+    try:
+        for comment in json.loads(json_output):
+            line = comment.get("line", 1)
+            diagnostics.append(
+                {
+                    "file": os.path.join(repo_path, comment.get("file", "")),
+                    "range": {
+                        "start": {
+                            "line": line - 1,
+                            "character": comment.get("column", 1),
+                        },
+                        "end": {
+                            "line": (comment.get("endLine") or line) - 1,
+                            "character": comment.get("endColumn", 1),
+                        },
+                    },
+                    "message": comment.get("message"),
+                    "severity": "ERROR"
+                    if comment.get("level") == "error"
+                    else "WARNING",
+                    "rule": f"SC{comment.get('code', 'unknown')}",
+                }
+            )
+    except json.JSONDecodeError:
+        print("Failed to parse ShellCheck JSON.")
+        return None
+    return diagnostics
+
+
+def run_shellcheck_analysis(repo_path, files=None):
+    """
+    Runs ShellCheck on the given repo-relative files, or on every shell script
+    in the repository. Returns None if ShellCheck itself failed.
+    """
+    if files is None:
+        files = [
+            os.path.relpath(f, repo_path)
+            for ext in SHELL_EXTENSIONS
+            for f in glob.glob(os.path.join(repo_path, "**", "*" + ext), recursive=True)
+        ]
+    if not files:
+        print("No changed shell scripts to analyze.")
+        return []
+
+    print("Starting ShellCheck analysis...")
+    command = ["shellcheck", "--format", "json", "--"] + files
+    try:
+        result = governor.run(command, cwd=repo_path, capture_output=True, text=True)
+    except (OSError, ResourceLimitExceeded) as e:
+        print(f"Failed to run ShellCheck: {e}")
+        return None
+    # ShellCheck exits with 1 when it reports issues; anything higher is fatal.
+    if result.returncode > 1:
+        print(f"ShellCheck execution failed. Stderr: {result.stderr}")
+        return None
+    diagnostics = parse_shellcheck_output(result.stdout, repo_path)
+    if diagnostics is not None:
+        print(f"ShellCheck analysis complete. Found {len(diagnostics)} diagnostics.")
+    return diagnostics
@@ -0,0 +1,261 @@
+import os
+import re
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import redis.asyncio as aioredis
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens, output_tokens):
+        self.text = text
+        self.usage_metadata = type(
+            "UsageMetadata",
+            (),
+            {
+                "prompt_token_count": prompt_tokens,
+                "candidates_token_count": output_tokens,
+            },
+        )()
+
+
+class FakeModel:
+    """
+    Offline stand-in for a Gemini model. Answers after `latency` seconds with
+    a deterministic reply derived from the prompt, and fails with a 429-like
+    error for `failure_rate` of the calls.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    async def generate_content_async(self, prompt):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            error = RuntimeError("Fake model is rate limited.")
+            error.code = 429
+            raise error
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        text = f"Thanks for the contribution! (fake review {digest})"
+        return FakeResponse(text, len(prompt) // 4, len(text) // 4)
+
+
+def create_model(backend, api_key=None):
+    """Builds the model client for LLM_BACKEND ("gemini" or "fake")."""
+    if backend == "fake":
+        return FakeModel(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", 0.5)),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", 0)),
+        )
+
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel("gemini-flash-latest")
+
+
+def normalize_prompt(prompt):
+    """Collapses whitespace so prompts differing only in indentation share a cache entry."""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+class TokenBucket:
+    """Async token bucket allowing `rate` calls per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LLMGateway:
+    """
+    Single entry point for LLM calls. Runs an asyncio loop on a background
+    thread so synchronous job threads can share one concurrency limit and
+    token bucket. Calls are retried with jittered exponential backoff on
+    429/5xx and timeouts, and responses are cached in Redis by the hash of
+    the normalized prompt so identical diffs and re-queued jobs are free.
+    """
+
+    def __init__(
+        self,
+        model,
+        redis_url,
+        concurrency=4,
+        requests_per_minute=60,
+        timeout=60,
+        max_retries=4,
+        backoff_base=1.0,
+        cache_ttl=7 * 24 * 3600,
+    ):
+        self.model = model
+        self.redis_url = redis_url
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.cache_ttl = cache_ttl
+
+        self.stats = {
+            "calls": 0,
+            "cache_hits": 0,
+            "retries": 0,
+            "failures": 0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "latency_seconds": 0.0,
+        }
+        self._loop = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="llm-gateway", daemon=True
+                ).start()
+                asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    async def _setup(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        rate = self.requests_per_minute / 60
+        self._bucket = TokenBucket(rate, capacity=max(1, self.concurrency))
+        self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+
+    def generate(self, prompt):
+        """Blocking wrapper around agenerate for use from job threads."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.agenerate(prompt), loop).result()
+
+    def generate_many(self, prompts, timeout=None):
+        """
+        Runs several prompts concurrently. Failed prompts yield their
+        exception; prompts still running after timeout seconds are cancelled
+        and yield asyncio.TimeoutError.
+        """
+        if not prompts:
+            return []
+        loop = self._ensure_loop()
+
+        async def gather():
+            tasks = [asyncio.ensure_future(self.agenerate(p)) for p in prompts]
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            return [
+                asyncio.TimeoutError()
+                if task in pending
+                else task.exception() or task.result()
+                for task in tasks
+            ]
+
+        return asyncio.run_coroutine_threadsafe(gather(), loop).result()
+
+    def is_cached(self, prompts):
+        """Tells for each prompt whether its response is already cached."""
+        if not prompts:
+            return []
+        loop = self._ensure_loop()
+
+        async def check():
+            try:
+                values = await self._redis.mget([self._cache_key(p) for p in prompts])
+            except Exception as e:
+                print(f"LLM cache lookup failed: {e}")
+                return [False] * len(prompts)
+            return [value is not None for value in values]
+
+        return asyncio.run_coroutine_threadsafe(check(), loop).result()
+
+    def _cache_key(self, prompt):
+        digest = hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+        return "llm_cache:" + digest
+
+    async def agenerate(self, prompt):
+        """Returns the model's text for prompt, from cache when possible."""
+        cache_key = self._cache_key(prompt)
+
+        try:
+            cached = await self._redis.get(cache_key)
+        except Exception as e:
+            print(f"LLM cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            print("LLM response served from cache.")
+            return cached
+
+        text = await self._call_with_retries(prompt)
+
+        try:
+            await self._redis.set(cache_key, text, ex=self.cache_ttl)
+        except Exception as e:
+            print(f"LLM cache store failed: {e}")
+        return text
+
+    def _is_retryable(self, error):
+        if isinstance(error, asyncio.TimeoutError):
+            return True
+        return getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+
+    async def _call_with_retries(self, prompt):
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self._bucket.acquire()
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(prompt), self.timeout
+                    )
+                    text = response.text
+                except Exception as e:
+                    if attempt == self.max_retries or not self._is_retryable(e):
+                        self.stats["failures"] += 1
+                        raise
+                    error = e
+                else:
+                    self._record(response, time.perf_counter() - started)
+                    return text
+
+            self.stats["retries"] += 1
+            delay = random.uniform(0, self.backoff_base * 2**attempt)
+            print(f"LLM call failed ({error}). Retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+    def _record(self, response, latency):
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+
+        self.stats["calls"] += 1
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["output_tokens"] += output_tokens
+        self.stats["latency_seconds"] += latency
+        print(
+            f"LLM call took {latency:.2f}s "
+            f"({prompt_tokens} prompt tokens, {output_tokens} output tokens)."
+        )
@@ -0,0 +1,148 @@
+import time
+import threading
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from telemetry import span
+
+
+class StageTimeout(Exception):
+    pass
+
+
+class StageSkipped(Exception):
+    """Raised by a stage to end early without failing the job."""
+
+
+class Stage:
+    __slots__ = ("name", "func", "deps", "timeout")
+
+    def __init__(self, name, func, deps, timeout):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+
+
+class Pipeline:
+    """
+    Runs the stages of one job as a DAG on a thread pool. A stage starts as
+    soon as every stage it depends on has finished and is called with their
+    results as keyword arguments, so stages that do not depend on each other
+    overlap.
+
+    A stage that raises or outlives its timeout fails and every stage that
+    depends on it is skipped; independent stages still run. run() then
+    re-raises the first failure so callers see the original exception (for
+    example a PoisonJob). A stage that raises StageSkipped skips its
+    dependents without failing. Threads cannot be interrupted, so a
+    timed-out stage keeps running in the background and its result is
+    discarded.
+    """
+
+    def __init__(self, name, default_timeout=None, timeouts=None):
+        self.name = name
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self.stages = {}
+        self.resources = contextlib.ExitStack()
+        self.resources_lock = threading.Lock()
+        self.closed = False
+
+    def add(self, name, func, deps=(), timeout=None):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}.")
+        timeout = timeout or self.timeouts.get(name) or self.default_timeout
+        self.stages[name] = Stage(name, func, deps, timeout)
+
+    def enter_context(self, context_manager):
+        """
+        Enters context_manager from within a stage and keeps it open until
+        the whole pipeline has finished, e.g. a checkout used by later stages.
+        """
+        stack = contextlib.ExitStack()
+        value = stack.enter_context(context_manager)
+        with self.resources_lock:
+            if not self.closed:
+                self.resources.push(stack)
+                return value
+        # The pipeline gave up on this stage while it was still entering.
+        stack.close()
+        raise StageTimeout("Pipeline finished before the stage did.")
+
+    def _run_stage(self, stage, kwargs):
+        with span(stage.name):
+            try:
+                return stage.func(**kwargs)
+            except StageSkipped as e:
+                return e
+
+    def run(self):
+        """Runs every stage and returns {stage name: result}."""
+        results, failures = {}, []
+        stopped = set()
+        pending = dict(self.stages)
+        running = {}
+        pool = ThreadPoolExecutor(
+            max_workers=len(self.stages) or 1, thread_name_prefix=self.name
+        )
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    blocked = [dep for dep in stage.deps if dep in stopped]
+                    if blocked:
+                        print(f"Skipping stage {name}: {blocked[0]} did not finish.")
+                        stopped.add(name)
+                        del pending[name]
+                    elif all(dep in results for dep in stage.deps):
+                        # Stages inherit the job's context, e.g. its log job ID.
+                        future = pool.submit(
+                            contextvars.copy_context().run,
+                            self._run_stage,
+                            stage,
+                            {dep: results[dep] for dep in stage.deps},
+                        )
+                        deadline = stage.timeout and time.monotonic() + stage.timeout
+                        running[future] = (name, deadline)
+                        del pending[name]
+                if not running:
+                    continue
+
+                deadlines = [deadline for _, deadline in running.values() if deadline]
+                timeout = (
+                    max(0, min(deadlines) - time.monotonic()) if deadlines else None
+                )
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, _ = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failures.append(e)
+                        stopped.add(name)
+                        continue
+                    if isinstance(result, StageSkipped):
+                        print(f"Stage {name} ended early: {result}")
+                        stopped.add(name)
+                    else:
+                        results[name] = result
+
+                now = time.monotonic()
+                for future, (name, deadline) in list(running.items()):
+                    if deadline and now >= deadline:
+                        del running[future]
+                        future.cancel()
+                        message = f"Stage {name} timed out after {self.stages[name].timeout}s."
+                        print(message)
+                        failures.append(StageTimeout(message))
+                        stopped.add(name)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            with self.resources_lock:
+                self.closed = True
+            self.resources.close()
+
+        if failures:
+            raise failures[0]
+        return results
@@ -0,0 +1,57 @@
+def head_key(repo_full_name, pr_number):
+    return f"pr_dedup:head:{repo_full_name.lower()}:{pr_number}"
+
+
+def done_key(repo_full_name, pr_number, sha):
+    return f"pr_dedup:done:{repo_full_name.lower()}:{pr_number}:{sha}"
+
+
+def job_identity(payload):
+    """Returns (repository, PR number, head SHA) of a PR job, or None if unknown."""
+    repo_full_name = payload.get("repository", {}).get("full_name")
+    pr_number = payload.get("number")
+    sha = payload.get("pull_request", {}).get("head", {}).get("sha")
+    if not all([repo_full_name, pr_number, sha]):
+        return None
+    return repo_full_name, pr_number, sha
+
+
+class PRDedup:
+    """
+    Consumer side of the PR idempotency layer. The producers (the webhook
+    handler and the poller) record each PR's latest head SHA when they queue
+    it; the worker drops jobs for a SHA that is no longer the head or that
+    was already reviewed, which catches duplicates re-entering the queue
+    through retries or producers that bypass the enqueue script. Jobs that
+    carry no head SHA are always processed.
+    """
+
+    def __init__(self, redis_client, ttl):
+        self.redis = redis_client
+        self.ttl = ttl
+
+    def skip_reason(self, payload):
+        identity = job_identity(payload)
+        if identity is None:
+            return None
+        repo_full_name, pr_number, sha = identity
+        head, done = self.redis.mget(
+            [head_key(repo_full_name, pr_number), done_key(*identity)]
+        )
+        if head and head != sha:
+            return f"commit {sha[:7]} was superseded by {head[:7]}"
+        if done:
+            return f"commit {sha[:7]} was already reviewed"
+        return None
+
+    def is_superseded(self, payload):
+        identity = job_identity(payload)
+        if identity is None:
+            return False
+        head = self.redis.get(head_key(identity[0], identity[1]))
+        return bool(head) and head != identity[2]
+
+    def mark_done(self, payload):
+        identity = job_identity(payload)
+        if identity is not None:
+            self.redis.set(done_key(*identity), "1", ex=self.ttl)
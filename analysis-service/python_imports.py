@@ -0,0 +1,107 @@
+import os
+import ast
+import hashlib
+import functools
+import git
+
+PYTHON_PATTERNS = ("*.py", "*.pyi")
+# Directories modules are imported relative to, besides the repository root.
+SOURCE_ROOTS = ("src/",)
+
+
+def module_names(path):
+    """Yields the dotted names a repo-relative Python file can be imported as."""
+    stem = os.path.splitext(path)[0]
+    if os.path.basename(stem) == "__init__":
+        stem = os.path.dirname(stem)
+    yield stem.replace("/", ".")
+    for root in SOURCE_ROOTS:
+        if stem.startswith(root):
+            yield stem[len(root) :].replace("/", ".")
+
+
+@functools.lru_cache(maxsize=4096)
+def imported_modules(blob, full_path, module, is_package):
+    """
+    Returns the absolute names of the modules a file imports, with every
+    parent package. Cached by blob SHA, as unchanged files parse the same.
+    """
+    try:
+        with open(full_path, "rb") as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        return ()
+
+    package = module if is_package else module.rpartition(".")[0]
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            targets = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                parts = package.split(".") if package else []
+                parts = parts[: len(parts) - (node.level - 1)]
+                base = ".".join(parts + ([base] if base else []))
+            # "from a import b" may import the submodule a.b.
+            targets = [base] + [
+                f"{base}.{alias.name}" if base else alias.name for alias in node.names
+            ]
+        else:
+            continue
+        for target in targets:
+            parts = target.split(".")
+            names.update(".".join(parts[:i]) for i in range(1, len(parts) + 1))
+    names.discard("")
+    return tuple(sorted(names))
+
+
+def python_dependency_keys(repo_path, blobs):
+    """
+    Maps each repo-relative path in blobs to a hash of its blob SHA and those
+    of every Python module in the repository it imports, directly or
+    through other modules. Pyright's results for a file change when any of
+    them does, but not when unrelated modules do.
+
+    Only imports resolved from the repository root or src/ are followed;
+    modules found through other search paths (extraPaths, editable installs)
+    or imported dynamically are treated like installed packages, so a change
+    to them alone does not invalidate the files using them.
+    """
+    output = git.Repo(repo_path).git.ls_files("-s", "-z", "--", *PYTHON_PATTERNS)
+    sources = {}
+    for entry in output.split("\0"):
+        if entry:
+            meta, path = entry.split("\t", 1)
+            sources[path] = meta.split()[1]
+
+    modules = {}
+    for path in sources:
+        for name in module_names(path):
+            modules.setdefault(name, []).append(path)
+
+    def imports(path):
+        name = next(module_names(path))
+        is_package = os.path.basename(os.path.splitext(path)[0]) == "__init__"
+        found = imported_modules(
+            sources[path], os.path.join(repo_path, path), name, is_package
+        )
+        for module in found:
+            yield from modules.get(module, ())
+
+    keys = {}
+    for path, blob in blobs.items():
+        if path not in sources:
+            keys[path] = blob
+            continue
+        seen, pending = {path}, [path]
+        while pending:
+            for dependency in imports(pending.pop()):
+                if dependency not in seen:
+                    seen.add(dependency)
+                    pending.append(dependency)
+        digest = hashlib.sha256(blob.encode())
+        for dependency in sorted(seen - {path}):
+            digest.update(f"\0{dependency}\0{sources[dependency]}".encode())
+        keys[path] = digest.hexdigest()
+    return keys
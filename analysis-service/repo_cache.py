@@ -0,0 +1,304 @@
+import os
+import uuid
+import fcntl
+import shutil
+import tempfile
+import contextlib
+import git
+import governor
+from governor import ResourceLimitExceeded, dir_size
+
+HEADS_REFSPEC = "+refs/heads/*:refs/heads/*"
+TAGS_REFSPEC = "+refs/tags/*:refs/tags/*"
+
+
+def run_git(args, cwd=None, disk_path=None, stdin=None):
+    """
+    Runs a git command under the governor's limits, disk_path being the
+    directory it writes to, and returns its output. stdin is an open file. Failures raise
+    git.GitCommandError, as GitPython's own commands do, which also keeps
+    credentials in clone URLs out of the message.
+    """
+    command = ["git", *args]
+    try:
+        result = governor.run(
+            command,
+            cwd=cwd,
+            env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+            capture_output=True,
+            text=True,
+            disk_path=disk_path,
+            stdin=stdin,
+        )
+    except ResourceLimitExceeded as e:
+        raise git.GitCommandError(command, e.limit) from e
+    if result.returncode:
+        raise git.GitCommandError(
+            command, result.returncode, result.stderr, result.stdout
+        )
+    return result.stdout.strip()
+
+
+@contextlib.contextmanager
+def file_lock(lock_path, blocking=True, shared=False):
+    """
+    Holds a flock on lock_path for the duration of the block, exclusive
+    unless shared=True. Yields False instead of blocking when blocking=False
+    and the lock is taken.
+    """
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class RepoCache:
+    """
+    Keeps one bare mirror per repository under <root>/mirrors and hands out
+    per-job `git worktree` checkouts from it. Mirrors are refreshed with an
+    incremental fetch, guarded by a per-repository file lock so concurrent
+    workers sharing the directory never fetch into the same mirror at once,
+    and evicted least-recently-used first once the cache exceeds max_bytes.
+    Clones, fetches and checkouts run under the governor's time, memory and
+    disk limits.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.mirrors_dir = os.path.join(root, "mirrors")
+        self.worktrees_dir = os.path.join(root, "worktrees")
+        self.locks_dir = os.path.join(root, "locks")
+
+    def _key(self, repo_name):
+        return repo_name.replace("/", "_")
+
+    def mirror_path(self, repo_name):
+        return os.path.join(self.mirrors_dir, self._key(repo_name) + ".git")
+
+    def lock(self, repo_name, blocking=True):
+        return file_lock(
+            os.path.join(self.locks_dir, self._key(repo_name) + ".lock"), blocking
+        )
+
+    def _use_lock_path(self, repo_key):
+        return os.path.join(self.locks_dir, repo_key + ".use.lock")
+
+    def sync(self, repo_name, auth_clone_url, extra_refspecs=()):
+        """
+        Creates the mirror on first use, otherwise fetches only what changed.
+        The authenticated URL is passed on every fetch and never stored in the
+        mirror's config. Must be called with the repository lock held.
+        """
+        path = self.mirror_path(repo_name)
+        if not os.path.exists(os.path.join(path, "HEAD")):
+            print(f"Creating bare mirror for {repo_name}...")
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            run_git(["clone", "--bare", auth_clone_url, path], disk_path=path)
+            run_git(["remote", "remove", "origin"], cwd=path)
+
+        print(f"Fetching updates into mirror of {repo_name}...")
+        run_git(
+            [
+                "fetch",
+                "--prune",
+                auth_clone_url,
+                HEADS_REFSPEC,
+                TAGS_REFSPEC,
+                *extra_refspecs,
+            ],
+            cwd=path,
+            disk_path=path,
+        )
+        self._prune_pull_refs(path, extra_refspecs)
+        return git.Repo(path)
+
+    def _prune_pull_refs(self, path, extra_refspecs):
+        """
+        Deletes the refs/pull/ refs earlier syncs fetched for their checkouts,
+        which would otherwise pile up, one per PR head ever reviewed. Those of
+        this sync are kept, so a re-push still fetches only the new commits.
+        """
+        fetched = {spec.split(":", 1)[-1] for spec in extra_refspecs}
+        refs = run_git(["for-each-ref", "--format=%(refname)", "refs/pull/"], cwd=path)
+        stale = [ref for ref in refs.splitlines() if ref not in fetched]
+        if not stale:
+            return
+        with tempfile.TemporaryFile("w+") as commands:
+            commands.writelines(f"delete {ref}\n" for ref in stale)
+            commands.seek(0)
+            run_git(["update-ref", "--stdin"], cwd=path, stdin=commands)
+
+    def _new_worktree_path(self, repo_name):
+        return os.path.join(self.worktrees_dir, self._key(repo_name), uuid.uuid4().hex)
+
+    @contextlib.contextmanager
+    def checkout(self, repo_name, auth_clone_url, ref="HEAD", extra_refspecs=()):
+        """
+        Yields the path of a fresh worktree of `ref`, detached, backed by the
+        shared mirror. The worktree is removed when the block exits.
+        """
+        worktree_path = self._new_worktree_path(repo_name)
+        with self.lock(repo_name):
+            mirror = self.sync(repo_name, auth_clone_url, extra_refspecs)
+            run_git(
+                ["worktree", "add", "--detach", worktree_path, ref],
+                cwd=mirror.git_dir,
+                disk_path=worktree_path,
+            )
+            self._touch(repo_name)
+
+        try:
+            yield worktree_path
+        finally:
+            self.remove_worktree(repo_name, worktree_path)
+            self.evict()
+
+    def add_worktree(self, repo_name, ref):
+        """
+        Adds a long-lived detached worktree of a commit already in the mirror,
+        without fetching, and returns its path. The caller removes it with
+        remove_worktree().
+        """
+        worktree_path = self._new_worktree_path(repo_name)
+        with self.lock(repo_name):
+            run_git(
+                ["worktree", "add", "--detach", worktree_path, ref],
+                cwd=self.mirror_path(repo_name),
+                disk_path=worktree_path,
+            )
+        return worktree_path
+
+    def move_worktree(self, repo_name, worktree_path, ref):
+        """
+        Checks a worktree out at another commit in place, rewriting only the
+        files that differ, and returns the (status, path) pairs that changed.
+        Ignored files and installed node_modules are kept.
+        """
+        with self.lock(repo_name):
+            worktree = git.Repo(worktree_path)
+            current = worktree.head.commit.hexsha
+            if current == ref:
+                return []
+            output = worktree.git.diff("--name-status", "--no-renames", current, ref)
+            run_git(
+                ["checkout", "--detach", "--force", ref],
+                cwd=worktree_path,
+                disk_path=worktree_path,
+            )
+            run_git(["clean", "-ffdq", "--exclude=node_modules"], cwd=worktree_path)
+            self._touch(repo_name)
+        return [tuple(line.split("\t", 1)) for line in output.splitlines()]
+
+    def remove_worktree(self, repo_name, worktree_path):
+        with self.lock(repo_name):
+            if not os.path.exists(self.mirror_path(repo_name)):
+                shutil.rmtree(worktree_path, ignore_errors=True)
+                return
+            mirror_path = self.mirror_path(repo_name)
+            try:
+                run_git(
+                    ["worktree", "remove", "--force", worktree_path], cwd=mirror_path
+                )
+            except git.GitCommandError as e:
+                print(f"Failed to remove worktree {worktree_path}: {e}")
+                shutil.rmtree(worktree_path, ignore_errors=True)
+                run_git(["worktree", "prune"], cwd=mirror_path)
+
+    @staticmethod
+    def remote_head(auth_clone_url):
+        """Returns the commit SHA the remote's HEAD points at, in one round trip."""
+        output = run_git(["ls-remote", auth_clone_url, "HEAD"])
+        return output.split()[0] if output else None
+
+    @contextlib.contextmanager
+    def snapshot(self, repo_name, auth_clone_url):
+        """
+        Yields (repository, commit SHA) for the default branch's head without
+        checking anything out. Uses the repository's mirror if it has one;
+        otherwise makes a throwaway blobless clone of just that commit, which
+        fetches the blobs it is asked for on demand.
+        """
+        if os.path.exists(os.path.join(self.mirror_path(repo_name), "HEAD")):
+            # Held shared while the mirror is read, so evict() leaves it be
+            # without keeping other jobs from syncing it meanwhile.
+            use_lock = self._use_lock_path(self._key(repo_name))
+            with file_lock(use_lock, shared=True):
+                with self.lock(repo_name):
+                    mirror = self.sync(repo_name, auth_clone_url)
+                    self._touch(repo_name)
+                yield mirror, mirror.git.rev_parse("HEAD")
+            return
+
+        snapshots_dir = os.path.join(self.root, "snapshots")
+        os.makedirs(snapshots_dir, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=snapshots_dir) as path:
+            print(f"Fetching a blobless snapshot of {repo_name}...")
+            run_git(
+                [
+                    "clone",
+                    "--bare",
+                    "--filter=blob:none",
+                    "--depth=1",
+                    auth_clone_url,
+                    path,
+                ],
+                disk_path=path,
+            )
+            repo = git.Repo(path)
+            yield repo, repo.git.rev_parse("HEAD")
+
+    def _touch(self, repo_name):
+        marker = os.path.join(self.mirror_path(repo_name), "last_used")
+        with open(marker, "a"):
+            os.utime(marker)
+
+    def _last_used(self, mirror_path):
+        try:
+            return os.path.getmtime(os.path.join(mirror_path, "last_used"))
+        except OSError:
+            return 0
+
+    def evict(self):
+        """Deletes least-recently-used mirrors until the cache fits in max_bytes."""
+        if not os.path.isdir(self.mirrors_dir):
+            return
+
+        mirrors = []
+        for name in os.listdir(self.mirrors_dir):
+            path = os.path.join(self.mirrors_dir, name)
+            mirrors.append((self._last_used(path), name, path, dir_size(path)))
+
+        total = sum(size for _, _, _, size in mirrors)
+        if total <= self.max_bytes:
+            return
+
+        for _, name, path, size in sorted(mirrors):
+            if total <= self.max_bytes:
+                break
+            repo_key = name[: -len(".git")]
+            lock_path = os.path.join(self.locks_dir, repo_key + ".lock")
+            use_lock = self._use_lock_path(repo_key)
+            with (
+                file_lock(lock_path, blocking=False) as acquired,
+                file_lock(use_lock, blocking=False) as unused,
+            ):
+                if not (acquired and unused):
+                    continue
+                active = os.path.join(path, "worktrees")
+                if os.path.isdir(active) and os.listdir(active):
+                    continue
+                print(f"Evicting mirror {name} ({size} bytes) from repo cache.")
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
@@ -0,0 +1,99 @@
+README_NAMES = ("README.md", "readme.md", "README.txt")
+
+
+def _ls_tree(repo, treeish, paths=()):
+    """Yields (type, sha, path) for the entries of one or more directories."""
+    output = repo.git.ls_tree("-z", treeish, "--", *paths)
+    for record in output.split("\0"):
+        if not record:
+            continue
+        meta, path = record.split("\t", 1)
+        _, kind, sha = meta.split()
+        yield kind, sha, path
+
+
+def tree_outline(repo, commit, root_name, depth=2, files_per_dir=10):
+    """
+    Lists the directories of a commit down to `depth` levels, with up to
+    `files_per_dir` files under each, read from tree objects alone. One
+    ls-tree call covers every directory of a level.
+    """
+    children = {"": ([], [])}
+    level = [""]
+    for _ in range(depth):
+        paths = [f"{path}/" for path in level if path]
+        next_level = []
+        for kind, _, path in _ls_tree(repo, commit, paths):
+            parent, _, name = path.rpartition("/")
+            subdirs, files = children[parent]
+            if kind == "tree":
+                subdirs.append(name)
+                children[path] = ([], [])
+                next_level.append(path)
+            elif kind == "blob":
+                files.append(name)
+        level = next_level
+        if not level:
+            break
+
+    lines = []
+
+    def walk(path, name, indent):
+        lines.append(f"{indent}{name}/")
+        subdirs, files = children[path]
+        for file_name in files[:files_per_dir]:
+            lines.append(f"{indent}    {file_name}")
+        for subdir in subdirs:
+            child = f"{path}/{subdir}" if path else subdir
+            if child in children and len(indent) // 4 + 1 < depth:
+                walk(child, subdir, indent + "    ")
+
+    walk("", root_name, "")
+    return "\n".join(lines)
+
+
+def read_readme(repo, commit, limit=5000):
+    """Returns the start of the commit's top-level README, reading only that blob."""
+    root_files = {
+        path: sha for kind, sha, path in _ls_tree(repo, commit) if kind == "blob"
+    }
+    for name in README_NAMES:
+        if name in root_files:
+            data = repo.git.cat_file("blob", root_files[name], stdout_as_string=False)
+            return data.decode(errors="ignore")[:limit]
+    return None
+
+
+class SummaryCache:
+    """
+    Redis cache of generated repository descriptions keyed by the root tree
+    SHA, so re-analyzing a repository whose files have not changed skips the
+    fetch and the LLM call. Commits are mapped to their trees as well, which
+    lets a lookup by the remote's head commit answer without fetching
+    anything.
+    """
+
+    def __init__(self, redis_client, ttl):
+        self.redis = redis_client
+        self.ttl = ttl
+
+    @staticmethod
+    def _tree_key(repo_name, tree_sha):
+        return f"summary_cache:tree:{repo_name.lower()}:{tree_sha}"
+
+    @staticmethod
+    def _commit_key(commit):
+        return f"summary_cache:commit:{commit}"
+
+    def for_commit(self, repo_name, commit):
+        tree_sha = self.redis.get(self._commit_key(commit))
+        return self.for_tree(repo_name, tree_sha) if tree_sha else None
+
+    def for_tree(self, repo_name, tree_sha):
+        return self.redis.get(self._tree_key(repo_name, tree_sha))
+
+    def store(self, repo_name, commit, tree_sha, description):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self._commit_key(commit), tree_sha, ex=self.ttl)
+        pipe.set(self._tree_key(repo_name, tree_sha), description, ex=self.ttl)
+        pipe.execute()
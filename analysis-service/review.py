@@ -0,0 +1,83 @@
+CHARS_PER_TOKEN = 4
+
+CHUNK_PROMPT = """
+You are an expert code reviewer looking at one part of a larger pull request.
+
+File: {path}
+--- CODE DIFF ---
+{hunks}
+--- END CODE DIFF ---
+
+List potential logic errors, unclear code, performance problems, or violations of best practices in these changes.
+Be concise: at most 5 short bullet points. If there is nothing worth mentioning, answer exactly "No issues."
+"""
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used for budgeting; close enough for English and code."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_into_chunks(file_hunks, max_chunk_tokens):
+    """
+    Packs consecutive hunks of each file into chunks of at most
+    max_chunk_tokens. A chunk never spans files; a single hunk larger than
+    the limit is truncated.
+    """
+    max_chars = max_chunk_tokens * CHARS_PER_TOKEN
+    chunks = []
+    for path, hunks in file_hunks:
+        current, current_tokens = [], 0
+        for hunk in hunks:
+            if len(hunk) > max_chars:
+                hunk = hunk[:max_chars] + "\n(hunk truncated due to length)\n"
+            tokens = estimate_tokens(hunk)
+            if current and current_tokens + tokens > max_chunk_tokens:
+                chunks.append({"path": path, "text": "".join(current)})
+                current, current_tokens = [], 0
+            current.append(hunk)
+            current_tokens += tokens
+        if current:
+            chunks.append({"path": path, "text": "".join(current)})
+    return chunks
+
+
+def review_chunks(llm, chunks, token_budget, deadline, priority_paths=()):
+    """
+    Map step of a large-PR review: asks the model about each chunk in
+    parallel. Chunks already answered for an earlier push come from the LLM
+    cache and cost nothing; the rest are admitted in order (files in
+    priority_paths first) until token_budget is spent. Chunks that do not
+    fit the budget or miss the deadline (seconds) are reported as skipped.
+
+    Returns ([(path, findings)], [skipped paths]).
+    """
+    chunks = sorted(chunks, key=lambda chunk: chunk["path"] not in priority_paths)
+    prompts = [
+        CHUNK_PROMPT.format(path=chunk["path"], hunks=chunk["text"]) for chunk in chunks
+    ]
+    cached = llm.is_cached(prompts)
+
+    selected, skipped, spent = [], [], 0
+    for chunk, prompt, hit in zip(chunks, prompts, cached):
+        cost = 0 if hit else estimate_tokens(prompt)
+        if spent + cost > token_budget:
+            skipped.append(chunk["path"])
+            continue
+        spent += cost
+        selected.append((chunk, prompt))
+
+    print(
+        f"Reviewing {len(selected)} of {len(chunks)} diff chunks "
+        f"({sum(cached)} cached, ~{spent} new prompt tokens)."
+    )
+    results = llm.generate_many([prompt for _, prompt in selected], timeout=deadline)
+
+    findings = []
+    for (chunk, _), result in zip(selected, results):
+        if isinstance(result, BaseException):
+            print(f"Chunk review of {chunk['path']} failed: {result!r}")
+            skipped.append(chunk["path"])
+        elif result.strip() != "No issues.":
+            findings.append((chunk["path"], result.strip()))
+    return findings, sorted(set(skipped))
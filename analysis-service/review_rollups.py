@@ -0,0 +1,108 @@
+import os
+import argparse
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+
+# Per user, repository and UTC day: review count, issues found and reviews
+# per language. The dashboard reads these instead of aggregating reviews.
+ROLLUPS_COLLECTION = "review_rollups"
+
+
+def rollup_key(review):
+    return {
+        "userId": review["userId"],
+        "repo_name": review["repo_name"],
+        "day": review["analyzed_at"].strftime("%Y-%m-%d"),
+    }
+
+
+def language_field(language):
+    # Field names cannot contain dots or start with $.
+    return (language or "unknown").replace(".", "_").lstrip("$")
+
+
+def rollup_updates(reviews):
+    """
+    $inc upserts that fold newly saved review documents into their rollups.
+    Pass only reviews the save actually created: the job queue delivers at
+    least once, and a review counted twice stays counted until the rollups
+    are rebuilt.
+    """
+    return [
+        UpdateOne(
+            rollup_key(review),
+            {
+                "$inc": {
+                    "reviews": 1,
+                    "issues_found": review["issues_found"],
+                    f"languages.{language_field(review['language'])}": 1,
+                }
+            },
+            upsert=True,
+        )
+        for review in reviews
+    ]
+
+
+def rebuild_rollups(db, user_id=None):
+    """
+    Regenerates the rollups, of one user or of everyone, from the reviews
+    collection. Reviews saved while it runs may be missed or counted twice,
+    so run it while the workers are stopped or again afterwards. Returns the
+    number of rollup documents written.
+    """
+    match = {} if user_id is None else {"userId": user_id}
+    grouped = db["reviews"].aggregate(
+        [
+            {"$match": match},
+            {
+                "$group": {
+                    "_id": {
+                        "userId": "$userId",
+                        "repo_name": "$repo_name",
+                        "day": {
+                            "$dateToString": {
+                                "format": "%Y-%m-%d",
+                                "date": "$analyzed_at",
+                            }
+                        },
+                        "language": "$language",
+                    },
+                    "reviews": {"$sum": 1},
+                    "issues_found": {"$sum": "$issues_found"},
+                }
+            },
+        ],
+        allowDiskUse=True,
+    )
+
+    rollups = {}
+    for row in grouped:
+        language = row["_id"].pop("language")
+        key = tuple(row["_id"].values())
+        rollup = rollups.setdefault(
+            key, {**row["_id"], "reviews": 0, "issues_found": 0, "languages": {}}
+        )
+        rollup["reviews"] += row["reviews"]
+        rollup["issues_found"] += row["issues_found"]
+        field = language_field(language)
+        rollup["languages"][field] = rollup["languages"].get(field, 0) + row["reviews"]
+
+    collection = db[ROLLUPS_COLLECTION]
+    collection.delete_many(match)
+    if rollups:
+        collection.insert_many(list(rollups.values()), ordered=False)
+    return len(rollups)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the dashboard's review rollups from the reviews."
+    )
+    parser.add_argument("--user", help="Only rebuild this user ID's rollups.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_ATLAS_URI"))["code-reviewer-ai-db"]
+    written = rebuild_rollups(db, args.user)
+    print(f"Rebuilt {written} review rollups.")
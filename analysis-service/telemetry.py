@@ -0,0 +1,252 @@
+import io
+import sys
+import json
+import time
+import hashlib
+import threading
+import contextlib
+import contextvars
+from datetime import datetime, timezone
+from prometheus_client import Counter, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+
+job_id_var = contextvars.ContextVar("job_id", default=None)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+STAGE_SECONDS = Histogram(
+    "analysis_stage_seconds",
+    "Time spent in each pipeline stage.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_FAILURES = Counter(
+    "analysis_stage_failures_total",
+    "Pipeline stages that raised, by stage.",
+    ["stage"],
+)
+JOBS = Counter(
+    "analysis_jobs_total",
+    "Jobs handled, by event type and outcome.",
+    ["event_type", "outcome"],
+)
+DIAGNOSTICS = Counter(
+    "analysis_diagnostics_total",
+    "Linter diagnostics found, and kept because they touch added lines.",
+    ["language", "kind"],
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "analysis_queue_wait_seconds",
+    "Time from enqueue to the start of processing.",
+    ["event_type"],
+    buckets=LATENCY_BUCKETS,
+)
+END_TO_END_SECONDS = Histogram(
+    "analysis_end_to_end_seconds",
+    "Time from enqueue to the end of processing.",
+    ["event_type", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+MEMORY_BUCKETS = tuple(mib * 1024**2 for mib in (64, 128, 256, 512, 1024, 2048, 4096))
+JOB_PEAK_RSS_BYTES = Histogram(
+    "analysis_job_peak_rss_bytes",
+    "Largest resident memory of any child process a job started.",
+    ["event_type"],
+    buckets=MEMORY_BUCKETS,
+)
+JOB_CPU_SECONDS = Histogram(
+    "analysis_job_cpu_seconds",
+    "CPU time used by the child processes of a job.",
+    ["event_type"],
+    buckets=LATENCY_BUCKETS,
+)
+CHILD_LIMITS_HIT = Counter(
+    "analysis_child_limits_hit_total",
+    "Child processes killed for exceeding a resource limit.",
+    ["event_type"],
+)
+
+
+def job_id_for(job_data):
+    """Returns a short ID for a job that stays the same across retries and reroutes."""
+    stable = {
+        key: value
+        for key, value in job_data.items()
+        if key not in ("_attempts", "requires", "requiresUntil")
+    }
+    encoded = json.dumps(stable, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+def log_event(event, **fields):
+    """Writes one structured log line, tagged with the current job's ID."""
+    record = {
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "event": event,
+        "job_id": job_id_var.get(),
+        **fields,
+    }
+    sys.__stdout__.write(json.dumps(record, default=str) + "\n")
+
+
+@contextlib.contextmanager
+def span(stage):
+    """Times a pipeline stage and counts it as failed if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        STAGE_FAILURES.labels(stage).inc()
+        log_event("stage", stage=stage, seconds=round(elapsed, 4), ok=False)
+        raise
+    elapsed = time.perf_counter() - started
+    STAGE_SECONDS.labels(stage).observe(elapsed)
+    log_event("stage", stage=stage, seconds=round(elapsed, 4), ok=True)
+
+
+@contextlib.contextmanager
+def timed_enter(stage, context_manager):
+    """Enters context_manager within a span for stage and yields its value."""
+    with contextlib.ExitStack() as stack:
+        with span(stage):
+            value = stack.enter_context(context_manager)
+        yield value
+
+
+class JsonLineWriter(io.TextIOBase):
+    """
+    Stand-in for sys.stdout that turns every line the worker prints into a
+    JSON log record carrying the job ID of the thread that printed it.
+    Partial lines are buffered per thread so concurrent jobs do not mix.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        pending = getattr(self.local, "pending", "") + text
+        *lines, self.local.pending = pending.split("\n")
+        for line in lines:
+            if line:
+                record = {
+                    "ts": datetime.now(timezone.utc).isoformat(),
+                    "event": "log",
+                    "job_id": job_id_var.get(),
+                    "thread": threading.current_thread().name,
+                    "message": line,
+                }
+                with self.lock:
+                    self.stream.write(json.dumps(record) + "\n")
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def install_json_logs():
+    sys.stdout = JsonLineWriter(sys.__stdout__)
+
+
+class StatsCollector:
+    """
+    Exports the counters the caches, the LLM gateway and the job queue
+    already keep, read at scrape time so the hot paths stay untouched.
+    """
+
+    def __init__(
+        self,
+        env_cache,
+        diagnostics_cache,
+        llm,
+        queue=None,
+        analyzer_host=None,
+        concurrency=None,
+    ):
+        self.env_cache = env_cache
+        self.diagnostics_cache = diagnostics_cache
+        self.llm = llm
+        self.queue = queue
+        self.analyzer_host = analyzer_host
+        self.concurrency = concurrency
+
+    def collect(self):
+        cache = CounterMetricFamily(
+            "analysis_cache_lookups",
+            "Cache lookups by cache and result.",
+            labels=["cache", "result"],
+        )
+        env_counts = dict(self.env_cache.counts)
+        for kind in ("python", "node"):
+            cache.add_metric([f"{kind}_env", "hit"], env_counts[f"{kind}_hits"])
+            cache.add_metric([f"{kind}_env", "miss"], env_counts[f"{kind}_misses"])
+        diag_counts = dict(self.diagnostics_cache.counts)
+        cache.add_metric(["diagnostics", "hit"], diag_counts["hits"])
+        cache.add_metric(["diagnostics", "miss"], diag_counts["misses"])
+        llm_stats = dict(self.llm.stats)
+        cache.add_metric(["llm", "hit"], llm_stats["cache_hits"])
+        cache.add_metric(["llm", "miss"], llm_stats["calls"] + llm_stats["failures"])
+        yield cache
+
+        saved = CounterMetricFamily(
+            "analysis_diagnostics_cache_bytes_saved",
+            "Bytes of linter output served from the diagnostics cache.",
+        )
+        saved.add_metric([], diag_counts["bytes_saved"])
+        yield saved
+
+        llm = CounterMetricFamily(
+            "analysis_llm", "LLM gateway activity by kind.", labels=["kind"]
+        )
+        for kind in ("calls", "retries", "failures", "prompt_tokens", "output_tokens"):
+            llm.add_metric([kind], llm_stats[kind])
+        yield llm
+
+        if self.analyzer_host is not None:
+            daemons = CounterMetricFamily(
+                "analysis_analyzer_daemons",
+                "Analyzer daemon starts, reuses, recycles and fallbacks.",
+                labels=["event"],
+            )
+            for event, count in dict(self.analyzer_host.counts).items():
+                daemons.add_metric([event], count)
+            yield daemons
+
+        if self.concurrency is not None:
+            limit = GaugeMetricFamily(
+                "analysis_concurrency_limit",
+                "Jobs the worker runs at once under the current memory pressure.",
+            )
+            limit.add_metric([], self.concurrency.limit)
+            yield limit
+
+        if self.queue is not None:
+            try:
+                lanes = self.queue.lane_stats()
+            except Exception:
+                return
+            depth = GaugeMetricFamily(
+                "analysis_queue_depth", "Jobs waiting per lane.", labels=["lane"]
+            )
+            wait = GaugeMetricFamily(
+                "analysis_queue_last_wait_seconds",
+                "Queue wait of the last job claimed per lane.",
+                labels=["lane"],
+            )
+            for lane, stats in lanes.items():
+                depth.add_metric([lane], stats["depth"])
+                wait.add_metric([lane], stats["last_wait_seconds"])
+            yield depth
+            yield wait
+
+
+def start_metrics_server(port, collector):
+    REGISTRY.register(collector)
+    start_http_server(port)
+    print(f"Serving Prometheus metrics on :{port}/metrics")
@@ -0,0 +1,122 @@
+from diff_index import parse_diff_stream
+from diagnostics import filter_to_added_lines
+
+DIFF = b"""\
+diff --git a/app.py b/app.py
+index 1111111..2222222 100644
+--- a/app.py
++++ b/app.py
+@@ -1,4 +1,6 @@ def main():
+ import os
++import sys
+
+-print(os.name)
++print(sys.argv)
++print(os.name)
+ done()
+@@ -20,2 +22,3 @@ class Tail:
+ a = 1
++b = 2
+ c = 3
+diff --git a/vendor/lib.js b/vendor/lib.js
+--- a/vendor/lib.js
++++ b/vendor/lib.js
+@@ -1 +1,2 @@
+ x
++y
+diff --git a/old.py b/old.py
+deleted file mode 100644
+--- a/old.py
++++ /dev/null
+@@ -1 +0,0 @@
+-gone
+"""
+
+
+def chunks(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def diagnostic(path, line, end_line=None):
+    end_line = line if end_line is None else end_line
+    return {
+        "file": path,
+        "range": {"start": {"line": line - 1}, "end": {"line": end_line - 1}},
+        "message": "m",
+        "rule": "r",
+    }
+
+
+def test_added_lines_become_ranges():
+    index = parse_diff_stream([DIFF])
+    app = index.files["app.py"]
+    assert list(zip(app.starts, app.ends)) == [(2, 2), (4, 5), (23, 23)]
+    assert index.changed_files == ["app.py"]
+    assert index.total_bytes == len(DIFF)
+
+
+def test_chunk_boundaries_do_not_matter():
+    whole = parse_diff_stream([DIFF])
+    for size in (1, 7, 64):
+        split = parse_diff_stream(chunks(DIFF, size))
+        assert split.files.keys() == whole.files.keys()
+        for path, f in whole.files.items():
+            assert split.files[path].starts == f.starts
+            assert split.files[path].ends == f.ends
+            assert split.files[path].hunks == f.hunks
+
+
+def test_vendored_and_deleted_files():
+    index = parse_diff_stream([DIFF])
+    assert index.skipped_files == {"vendor/lib.js": "vendored or generated"}
+    assert "old.py" not in index.files
+
+
+def test_overlaps_and_first_added_line():
+    app = parse_diff_stream([DIFF]).files["app.py"]
+    assert app.overlaps(2, 2)
+    assert app.overlaps(1, 3)
+    assert not app.overlaps(6, 22)
+    assert app.first_added_line(3, 10) == 4
+    assert app.first_added_line(5, 30) == 5
+    assert app.first_added_line(6, 22) is None
+
+
+def test_hunks_drop_line_numbers_and_respect_limit():
+    index = parse_diff_stream([DIFF])
+    assert index.file_hunks()[0][1][0].startswith("@@ def main(): @@\n")
+
+    limited = parse_diff_stream([DIFF], max_hunk_bytes=80)
+    app = limited.files["app.py"]
+    assert app.hunks_dropped >= 1
+    assert "app.py" in limited.unreviewed_files
+    # Dropped hunks are still linted.
+    assert limited.changed_files == ["app.py"]
+
+
+def test_large_file_is_skipped():
+    index = parse_diff_stream([DIFF], max_file_bytes=100)
+    assert index.files["app.py"].skipped_reason.startswith("diff larger than")
+    assert "app.py" not in index.changed_files
+
+
+def test_excerpt_is_bounded():
+    index = parse_diff_stream([DIFF], max_excerpt_bytes=50)
+    assert len(index.excerpt) <= 50
+    assert index.excerpt_truncated
+
+
+def test_filter_keeps_diagnostics_touching_added_lines():
+    index = parse_diff_stream([DIFF])
+    raw = [
+        diagnostic("/repo/app.py", 2),
+        diagnostic("/repo/app.py", 3),
+        diagnostic("/repo/app.py", 20, 23),
+        diagnostic("/repo/vendor/lib.js", 2),
+        diagnostic("/elsewhere/app.py", 2),
+    ]
+    relevant = filter_to_added_lines(raw, index, "/repo")
+    assert [(d.path, d.line, d.end_line) for d in relevant] == [
+        ("app.py", 2, 2),
+        ("app.py", 20, 23),
+    ]
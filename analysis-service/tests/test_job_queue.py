@@ -0,0 +1,159 @@
+import json
+import time
+import pytest
+from job_queue import ReliableQueue
+
+
+def pr_job(number, repo="octo/widgets", **fields):
+    return json.dumps(
+        {
+            "eventType": "pull_request",
+            "enqueuedAt": time.time(),
+            "payload": {"number": number, "repository": {"full_name": repo}},
+            **fields,
+        }
+    )
+
+
+def make_queue(redis_client, worker_id="worker-1", **kwargs):
+    options = {
+        "visibility_timeout": 30,
+        "max_attempts": 3,
+        "backoff_base": 1,
+        "repo_concurrency": 1,
+    }
+    options.update(kwargs)
+    return ReliableQueue(redis_client, "jobs", worker_id, **options)
+
+
+@pytest.fixture
+def queue(redis_client):
+    return make_queue(redis_client)
+
+
+def claim_pushed(redis_client, queue, job):
+    redis_client.lpush(queue.name, job)
+    return queue.claim(timeout=1)
+
+
+def test_claim_leases_and_ack_releases(redis_client, queue):
+    job = pr_job(1)
+    assert claim_pushed(redis_client, queue, job) == job
+    assert redis_client.lrange(queue.processing, 0, -1) == [job]
+    assert redis_client.hget(queue.leases, job) is not None
+    assert redis_client.hget(queue.running, "octo/widgets") == "1"
+
+    assert queue.ack(job) == 1
+    assert redis_client.llen(queue.processing) == 0
+    assert redis_client.hlen(queue.leases) == 0
+    assert redis_client.hget(queue.running, "octo/widgets") is None
+    assert queue.ack(job) == 0
+
+
+def test_claim_returns_none_when_empty(queue):
+    assert queue.claim(timeout=1) is None
+
+
+def test_repository_concurrency_cap(redis_client, queue):
+    first, second, other = pr_job(1), pr_job(2), pr_job(3, repo="octo/gadgets")
+    redis_client.lpush(queue.name, first, second, other)
+    assert queue.claim(timeout=1) == first
+    # octo/widgets is at its cap, so the other repository goes next.
+    assert queue.claim(timeout=1) == other
+    assert queue.claim(timeout=1) is None
+    queue.ack(first)
+    assert queue.claim(timeout=1) == second
+
+
+def test_webhook_lane_is_served_before_poll_lane(redis_client, queue):
+    polled = pr_job(1, repo="octo/a", source="poll")
+    pushed = pr_job(2, repo="octo/b")
+    redis_client.lpush(queue.name, polled, pushed)
+    assert queue.claim(timeout=1) == pushed
+
+
+def test_retry_schedules_with_attempt_count(redis_client, queue):
+    job = claim_pushed(redis_client, queue, pr_job(1))
+    assert queue.retry(job, "boom") == 1
+    assert redis_client.llen(queue.processing) == 0
+    (delayed,) = redis_client.zrange(queue.delayed, 0, -1)
+    assert json.loads(delayed)["_attempts"] == 1
+
+    # Not due yet, then due.
+    assert queue.promote_due() == 0
+    redis_client.zadd(queue.delayed, {delayed: 0})
+    assert queue.promote_due() == 1
+    assert queue.claim(timeout=1) == delayed
+
+
+def test_retry_buries_after_max_attempts(redis_client, queue):
+    job = claim_pushed(redis_client, queue, pr_job(1, _attempts=2))
+    queue.retry(job, "boom")
+    assert redis_client.zcard(queue.delayed) == 0
+    dead = json.loads(redis_client.lindex(queue.dead, 0))
+    assert dead["job"] == job
+    assert dead["error"] == "boom"
+
+
+@pytest.mark.parametrize("attempts", ['"many"', "null", "Infinity", "[]"])
+def test_retry_buries_invalid_attempt_count(redis_client, queue, attempts):
+    job = claim_pushed(
+        redis_client, queue, f'{{"_attempts": {attempts}, "payload": {{}}}}'
+    )
+    queue.retry(job, "boom")
+    assert redis_client.zcard(queue.delayed) == 0
+    assert json.loads(redis_client.lindex(queue.dead, 0))["job"] == job
+
+
+@pytest.mark.parametrize("payload", ["[]", "null", '"x"', "{not json"])
+@pytest.mark.parametrize("settle", ["retry", "reroute", "reap"])
+def test_non_object_jobs_are_buried(redis_client, queue, payload, settle):
+    job = claim_pushed(redis_client, queue, payload)
+    assert job == payload
+    if settle == "retry":
+        queue.retry(job, "poison")
+    elif settle == "reroute":
+        queue.reroute(job, ["pyright"], 60)
+    else:
+        redis_client.hset(queue.leases, job, 0)
+        make_queue(redis_client, "reaper").reap_expired()
+    assert redis_client.llen(queue.processing) == 0
+    assert json.loads(redis_client.lindex(queue.dead, 0))["job"] == payload
+
+
+def test_reaper_retries_expired_lease(redis_client, queue):
+    job = claim_pushed(redis_client, queue, pr_job(1))
+    redis_client.hset(queue.leases, job, 0)
+    assert make_queue(redis_client, "reaper").reap_expired() == 1
+    assert redis_client.llen(queue.processing) == 0
+    assert redis_client.zcard(queue.delayed) == 1
+    # The worker finishing late must not ack it a second time.
+    assert queue.ack(job) == 0
+
+
+def test_reaper_grants_grace_to_unleased_job(redis_client, queue):
+    job = claim_pushed(redis_client, queue, pr_job(1))
+    redis_client.hdel(queue.leases, job)
+    assert make_queue(redis_client, "reaper").reap_expired() == 0
+    assert float(redis_client.hget(queue.leases, job)) > time.time()
+
+
+def test_extend_renews_only_jobs_still_processing(redis_client, queue):
+    job = claim_pushed(redis_client, queue, pr_job(1))
+    redis_client.hset(queue.leases, job, 0)
+    assert queue.extend([job]) == 1
+    assert float(redis_client.hget(queue.leases, job)) > time.time()
+
+    queue.ack(job)
+    assert queue.extend([job]) == 0
+    assert redis_client.hlen(queue.leases) == 0
+
+
+def test_reroute_requires_tools_until_timeout(redis_client, queue):
+    job = claim_pushed(redis_client, queue, pr_job(1))
+    queue.reroute(job, ["clang-tidy"], 60)
+    assert queue.claim(timeout=1) is None
+
+    capable = make_queue(redis_client, "worker-2", tools=("clang-tidy",))
+    rerouted = capable.claim(timeout=1)
+    assert json.loads(rerouted)["requires"] == ["clang-tidy"]
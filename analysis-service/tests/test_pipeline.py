@@ -0,0 +1,92 @@
+import time
+import threading
+import contextlib
+import pytest
+from pipeline import Pipeline, StageSkipped, StageTimeout
+
+
+def test_results_flow_to_dependents():
+    pipeline = Pipeline("test")
+    pipeline.add("a", lambda: 1)
+    pipeline.add("b", lambda: 2)
+    pipeline.add("sum", lambda a, b: a + b, deps=("a", "b"))
+    assert pipeline.run() == {"a": 1, "b": 2, "sum": 3}
+
+
+def test_independent_stages_overlap():
+    both_started = threading.Barrier(2, timeout=5)
+    pipeline = Pipeline("test")
+    pipeline.add("a", both_started.wait)
+    pipeline.add("b", both_started.wait)
+    pipeline.run()
+
+
+def test_unknown_dependency_is_rejected():
+    pipeline = Pipeline("test")
+    with pytest.raises(ValueError):
+        pipeline.add("a", lambda missing: None, deps=("missing",))
+
+
+def test_skip_stops_dependents_without_failing():
+    ran = []
+
+    def check():
+        raise StageSkipped("stale")
+
+    pipeline = Pipeline("test")
+    pipeline.add("check", check)
+    pipeline.add("post", lambda check: ran.append("post"), deps=("check",))
+    pipeline.add("save", lambda post: ran.append("save"), deps=("post",))
+    pipeline.add("other", lambda: ran.append("other"))
+    results = pipeline.run()
+    assert ran == ["other"]
+    assert set(results) == {"other"}
+
+
+def test_failure_skips_dependents_and_is_reraised():
+    ran = []
+
+    def fail():
+        raise KeyError("boom")
+
+    def slow():
+        time.sleep(0.05)
+        ran.append("independent")
+
+    pipeline = Pipeline("test")
+    pipeline.add("fail", fail)
+    pipeline.add("after", lambda fail: ran.append("after"), deps=("fail",))
+    pipeline.add("independent", slow)
+    with pytest.raises(KeyError):
+        pipeline.run()
+    assert ran == ["independent"]
+
+
+def test_timeout_fails_the_stage():
+    release = threading.Event()
+    pipeline = Pipeline("test", default_timeout=0.05)
+    pipeline.add("hang", lambda: release.wait(5))
+    pipeline.add("after", lambda hang: None, deps=("hang",))
+    try:
+        with pytest.raises(StageTimeout):
+            pipeline.run()
+    finally:
+        release.set()
+
+
+def test_entered_contexts_close_after_the_run():
+    events = []
+
+    @contextlib.contextmanager
+    def resource():
+        events.append("open")
+        yield "path"
+        events.append("close")
+
+    pipeline = Pipeline("test")
+    pipeline.add("checkout", lambda: pipeline.enter_context(resource()))
+    pipeline.add(
+        "use", lambda checkout: events.append(f"use {checkout}"), deps=("checkout",)
+    )
+    pipeline.run()
+    assert events == ["open", "use path", "close"]
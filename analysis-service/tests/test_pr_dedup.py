@@ -0,0 +1,43 @@
+import pytest
+from pr_dedup import PRDedup, head_key, job_identity
+
+
+def payload(sha, number=7, repo="Octo/Widgets"):
+    return {
+        "number": number,
+        "repository": {"full_name": repo},
+        "pull_request": {"head": {"sha": sha}},
+    }
+
+
+@pytest.fixture
+def dedup():
+    fakeredis = pytest.importorskip("fakeredis")
+    return PRDedup(fakeredis.FakeRedis(decode_responses=True), ttl=60)
+
+
+def test_job_identity():
+    assert job_identity(payload("abc")) == ("Octo/Widgets", 7, "abc")
+    assert job_identity({"number": 7, "repository": {"full_name": "a/b"}}) is None
+
+
+def test_jobs_without_identity_are_processed(dedup):
+    assert dedup.skip_reason({"number": 7}) is None
+    assert not dedup.is_superseded({"number": 7})
+
+
+def test_superseded_commit_is_skipped(dedup):
+    # Producers lowercase the repository in the key.
+    dedup.redis.set(head_key("octo/widgets", 7), "b" * 40)
+    old = payload("a" * 40)
+    assert dedup.is_superseded(old)
+    assert "superseded" in dedup.skip_reason(old)
+    assert dedup.skip_reason(payload("b" * 40)) is None
+
+
+def test_reviewed_commit_is_skipped(dedup):
+    job = payload("a" * 40)
+    assert dedup.skip_reason(job) is None
+    dedup.mark_done(job)
+    assert "already reviewed" in dedup.skip_reason(job)
+    assert dedup.skip_reason(payload("a" * 40, number=8)) is None
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import pytest
+from diagnostics_cache import blob_hashes
+from python_imports import module_names, python_dependency_keys
+
+FILES = {
+    "src/pkg/__init__.py": "",
+    "src/pkg/a.py": "from .b import value\n",
+    "src/pkg/b.py": "import pkg.c\nvalue = 1\n",
+    "src/pkg/c.py": "VALUE = 2\n",
+    "tool.py": "import os\nimport requests\n",
+    "broken.py": "def (:\n",
+}
+
+
+def git(repo, *args):
+    subprocess.run(
+        ["git", "-C", repo, "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        check=True,
+        capture_output=True,
+    )
+
+
+def commit(repo, files):
+    for path, content in files.items():
+        full_path = os.path.join(repo, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(content)
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "change")
+
+
+def keys(repo):
+    return python_dependency_keys(repo, blob_hashes(repo, list(FILES)))
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = str(tmp_path)
+    git(repo, "init", "-q")
+    commit(repo, FILES)
+    return repo
+
+
+def test_module_names():
+    assert list(module_names("src/pkg/a.py")) == ["src.pkg.a", "pkg.a"]
+    assert list(module_names("pkg/__init__.py")) == ["pkg"]
+
+
+def test_change_invalidates_importers_only(repo):
+    before = keys(repo)
+    commit(repo, {"src/pkg/c.py": "VALUE = 3\n"})
+    after = keys(repo)
+    changed = {path for path in FILES if before[path] != after[path]}
+    # a imports b, which imports pkg.c.
+    assert changed == {"src/pkg/a.py", "src/pkg/b.py", "src/pkg/c.py"}
+
+
+def test_unrelated_change_keeps_keys(repo):
+    before = keys(repo)
+    commit(repo, {"README.md": "docs\n", "src/pkg/d.py": "import os\n"})
+    assert keys(repo) == before
@@ -0,0 +1,105 @@
+from datetime import datetime
+import pytest
+from review_rollups import (
+    ROLLUPS_COLLECTION,
+    language_field,
+    rebuild_rollups,
+    rollup_updates,
+)
+
+REVIEWS = [
+    ("alice", "octo/a", datetime(2026, 3, 1, 9), "python", 2),
+    ("alice", "octo/a", datetime(2026, 3, 1, 23, 59), "c++", 0),
+    ("alice", "octo/a", datetime(2026, 3, 2, 0, 1), "python", 5),
+    ("alice", "octo/b", datetime(2026, 3, 1, 12), None, 1),
+    ("bob", "octo/a", datetime(2026, 3, 1, 12), "python", 3),
+]
+
+
+@pytest.fixture
+def db():
+    pytest.importorskip("mongomock")
+    import mongomock.collection
+
+    # pymongo's UpdateOne passes a `sort` option mongomock does not know.
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+    mongomock.collection.BulkOperationBuilder.add_update = (
+        lambda self, *args, sort=None, **kwargs: add_update(self, *args, **kwargs)
+    )
+    yield mongomock.MongoClient()["test"]
+    mongomock.collection.BulkOperationBuilder.add_update = add_update
+
+
+def review_documents():
+    return [
+        {
+            "userId": user,
+            "repo_name": repo,
+            "analyzed_at": analyzed_at,
+            "language": language,
+            "issues_found": issues,
+        }
+        for user, repo, analyzed_at, language, issues in REVIEWS
+    ]
+
+
+def rollups(db):
+    return {
+        (r["userId"], r["repo_name"], r["day"]): (
+            r["reviews"],
+            r["issues_found"],
+            r["languages"],
+        )
+        for r in db[ROLLUPS_COLLECTION].find()
+    }
+
+
+EXPECTED = {
+    ("alice", "octo/a", "2026-03-01"): (2, 2, {"python": 1, "c++": 1}),
+    ("alice", "octo/a", "2026-03-02"): (1, 5, {"python": 1}),
+    ("alice", "octo/b", "2026-03-01"): (1, 1, {"unknown": 1}),
+    ("bob", "octo/a", "2026-03-01"): (1, 3, {"python": 1}),
+}
+
+
+def test_language_field_is_a_valid_field_name():
+    assert language_field("python") == "python"
+    assert language_field(None) == "unknown"
+    assert language_field("objective.c") == "objective_c"
+    assert language_field("$where") == "where"
+
+
+def test_incremental_rollups_add_up(db):
+    reviews = review_documents()
+    # Saved in two batches, as separate jobs would.
+    db[ROLLUPS_COLLECTION].bulk_write(rollup_updates(reviews[:2]))
+    db[ROLLUPS_COLLECTION].bulk_write(rollup_updates(reviews[2:]))
+    assert rollups(db) == EXPECTED
+
+
+def test_rebuild_matches_incremental_rollups(db):
+    db["reviews"].insert_many(review_documents())
+    db[ROLLUPS_COLLECTION].insert_one(
+        {"userId": "alice", "repo_name": "octo/a", "day": "2026-03-01", "reviews": 99}
+    )
+    assert rebuild_rollups(db) == len(EXPECTED)
+    assert rollups(db) == EXPECTED
+
+
+def test_rebuild_one_user_leaves_the_others(db):
+    db["reviews"].insert_many(review_documents())
+    db[ROLLUPS_COLLECTION].bulk_write(rollup_updates(review_documents()))
+    db["reviews"].delete_many({"userId": "bob"})
+    db["reviews"].insert_one(
+        {
+            "userId": "bob",
+            "repo_name": "octo/a",
+            "analyzed_at": datetime(2026, 3, 1, 12),
+            "language": "shell",
+            "issues_found": 7,
+        }
+    )
+    rebuild_rollups(db, "bob")
+    expected = dict(EXPECTED)
+    expected[("bob", "octo/a", "2026-03-01")] = (1, 7, {"shell": 1})
+    assert rollups(db) == expected
@@ -1,51 +1,229 @@
 import os
+import re
+import hashlib
 import requests
 import redis
 import json
 import time
-import shutil
-import git
-import subprocess
-import glob
-import re
-import google.generativeai as genai
-from pymongo import MongoClient
+import signal
+import socket
+import threading
+import multiprocessing
+from functools import partial
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
-from github import Github
-from unidiff import PatchSet
 from datetime import datetime
 from bson.objectid import ObjectId
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import clients
+import governor
+from repo_cache import RepoCache
+from env_cache import EnvCache
+from review_rollups import ROLLUPS_COLLECTION, rollup_updates
+from analyzer_host import AnalyzerHost
+from diagnostics_cache import DiagnosticsCache, blob_hashes
+from repo_summary import SummaryCache, read_readme, tree_outline
+from llm_gateway import LLMGateway, create_model
+from review import estimate_tokens, split_into_chunks, review_chunks, CHARS_PER_TOKEN
+from diff_index import parse_diff_stream
+from diagnostics import filter_to_added_lines
+from job_queue import ReliableQueue, PoisonJob, Reroute, decode_job
+from worker_registry import WorkerRegistry
+from pr_dedup import PRDedup, job_identity
+from github_client import GitHubClient, RateLimitExhausted
+from pipeline import Pipeline, StageSkipped
+from telemetry import (
+    CHILD_LIMITS_HIT,
+    DIAGNOSTICS,
+    END_TO_END_SECONDS,
+    JOB_CPU_SECONDS,
+    JOB_PEAK_RSS_BYTES,
+    JOBS,
+    QUEUE_WAIT_SECONDS,
+    StatsCollector,
+    install_json_logs,
+    job_id_for,
+    job_id_var,
+    log_event,
+    span,
+    start_metrics_server,
+    timed_enter,
+)
+from analyzers import (
+    ANALYZERS,
+    AnalysisContext,
+    analyzer_for,
+    assign_files,
+    installed_analyzers,
+    primary_language,
+)
 
 # Configuration & Clients
 load_dotenv()
 GITHUB_PAT = os.getenv("GITHUB_PAT")
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MONGO_ATLAS_URI = os.getenv("MONGO_ATLAS_URI")
 PR_QUEUE_NAME = "pr_queue"
 CLONE_DIR = "/tmp/repos"
-
-gh_client = Github(GITHUB_PAT)
-print("Analysis worker started...")
-genai.configure(api_key=GEMINI_API_KEY)
-ai_model = genai.GenerativeModel("gemini-flash-latest")
-print("Successfully connected to Github and Google AI!")
-
-
-# Connect to MongoDB
-print("Connecting to MongoDB")
-mongo_client = MongoClient(MONGO_ATLAS_URI)
-db = mongo_client["code-reviewer-ai-db"]
-reviews_collection = db["reviews"]
-repositories_collection = db["repositories"]
-print("Connected to MongoDB")
+REPO_CACHE_MAX_BYTES = int(os.getenv("REPO_CACHE_MAX_BYTES", 20 * 1024**3))
+ENV_CACHE_DIR = os.getenv("ENV_CACHE_DIR", "/tmp/env-cache")
+ENV_CACHE_MAX_BYTES = int(os.getenv("ENV_CACHE_MAX_BYTES", 10 * 1024**3))
+# Seconds a failed dependency install is not retried for the same manifests.
+ENV_CACHE_FAILURE_TTL = int(os.getenv("ENV_CACHE_FAILURE_TTL", 900))
+# Warm pyright/eslint processes kept between jobs; 0 runs every check as a
+# one-off process. Daemons are restarted after ANALYZER_DAEMON_MAX_JOBS jobs
+# or once they use more than ANALYZER_DAEMON_MAX_RSS_MB.
+ANALYZER_DAEMONS = int(os.getenv("ANALYZER_DAEMONS", 4))
+ANALYZER_DAEMON_MAX_JOBS = int(os.getenv("ANALYZER_DAEMON_MAX_JOBS", 50))
+ANALYZER_DAEMON_MAX_RSS_MB = int(os.getenv("ANALYZER_DAEMON_MAX_RSS_MB", 1536))
+ANALYZER_DAEMON_IDLE_SECONDS = int(os.getenv("ANALYZER_DAEMON_IDLE_SECONDS", 900))
+ANALYZER_DAEMON_TIMEOUT = int(os.getenv("ANALYZER_DAEMON_TIMEOUT", 300))
+# Limits on every linter, pip and npm process a job starts; 0 means
+# unlimited. Memory covers the process and its children, disk the worktree
+# or environment being written.
+CHILD_TIMEOUT_SECONDS = int(os.getenv("CHILD_TIMEOUT_SECONDS", 600))
+CHILD_MEMORY_MB = int(os.getenv("CHILD_MEMORY_MB", 2048))
+CHILD_CPU_SECONDS = int(os.getenv("CHILD_CPU_SECONDS", 900))
+JOB_DISK_QUOTA_MB = int(os.getenv("JOB_DISK_QUOTA_MB", 4096))
+# Fewer jobs run at once while memory pressure (PSI some avg10, in percent)
+# is above MEMORY_PRESSURE_HIGH or less than MEMORY_MIN_AVAILABLE of memory
+# is left, and more again once it is below MEMORY_PRESSURE_LOW.
+MEMORY_PRESSURE_HIGH = float(os.getenv("MEMORY_PRESSURE_HIGH", 10))
+MEMORY_PRESSURE_LOW = float(os.getenv("MEMORY_PRESSURE_LOW", 1))
+MEMORY_MIN_AVAILABLE = float(os.getenv("MEMORY_MIN_AVAILABLE", 0.1))
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", os.cpu_count() or 1))
+SHUTDOWN_GRACE_SECONDS = int(os.getenv("SHUTDOWN_GRACE_SECONDS", 8))
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}:{os.getpid()}")
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", 60))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BACKOFF_SECONDS = int(os.getenv("JOB_RETRY_BACKOFF_SECONDS", 10))
+REAPER_INTERVAL_SECONDS = 15
+# The orchestrator retries the jobs of workers silent for this long.
+WORKER_HEARTBEAT_TIMEOUT = int(os.getenv("WORKER_HEARTBEAT_TIMEOUT", 45))
+# A job handed to a worker with tools this one lacks goes back to any
+# worker if none claimed it within this time.
+JOB_REROUTE_TIMEOUT = int(os.getenv("JOB_REROUTE_TIMEOUT", 600))
+METRICS_PORT = int(os.getenv("METRICS_PORT", 8000))
+# "json" prints one JSON record per log line, tagged with the job ID.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# At most this many jobs of one repository run at once across all workers.
+JOB_REPO_CONCURRENCY = int(os.getenv("JOB_REPO_CONCURRENCY", 2))
+# Share of claims per lane while every lane has a backlog, highest priority first.
+JOB_LANE_WEIGHTS = tuple(
+    (lane, int(weight))
+    for lane, weight in (
+        item.split(":")
+        for item in os.getenv("JOB_LANE_WEIGHTS", "webhook:6,poll:3,analysis:1").split(
+            ","
+        )
+    )
+)
+# "diff" lints only the files a PR touched, "full" lints the whole repository.
+ANALYSIS_SCOPE = os.getenv("ANALYSIS_SCOPE", "diff")
+DIAG_CACHE_TTL = int(os.getenv("DIAG_CACHE_TTL", 7 * 24 * 3600))
+PR_DEDUP_TTL = int(os.getenv("PR_DEDUP_TTL", 7 * 24 * 3600))
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", 30 * 24 * 3600))
+# Directory levels of the repository outline shown to the LLM.
+SUMMARY_TREE_DEPTH = int(os.getenv("SUMMARY_TREE_DEPTH", 2))
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 60))
+LLM_TIMEOUT_SECONDS = int(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+# Diffs above REVIEW_CHUNK_TOKENS are reviewed per file chunk, then summarized.
+REVIEW_CHUNK_TOKENS = int(os.getenv("REVIEW_CHUNK_TOKENS", 3000))
+REVIEW_TOKEN_BUDGET = int(os.getenv("REVIEW_TOKEN_BUDGET", 60000))
+REVIEW_DEADLINE_SECONDS = int(os.getenv("REVIEW_DEADLINE_SECONDS", 120))
+# Each step of a PR job fails after STAGE_TIMEOUT_SECONDS unless overridden
+# per stage, e.g. STAGE_TIMEOUTS="fetch_diff:60,lint_pyright:1800".
+STAGE_TIMEOUT_SECONDS = int(os.getenv("STAGE_TIMEOUT_SECONDS", 900))
+STAGE_TIMEOUTS = {
+    stage: int(seconds)
+    for stage, seconds in (
+        item.split(":") for item in os.getenv("STAGE_TIMEOUTS", "").split(",") if item
+    )
+}
+# Most in-line comments one review posts; the AI comment covers the rest.
+REVIEW_MAX_COMMENTS = int(os.getenv("REVIEW_MAX_COMMENTS", 30))
+# Per-file diff size above which a file is neither linted nor reviewed.
+DIFF_MAX_FILE_BYTES = int(os.getenv("DIFF_MAX_FILE_BYTES", 1024 * 1024))
+
+governor.configure(
+    timeout=CHILD_TIMEOUT_SECONDS or None,
+    memory_bytes=CHILD_MEMORY_MB * 1024**2 or None,
+    cpu_seconds=CHILD_CPU_SECONDS or None,
+    disk_bytes=JOB_DISK_QUOTA_MB * 1024**2 or None,
+)
+repo_cache = RepoCache(CLONE_DIR, REPO_CACHE_MAX_BYTES)
+env_cache = EnvCache(ENV_CACHE_DIR, ENV_CACHE_MAX_BYTES, ENV_CACHE_FAILURE_TTL)
+analyzer_host = (
+    AnalyzerHost(
+        repo_cache,
+        env_cache,
+        max_daemons=ANALYZER_DAEMONS,
+        max_jobs=ANALYZER_DAEMON_MAX_JOBS,
+        max_rss_bytes=ANALYZER_DAEMON_MAX_RSS_MB * 1024**2,
+        idle_seconds=ANALYZER_DAEMON_IDLE_SECONDS,
+        timeout=ANALYZER_DAEMON_TIMEOUT,
+    )
+    if ANALYZER_DAEMONS > 0
+    else None
+)
+# Backend clients are created on first use, once per process; see clients.py.
+clients.register(
+    "redis", lambda: redis.Redis.from_url(REDIS_URL, decode_responses=True)
+)
+clients.register("mongo", lambda: MongoClient(MONGO_ATLAS_URI))
+clients.register(
+    "github",
+    lambda: GitHubClient(GITHUB_PAT, GITHUB_API_URL, pool_size=WORKER_CONCURRENCY),
+)
+clients.register("llm_model", lambda: create_model(LLM_BACKEND, GEMINI_API_KEY))
+
+shared_redis = clients.lazy("redis")
+diagnostics_cache = DiagnosticsCache(shared_redis, DIAG_CACHE_TTL)
+pr_dedup = PRDedup(shared_redis, PR_DEDUP_TTL)
+summary_cache = SummaryCache(shared_redis, SUMMARY_CACHE_TTL)
+INSTALLED_TOOLS = installed_analyzers()
+worker_registry = WorkerRegistry(
+    shared_redis,
+    WORKER_ID,
+    INSTALLED_TOOLS,
+    {ANALYZERS[name].language for name in INSTALLED_TOOLS},
+    WORKER_CONCURRENCY,
+)
+
+# Linters run in a process pool; network-bound stages run on job threads.
+lint_pool = None
+lint_pool_lock = threading.Lock()
+shutdown_event = threading.Event()
+
+github = clients.lazy("github")
+llm = LLMGateway(
+    clients.lazy("llm_model"),
+    REDIS_URL,
+    concurrency=LLM_CONCURRENCY,
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    timeout=LLM_TIMEOUT_SECONDS,
+    cache_ttl=LLM_CACHE_TTL,
+)
+
+DB_NAME = "code-reviewer-ai-db"
+reviews_collection = clients.lazy("mongo", DB_NAME, "reviews")
+repositories_collection = clients.lazy("mongo", DB_NAME, "repositories")
+rollups_collection = clients.lazy("mongo", DB_NAME, ROLLUPS_COLLECTION)
 
 
 def connect_to_redis():
-    """Attempt to connect to Redis, with retries."""
+    """Waits until Redis answers and returns the process's shared client."""
     while True:
         try:
-            r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+            r = clients.get("redis")
             r.ping()
             print("Successfully connected to Redis!")
             return r
@@ -54,408 +232,631 @@ def connect_to_redis():
             time.sleep(5)
 
 
-def parse_diff_to_get_added_lines(diff_text):
-    """Parses a diff and returns a dictionary mapping filenames to added line numbers."""
-    patch_set = PatchSet(diff_text)
-    added_lines = {}
-    for patched_file in patch_set:
-        filename = patched_file.path
-        lines_in_file = set()
-        for hunk in patched_file:
-            for line in hunk:
-                if line.is_added:
-                    lines_in_file.add(line.target_line_no)
-        if lines_in_file:
-            added_lines[filename] = lines_in_file
-    return added_lines
-
-
-def detect_language(changed_files):
-    """Detects the primary language of a repository."""
-    print(f"Detecting language from {len(changed_files)} changed files...")
-    language_counts = {"python": 0, "c": 0, "javascript": 0}
-
-    for file_path in changed_files:
-        if file_path.endswith(".py"):
-            language_counts["python"] += 1
-        elif file_path.endswith(("c", ".cpp", ".h", ".hpp")):
-            language_counts["c"] += 1
-        elif file_path.endswith((".js", ".jsx", ".ts", ".tsx")):
-            language_counts["javascript"] += 1
-
-    if not language_counts or max(language_counts.values()) == 0:
-        return "unknown"
-
-    primary_language = max(language_counts, key=language_counts.get)
-    print(f"Detection complete: {language_counts}")
-    return primary_language
-
-
-def install_python_dependencies(repo_path):
+def start_lint_pool():
     """
-    Recursively finds all 'requirements.txt' files and installs them.
+    (Re)creates the linter process pool. The pool forks all of its workers on
+    first use, so main() warms it up before any job threads exist.
     """
-    print("Searching for Python dependencies...")
-    found_requirements = False
-    for root, _, files in os.walk(repo_path):
-        if "requirements.txt" in files:
-            requirements_file = os.path.join(root, "requirements.txt")
-            print(f"Found dependencies file: {requirements_file}. Installing...")
-            found_requirements = True
-            try:
-                subprocess.run(
-                    ["pip", "install", "-r", requirements_file],
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                )
-                print(f"Successfully installed dependencies from {requirements_file}.")
-            except subprocess.CalledProcessError as e:
-                print(
-                    f"Failed to install dependencies from {requirements_file}: {e.stderr}"
-                )
-
-    if not found_requirements:
-        print("No requirements.txt found anywhere in the repository.")
+    global lint_pool
+    with lint_pool_lock:
+        if lint_pool is not None:
+            lint_pool.shutdown(wait=False, cancel_futures=True)
+        lint_pool = ProcessPoolExecutor(
+            max_workers=WORKER_CONCURRENCY,
+            mp_context=multiprocessing.get_context("fork"),
+        )
+        lint_pool.submit(os.getpid).result()
 
 
-def run_pyright_analysis(repo_path):
-    """Executes the Pyright language server on the given path"""
-    print("Starting Pyright analysis...")
+def run_in_lint_pool(func, *args):
+    """
+    Runs a linter stage in the process pool, restarting the pool if it broke,
+    and adds the resources its child processes used to the current job's.
+    """
     try:
-        command = ["pyright", "--outputjson", repo_path]
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-
-        pyright_output = json.loads(result.stdout)
-        diagnostics = pyright_output.get("generalDiagnostics", [])
-
-        print(f"Pyright analysis complete. Found {len(diagnostics)} diagnostics.")
-        return diagnostics
-    except subprocess.CalledProcessError as e:
-        print(f"Pyright execution failed: {e}")
-        print(f"Stderr: {e.stderr}")
-        return []
-    except json.JSONDecodeError:
-        print("Failed to parse Pyright JSON output.")
-        return []
-
-
-def parse_clang_tidy_output(output_text, repo_path):
-    """Parses the raw text output of clang-tidy into our standard diagnostic format."""
-    diagnostics = []
-    pattern = re.compile(r"(.+?):(\d+):(\d+):\s+(warning|error):\s+(.+?)\s+\[(.+?)\]")
-
-    for line in output_text.splitlines():
-        match = pattern.match(line)
-        if match:
-            file_path, line_num, _, severity, message, rule = match.groups()
-
-            diagnostics.append(
-                {
-                    "file": os.path.join(repo_path, file_path),
-                    "range": {"start": {"line": int(line_num) - 1, "character": 0}},
-                    "message": message.strip(),
-                    "severity": severity.upper(),
-                    "rule": rule.strip(),
-                }
-            )
-    return diagnostics
-
-
-def run_clang_tidy_analysis(repo_path):
-    """Finds all C/C++ files in a project and runs clang-tidy on them."""
-    print("Starting clang-tidy analysis on the full project...")
-
-    search_path = os.path.join(repo_path, "**")
-    files_to_check = [
-        f
-        for ext in ("*.c", "*.cpp", "*.h", "*.hpp")
-        for f in glob.glob(os.path.join(search_path, ext), recursive=True)
-    ]
-
-    if not files_to_check:
-        print("No C/C++ files found to analyze.")
-        return []
-
-    print(f"Found {len(files_to_check)} C/C++ files to analyze.")
+        result, usage = lint_pool.submit(governor.call_tracked, func, *args).result()
+    except BrokenProcessPool:
+        print("Linter process pool is broken. Restarting it...")
+        start_lint_pool()
+        result, usage = lint_pool.submit(governor.call_tracked, func, *args).result()
+    governor.record(usage)
+    return result
+
+
+def map_in_lint_pool(func, items):
+    """Fans func out over items in the process pool and returns the results."""
+    tracked = partial(governor.call_tracked, func)
     try:
-        command = ["clang-tidy"] + files_to_check
-        result = subprocess.run(command, capture_output=True, text=True)
-
-        print("Clang-tidy analysis complete. Parsing output...")
-        diagnostics = parse_clang_tidy_output(result.stdout, repo_path)
-        print(f"Parsed {len(diagnostics)} total diagnostics from clang-tidy.")
-        return diagnostics
-
-    except Exception as e:
-        print(f"Failed to run clang-tidy: {e}")
-        return []
-
-
-def install_node_dependencies(repo_path):
-    """Installs Node dependencies if package.json exists."""
-    print("Checking for Node.js dependencies...")
-    package_json = os.path.join(repo_path, "package.json")
-
-    if os.path.exists(package_json):
-        print("Found package.json. Installing dependencies...")
-
-        try:
-            subprocess.run(
-                ["npm", "install", "--ignore-scripts", "--legacy-peer-deps"],
-                cwd=repo_path,
-                check=True,
-                capture_output=True,
-                text=True,
-            )
-            print("Node dependencies installed.")
-        except subprocess.CalledProcessError as e:
-            print(f"Failed to install Node dependencies: {e.stderr}")
+        outcomes = list(lint_pool.map(tracked, items))
+    except BrokenProcessPool:
+        print("Linter process pool is broken. Restarting it...")
+        start_lint_pool()
+        outcomes = list(lint_pool.map(tracked, items))
+    for _, usage in outcomes:
+        governor.record(usage)
+    return [result for result, _ in outcomes]
+
+
+def run_cached_analysis(
+    repo_name, repo_path, tool, version, config_files, files, run, extra="", keys=None
+):
+    """
+    Serves diagnostics for unchanged file blobs from the diagnostics cache and
+    calls run(files) only for the rest. keys, if given, maps the {path: blob
+    SHA} of the files to the keys they are cached under instead. Results of a
+    failed run (None), or of the files a partial one lists as failed, are not
+    cached. In "full" scope (files is None) the cache is bypassed.
+    """
+    if files is None:
+        return run(None) or []
+
+    namespace = diagnostics_cache.namespace(
+        repo_name, tool, version, repo_path, config_files, extra
+    )
+    blobs = blob_hashes(repo_path, files)
+    if keys is not None:
+        blobs = keys(blobs)
+    cached, missing = diagnostics_cache.lookup(namespace, blobs)
+
+    diagnostics = run(missing) if missing else []
+    if diagnostics is None:
+        diagnostics = []
     else:
-        print("No package.json found. Skipping npm install.")
-
-
-def parse_eslint_output(json_output, repo_path):
-    """Parse ESLint JSON output info standard diagnostics."""
-    diagnostics = []
-    try:
-        results = json.loads(json_output)
-        for file_result in results:
-            file_path = file_result.get("filePath", "")
-            for message in file_result.get("mesages", []):
-                diagnostics.append(
-                    {
-                        "file": file_path,
-                        "range": {
-                            "start": {
-                                "line": message.get("line", 1) - 1,
-                                "character": message.get("column", 1),
-                            }
-                        },
-                        "message": message.get("message"),
-                        "severity": "ERROR"
-                        if message.get("severity") == 2
-                        else "WARNING",
-                        "rule": message.get("ruleId", "unknown"),
-                    }
-                )
-    except json.JSONDecodeError:
-        print("Failed to parse ESLint JSON.")
+        failed = set(getattr(diagnostics, "failed", ()))
+        by_path = {path: [] for path in missing if path not in failed}
+        for diag in diagnostics:
+            relative_path = os.path.relpath(diag.get("file", ""), repo_path)
+            if relative_path in by_path:
+                by_path[relative_path].append({**diag, "file": relative_path})
+        diagnostics_cache.store(namespace, blobs, by_path)
+
+    for path_diagnostics in cached.values():
+        for diag in path_diagnostics:
+            diagnostics.append({**diag, "file": os.path.join(repo_path, diag["file"])})
     return diagnostics
 
 
-def run_eslint_analysis(repo_path):
-    """Runs ESLint on the repository."""
-
-    print("Starting ESLint analysis...")
-    try:
-        command = ["npx", "eslint", ".", "--format", "json"]
-
-        result = subprocess.run(command, cwd=repo_path, capture_output=True, text=True)
-
-        if result.stdout:
-            print("ESLint analysis complete. Parsing output...")
-            return parse_eslint_output(result.stdout, repo_path)
-        else:
-            print(f"ESLint produced no output. Stderr: {result.stderr}")
-            return []
-
-    except Exception as e:
-        print(f"Failed to run ESLint: {e}")
-        return []
-
-
 def analyze_repository(repo_id, repo_name, clone_url):
+    """
+    Generates and saves a project summary. Summaries are cached by the
+    repository's root tree, so an unchanged repository is answered from
+    Redis; otherwise the summary is built from git objects alone, with no
+    checkout.
+    """
     print(f"Starting repository analysis for {repo_name}...")
-    repo_path = os.path.join(CLONE_DIR, repo_name.replace("/", "_"), "analysis")
 
     try:
         auth_clone_url = clone_url.replace("https://", f"https://oauth2:{GITHUB_PAT}@")
-        if os.path.exists(repo_path):
-            shutil.rmtree(repo_path)
-
-        print(f"Cloning {repo_name}...")
-        git.Repo.clone_from(auth_clone_url, repo_path)
-
-        readme_content = "No README found."
-        file_structure = []
-
-        for name in ["README.md", "readme.md", "README.txt"]:
-            p = os.path.join(repo_path, name)
-            if os.path.exists(p):
-                with open(p, "r", errors="ignore") as f:
-                    readme_content = f.read()[:5000]
-                break
-
-        for root, dirs, files in os.walk(repo_path):
-            level = root.replace(repo_path, "").count(os.sep)
-            if level < 2:
-                indent = " " * 4 * level
-                file_structure.append(f"{indent}{os.path.basename(root)}/")
-                for f in files[:10]:
-                    file_structure.append(f"{indent}    {f}")
-
-        structure_text = "\n".join(file_structure)
-
-        prompt = f"""
-        You are an expert technical writer. Please generate a concise, and detailed professional summary of the following software project.
-        
-        Project Name: {repo_name}
-        
-        File Structure:
-        {structure_text}
-        
-        README Content (Excerpt):
-        {readme_content}
-        
-        Please format the response in Markdown as follows:
-
-        1. **Summary:** Start directly with a 2-sentence "Elevator Pitch" describing the project. Do NOT use a header like "Elevator Pitch" or "Summary". Just write the text.
-        
-        2. **Tech Stack:** Use the header "### Tech Stack". List the primary languages and frameworks.
-        
-        3. **Key Features:** Use the header "### Key Features". Provide a bulleted list of 3-5 features inferred from the code structure. Bold the feature name (e.g. **Authentication:** Handles login...).
-        """
-
-        print("Asking Gemini for summary...")
-        response = ai_model.generate_content(prompt)
-        ai_description = response.text
-
-        repositories_collection.update_one(
-            {"_id": ObjectId(repo_id)},
-            {
-                "$set": {
-                    "ai_description": ai_description,
-                    "last_analyzed_at": datetime.utcnow(),
-                }
-            },
-        )
+        with span("resolve_head"):
+            commit = repo_cache.remote_head(auth_clone_url)
+        ai_description = commit and summary_cache.for_commit(repo_name, commit)
+        if not ai_description:
+            with timed_enter(
+                "checkout", repo_cache.snapshot(repo_name, auth_clone_url)
+            ) as (repo, commit):
+                tree_sha = repo.git.rev_parse(f"{commit}^{{tree}}")
+                ai_description = summary_cache.for_tree(repo_name, tree_sha)
+                if not ai_description:
+                    ai_description = summarize_repository(repo_name, repo, commit)
+            summary_cache.store(repo_name, commit, tree_sha, ai_description)
+        else:
+            print(f"Summary of {repo_name} at {commit[:7]} is cached.")
+
+        with span("save_result"):
+            repositories_collection.update_one(
+                {"_id": ObjectId(repo_id)},
+                {
+                    "$set": {
+                        "ai_description": ai_description,
+                        "last_analyzed_at": datetime.utcnow(),
+                    }
+                },
+            )
         print(f"Successfully updated repository description for {repo_name}")
     except Exception as e:
         print(f"Repository analysis failed: {e}")
-    finally:
-        if os.path.exists(repo_path):
-            shutil.rmtree(repo_path)
+        raise
 
 
-def format_comment_with_ai(diagnostics, diff_text):
-    """Uses an AI to format LSP diagnostic and review code for logic errors."""
+def summarize_repository(repo_name, repo, commit):
+    """Asks Gemini for a project summary of a repository at a commit."""
+    readme_content = read_readme(repo, commit) or "No README found."
+    structure_text = tree_outline(
+        repo, commit, repo_name.split("/")[-1], depth=SUMMARY_TREE_DEPTH
+    )
+
+    prompt = f"""
+    You are an expert technical writer. Please generate a concise, and detailed professional summary of the following software project.
+    
+    Project Name: {repo_name}
+    
+    File Structure:
+    {structure_text}
+    
+    README Content (Excerpt):
+    {readme_content}
+    
+    Please format the response in Markdown as follows:
+
+    1. **Summary:** Start directly with a 2-sentence "Elevator Pitch" describing the project. Do NOT use a header like "Elevator Pitch" or "Summary". Just write the text.
+    
+    2. **Tech Stack:** Use the header "### Tech Stack". List the primary languages and frameworks.
+    
+    3. **Key Features:** Use the header "### Key Features". Provide a bulleted list of 3-5 features inferred from the code structure. Bold the feature name (e.g. **Authentication:** Handles login...).
+    """
+
+    print("Asking Gemini for summary...")
+    with span("llm_summary"):
+        return llm.generate(prompt)
+
+
+def review_diff(diff_index, priority_paths):
+    """
+    Returns the diff part of the review prompt and the instruction that goes
+    with it. Diffs too large for one prompt are reviewed chunk by chunk in
+    parallel, files in priority_paths first, and the per-file findings are
+    passed on to be reduced into a single comment.
+    """
+    diff_text = diff_index.excerpt
+    if (
+        not diff_index.excerpt_truncated
+        and estimate_tokens(diff_text) <= REVIEW_CHUNK_TOKENS
+    ):
+        changes = f"""A pull request was submitted with the following changes (in diff format):
+    --- CODE DIFF ---
+    {diff_text}
+    --- END CODE DIFF ---"""
+        review_step = "Review the provided code diff for potential logic errors, unclear code, performance improvements, or violations of best practices."
+        return changes, review_step
+
+    chunks = split_into_chunks(diff_index.file_hunks(), REVIEW_CHUNK_TOKENS)
+    findings, skipped = review_chunks(
+        llm,
+        chunks,
+        REVIEW_TOKEN_BUDGET,
+        REVIEW_DEADLINE_SECONDS,
+        priority_paths,
+    )
+    findings_text = "\n\n".join(f"File {path}:\n{text}" for path, text in findings)
+    changes = f"""A large pull request was submitted. Each changed file was reviewed separately, with these findings:
+    --- FILE FINDINGS ---
+    {findings_text or "No issues were found in the reviewed files."}
+    --- END FILE FINDINGS ---"""
+    not_reviewed = [f"{path} (over the review budget or deadline)" for path in skipped]
+    not_reviewed += [
+        f"{path} ({reason})"
+        for path, reason in sorted(diff_index.unreviewed_files.items())
+        if path not in skipped
+    ]
+    if not_reviewed:
+        changes += f"\n    These files were left out of the review, in whole or in part: {', '.join(not_reviewed)}"
+    review_step = "Summarize the most important file findings above. Skip minor points and do not repeat the same issue for every file."
+    return changes, review_step
+
+
+def format_comment_with_ai(diagnostics, changes, review_step):
+    """
+    Uses an AI to format LSP diagnostic and review code for logic errors,
+    given the diff part of the prompt built by review_diff.
+    """
     print("Formatting comment with AI using full code context...")
 
     diag_summary = "No specific type or syntax errors were found by the linter."
     if diagnostics:
         diag_list = []
         for diag in diagnostics:
-            message = diag.get("message", "No message provided.")
-            rule = diag.get("rule", "general")
-            diag_list.append(f"- Rule `{rule}`: {message}")
+            diag_list.append(f"- Rule `{diag.rule}`: {diag.message}")
         diag_summary = (
             "A static analysis tool found the following specific issues:\n"
             + "\n".join(diag_list)
         )
 
-    max_diff_length = 4000
-    if len(diff_text) > max_diff_length:
-        diff_text = diff_text[:max_diff_length] + "\n\n (diff truncated due to length)"
-
     prompt = f"""
-    ou are an expert, friendly, and encouraging code reviewer bot. Your goal is to help developers improve their code.
+    You are an expert, friendly, and encouraging code reviewer bot. Your goal is to help developers improve their code.
 
-    A pull request was submitted with the following changes (in diff format):
-    --- CODE DIFF ---
-    {diff_text}
-    --- END CODE DIFF ---
+    {changes}
 
     {diag_summary}
 
     Please provide a single, concise, and helpful review comment for the pull request. Your comment should:
     1. Start with a positive and encouraging sentence.
     2. If there were specific linter issues, briefly and gently explain them.
-    3. Review the provided code diff for potential logic errors, unclear code, performance improvements, or violations of best practices.
+    3. {review_step}
     4. Phrase everything as a helpful suggestion, not a demand. Use a humble and collaborative tone.
     5. Do not use markdown headers. Structure your feedback as a single, easy-to-read comment.
     """
 
     try:
-        response = ai_model.generate_content(prompt)
-        return response.text
+        return llm.generate(prompt)
 
     except Exception as e:
         print(f"AI comment generation failed: {e}")
         return "I found a few potential issues, but I had trouble summarizing them. Please check the logs for details."
 
 
-def post_review_comment(pr, diagnostics, ai_comment, repo_path):
-    """Posts a single review comment to a pull request."""
+# Hidden tag on each in-line comment, so later reviews can tell what the
+# bot already pointed out.
+COMMENT_MARKER = "<!-- code-review-ai:{} -->"
+COMMENT_MARKER_PATTERN = re.compile(r"<!-- code-review-ai:([0-9a-f]+) -->")
+
+
+def diagnostic_fingerprint(diag):
+    """Identifies a finding across pushes, which may move it to another line."""
+    key = f"{diag.path}\0{diag.rule}\0{diag.message}".encode()
+    return hashlib.sha1(key).hexdigest()[:12]
+
+
+def posted_fingerprints(repo_name, pr_number):
+    """Returns the fingerprints of the in-line comments the bot left on a PR."""
+    fingerprints = set()
+    for comment in github.paginate(f"/repos/{repo_name}/pulls/{pr_number}/comments"):
+        match = COMMENT_MARKER_PATTERN.search(comment.get("body") or "")
+        if match:
+            fingerprints.add(match.group(1))
+    return fingerprints
+
+
+def post_review(repo_name, pr_number, head_sha, diagnostics, ai_comment, diff_index):
+    """
+    Posts the AI comment and an in-line comment per diagnostic as a single
+    review of head_sha. Each comment sits on the first line of its
+    diagnostic's span that the PR added, since GitHub rejects comments on
+    lines outside the diff. Diagnostics the bot commented on in an earlier
+    review of the PR are left out, so re-reviews only post what is new.
+    """
     if not ai_comment:
         return
 
+    seen = set()
     if diagnostics:
-        first_diag = diagnostics[0]
-        file_path = os.path.relpath(first_diag.get("file"), repo_path)
-        line_number = first_diag.get("range", {}).get("start", {}).get("line") + 1
-
-        print(f"Posting in-line comment to {file_path} at line {line_number}...")
-        try:
-            latest_commit = pr.get_commits().reversed[0]
-            pr.create_review_comment(
-                body=ai_comment,
-                commit=latest_commit,
-                path=file_path,
-                line=line_number,
-            )
-            print("Successfully posted in-line comment to Github.")
-        except Exception as e:
-            print(f"Failed to post in-line comment to Github: {e}")
-    else:
-        print("Posting general comment on the PR...")
         try:
-            pr.create_issue_comment(ai_comment)
-            print("Successfully posted general comment to Github.")
-        except Exception as e:
-            print(f"Failed to post general comment to Github: {e}")
-
-
-def save_analysis_result(repo_name, pr_number, diagnostics, ai_comment, language):
+            seen = posted_fingerprints(repo_name, pr_number)
+        except (requests.RequestException, RateLimitExhausted) as e:
+            print(f"Could not list earlier review comments: {e}")
+
+    comments, summaries = [], []
+    for diag in diagnostics:
+        fingerprint = diagnostic_fingerprint(diag)
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        file_diff = diff_index.files.get(diag.path)
+        line = file_diff and file_diff.first_added_line(diag.line, diag.end_line)
+        if not line:
+            continue
+        text = f"**{diag.severity}** `{diag.rule}`: {diag.message}"
+        summaries.append(f"- `{diag.path}:{line}` {text}")
+        comments.append(
+            {
+                "path": diag.path,
+                "line": line,
+                "side": "RIGHT",
+                "body": f"{text}\n\n{COMMENT_MARKER.format(fingerprint)}",
+            }
+        )
+    if len(comments) > REVIEW_MAX_COMMENTS:
+        print(f"Posting {REVIEW_MAX_COMMENTS} of {len(comments)} new in-line comments.")
+        comments = comments[:REVIEW_MAX_COMMENTS]
+        summaries = summaries[:REVIEW_MAX_COMMENTS]
+
+    review = {
+        "commit_id": head_sha,
+        "body": ai_comment,
+        "event": "COMMENT",
+        "comments": comments,
+    }
+    url = f"/repos/{repo_name}/pulls/{pr_number}/reviews"
+    print(f"Posting review with {len(comments)} in-line comments to PR #{pr_number}...")
+    try:
+        response = github.post(url, json=review)
+        # One comment on a line outside the diff fails the whole review.
+        if response.status_code == 422 and comments:
+            print(f"GitHub rejected the in-line comments: {response.text[:500]}")
+            review["body"] = ai_comment + "\n\n" + "\n".join(summaries)
+            review["comments"] = []
+            response = github.post(url, json=review)
+        response.raise_for_status()
+        print("Successfully posted review to Github.")
+    except (requests.RequestException, RateLimitExhausted) as e:
+        print(f"Failed to post review to Github: {e}")
+
+
+def save_analysis_result(
+    repo_name, pr_number, head_sha, diagnostics, ai_comment, language
+):
+    """
+    Saves the review for every user monitoring the repository. Reviews are
+    keyed on the PR's head commit, so a retried job leaves the first save in
+    place instead of adding another.
+    """
     try:
-        repos = list(db.repositories.find({"full_name": repo_name}))
+        repos = list(
+            repositories_collection.find({"full_name": repo_name}, {"userId": 1})
+        )
 
         if not repos:
             print(f"Warning: No users found monitoring {repo_name}. Review not saved.")
             return
 
-        for repo in repos:
-            user_id = repo.get("userId")
-
-            review_record = {
-                "userId": user_id,
+        analyzed_at = datetime.utcnow()
+        review_records = [
+            {
+                "_id": ObjectId(),
+                "userId": repo.get("userId"),
                 "repo_name": repo_name,
                 "pr_number": pr_number,
+                "head_sha": head_sha,
                 "language": language,
                 "issues_found": len(diagnostics),
                 "ai_comment": ai_comment,
-                "analyzed_at": datetime.utcnow(),
+                "analyzed_at": analyzed_at,
             }
-            reviews_collection.insert_one(review_record)
-            print(f"Saved analysis result for {repo_name} PR #{pr_number} to MongoDB.")
+            for repo in repos
+        ]
+        try:
+            result = reviews_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {
+                            "userId": record["userId"],
+                            "repo_name": repo_name,
+                            "pr_number": pr_number,
+                            "head_sha": head_sha,
+                        },
+                        {"$setOnInsert": record},
+                        upsert=True,
+                    )
+                    for record in review_records
+                ],
+                ordered=False,
+            )
+            created = set(result.upserted_ids.values())
+        except BulkWriteError as e:
+            # Another worker saved some of them first; count the rest.
+            created = {u["_id"] for u in e.details.get("upserted", [])}
+        # Only reviews this save created count towards the rollups; a retry
+        # finds the rest already there.
+        new_reviews = [r for r in review_records if r["_id"] in created]
+        if new_reviews:
+            rollups_collection.bulk_write(rollup_updates(new_reviews), ordered=False)
+        print(
+            f"Saved analysis result for {repo_name} PR #{pr_number} "
+            f"for {len(new_reviews)} of {len(review_records)} users to MongoDB."
+        )
 
     except Exception as e:
         print(f"Failed to save analysis result to MongoDB: {e}")
 
 
-def main():
-    """Main worker loop to process jobs from the Redis queue."""
-    redis_client = connect_to_redis()
-    print(f'Worker is listening for jobs on queue: "{PR_QUEUE_NAME}"')
-    while True:
-        repo_path = None
+def process_pull_request(payload):
+    """
+    Reviews a single pull request and posts the result to GitHub. The steps
+    run as a pipeline: the PR, its diff and the checkout are fetched at once,
+    and large diffs are reviewed by the LLM while the linter runs.
+    """
+    repo_data = payload.get("repository", [])
+    repo_name = repo_data.get("full_name")
+    clone_url = repo_data.get("clone_url")
+    pr_number = payload.get("number")
+
+    if not all([repo_name, clone_url, pr_number]):
+        raise PoisonJob("Payload missing required data.")
+
+    print(f"Processing PR #{pr_number} from {repo_name}")
+    diff_url = (
+        payload.get("pull_request", {}).get("diff_url")
+        or f"https://github.com/{repo_name}/pull/{pr_number}.diff"
+    )
+    auth_clone_url = clone_url.replace("https://", f"https://oauth2:{GITHUB_PAT}@")
+    pr_refspec = f"refs/pull/{pr_number}/head"
+    pipeline = Pipeline(
+        f"pr-{pr_number}",
+        default_timeout=STAGE_TIMEOUT_SECONDS,
+        timeouts=STAGE_TIMEOUTS,
+    )
+
+    # Jobs from the webhook and the poller carry the head SHA already.
+    def head_sha():
+        identity = job_identity(payload)
+        if identity is not None:
+            return identity[2]
+        response = github.get(f"/repos/{repo_name}/pulls/{pr_number}")
+        response.raise_for_status()
+        return response.json()["head"]["sha"]
+
+    def fetch_diff():
+        with requests.get(diff_url, stream=True, timeout=60) as diff_response:
+            diff_response.raise_for_status()
+            diff_index = parse_diff_stream(
+                diff_response.iter_content(chunk_size=64 * 1024),
+                max_excerpt_bytes=REVIEW_CHUNK_TOKENS * CHARS_PER_TOKEN,
+                max_hunk_bytes=REVIEW_TOKEN_BUDGET * CHARS_PER_TOKEN,
+                max_file_bytes=DIFF_MAX_FILE_BYTES,
+            )
+        for path, reason in diff_index.skipped_files.items():
+            print(f"Skipping {path}: {reason}.")
+        return diff_index
+
+    # Check out the PR head from the mirror cache; the worktree stays until
+    # the whole pipeline is done.
+    def checkout():
+        print(f"Fetching PR refspec: {pr_refspec}...")
+        repo_path = pipeline.enter_context(
+            repo_cache.checkout(
+                repo_name,
+                auth_clone_url,
+                ref=pr_refspec,
+                extra_refspecs=[f"+{pr_refspec}:{pr_refspec}"],
+            )
+        )
+        print(f"Successfully checked out code for PR #{pr_number}")
+        return repo_path
+
+    def find_analyzers(checkout, fetch_diff):
+        assigned = assign_files(fetch_diff.changed_files, checkout)
+        counts = {name: len(files) for name, files in assigned.items()}
+        print(f"Files to lint per analyzer: {counts or 'none'}")
+        missing = sorted(set(assigned) - set(INSTALLED_TOOLS))
+        if missing:
+            if worker_registry.has_capable_worker(assigned, WORKER_HEARTBEAT_TIMEOUT):
+                raise Reroute(sorted(assigned))
+            print(f"No live worker has {', '.join(missing)}. Linting without them.")
+            for name in missing:
+                del assigned[name]
+        return assigned
+
+    # Every analyzer with changed files runs at once, each on its own files.
+    def lint(analyzer, checkout, find_analyzers):
+        files = find_analyzers.get(analyzer.name)
+        if not files:
+            return []
+        context = AnalysisContext(
+            repo_name,
+            checkout,
+            env_cache,
+            pipeline.enter_context,
+            run_in_lint_pool,
+            map_in_lint_pool,
+            analyzer_host,
+        )
+        with span("install_dependencies"):
+            setup = analyzer.prepare(context)
+        return run_cached_analysis(
+            repo_name,
+            checkout,
+            analyzer.name,
+            analyzer.version(),
+            analyzer.config_files,
+            None if ANALYSIS_SCOPE == "full" else files,
+            lambda files: analyzer.run(context, files, setup),
+            extra=analyzer.cache_extra(context, setup),
+            keys=partial(analyzer.cache_keys, context),
+        )
+
+    def filter_diagnostics(fetch_diff, checkout, **lint_results):
+        relevant_diagnostics = []
+        for analyzer in ANALYZERS.values():
+            found = lint_results[f"lint_{analyzer.name}"]
+            relevant = filter_to_added_lines(found, fetch_diff, checkout)
+            DIAGNOSTICS.labels(analyzer.language, "found").inc(len(found))
+            DIAGNOSTICS.labels(analyzer.language, "relevant").inc(len(relevant))
+            relevant_diagnostics.extend(relevant)
+        print(f"Found {len(relevant_diagnostics)} relevant diagnostics on new lines.")
+        return relevant_diagnostics
+
+    # Runs alongside the linters, so chunks of lintable files go first
+    # rather than those with diagnostics.
+    def map_review(fetch_diff):
+        if pr_dedup.is_superseded(payload):
+            raise StageSkipped(f"PR #{pr_number} has a newer head commit.")
+        priority_paths = {
+            path for path in fetch_diff.changed_files if analyzer_for(path)
+        }
+        return review_diff(fetch_diff, priority_paths)
+
+    # A push while linting makes this review stale; skip the LLM calls.
+    def llm_review(map_review, filter_diagnostics, fetch_diff):
+        if not (filter_diagnostics or fetch_diff.total_bytes):
+            raise StageSkipped("Nothing to review.")
+        if pr_dedup.is_superseded(payload):
+            raise StageSkipped(f"PR #{pr_number} has a newer head commit.")
+        return format_comment_with_ai(filter_diagnostics, *map_review)
+
+    def post_comment(head_sha, filter_diagnostics, llm_review, fetch_diff):
+        post_review(
+            repo_name,
+            pr_number,
+            head_sha,
+            filter_diagnostics,
+            llm_review,
+            fetch_diff,
+        )
+
+    # Saved only once the comment is up, so the dashboard does not list a
+    # review the PR never got.
+    def save_result(
+        head_sha, post_comment, filter_diagnostics, llm_review, find_analyzers
+    ):
+        save_analysis_result(
+            repo_name,
+            pr_number,
+            head_sha,
+            filter_diagnostics,
+            llm_review,
+            primary_language(find_analyzers),
+        )
+
+    pipeline.add("head_sha", head_sha)
+    pipeline.add("fetch_diff", fetch_diff)
+    pipeline.add("checkout", checkout)
+    pipeline.add("find_analyzers", find_analyzers, deps=("checkout", "fetch_diff"))
+    lint_stages = []
+    for analyzer in ANALYZERS.values():
+        lint_stages.append(f"lint_{analyzer.name}")
+        pipeline.add(
+            lint_stages[-1],
+            partial(lint, analyzer),
+            deps=("checkout", "find_analyzers"),
+        )
+    pipeline.add(
+        "filter_diagnostics",
+        filter_diagnostics,
+        deps=("fetch_diff", "checkout", *lint_stages),
+    )
+    pipeline.add("map_review", map_review, deps=("fetch_diff",))
+    pipeline.add(
+        "llm_review",
+        llm_review,
+        deps=("map_review", "filter_diagnostics", "fetch_diff"),
+    )
+    pipeline.add(
+        "post_comment",
+        post_comment,
+        deps=("head_sha", "filter_diagnostics", "llm_review", "fetch_diff"),
+    )
+    pipeline.add(
+        "save_result",
+        save_result,
+        deps=(
+            "head_sha",
+            "post_comment",
+            "filter_diagnostics",
+            "llm_review",
+            "find_analyzers",
+        ),
+    )
+    pipeline.run()
+
+
+def handle_job(queue, job_json):
+    """
+    Dispatches a single queued job by its event type, then acks it, schedules
+    a retry, or dead-letters it depending on the outcome.
+    """
+    event_type, outcome, enqueued_at = "other", "ok", None
+    job_id_token = job_id_var.set(None)
+    with governor.track_job() as usage:
         try:
-            _, job_json = redis_client.brpop(PR_QUEUE_NAME, 0)
-            job_data = json.loads(job_json)
+            try:
+                job_data = json.loads(job_json)
+            except json.JSONDecodeError as e:
+                raise PoisonJob(f"Invalid job JSON: {e}") from e
+            if not isinstance(job_data, dict):
+                raise PoisonJob("Job is not a JSON object")
 
+            job_id_var.set(job_id_for(job_data))
             print("\n--- ✅ Job Received ---")
 
             event_type = job_data.get("eventType")
+            if event_type not in ("pull_request", "repository_analysis"):
+                event_type = "other"
+            enqueued_at = job_data.get("enqueuedAt")
+            if not isinstance(enqueued_at, (int, float)):
+                enqueued_at = None
+            if enqueued_at is not None:
+                QUEUE_WAIT_SECONDS.labels(event_type).observe(
+                    max(0, time.time() - enqueued_at)
+                )
 
             if event_type == "repository_analysis":
                 payload = job_data.get("payload", {})
@@ -465,121 +866,212 @@ def main():
                     payload.get("clone_url"),
                 )
                 print("--- Repository Analysis Complete ---")
-                continue
-            if event_type == "pull_request":
+            elif event_type == "pull_request":
                 if "payload" in job_data:
                     payload = job_data["payload"]
                 else:
                     payload = job_data
 
-                repo_data = payload.get("repository", [])
-                repo_name = repo_data.get("full_name")
-                clone_url = repo_data.get("clone_url")
-                pr_number = payload.get("number")
+                skip_reason = pr_dedup.skip_reason(payload)
+                if skip_reason:
+                    outcome = "dropped"
+                    print(f"Dropping PR job: {skip_reason}.")
+                else:
+                    process_pull_request(payload)
+                    pr_dedup.mark_done(payload)
+                    print("--- Job Complete ---\n")
+
+        except PoisonJob as e:
+            outcome = "dead"
+            queue.bury(job_json, e)
+        except Reroute as e:
+            outcome = "rerouted"
+            print(f"Handing the job to a worker that {e}.")
+            queue.reroute(job_json, e.tools, JOB_REROUTE_TIMEOUT)
+        except Exception as e:
+            outcome = "retry"
+            print(f"An error occurred: {e}")
+            queue.retry(job_json, e)
+        else:
+            queue.ack(job_json)
+        finally:
+            JOBS.labels(event_type, outcome).inc()
+            if enqueued_at is not None:
+                END_TO_END_SECONDS.labels(event_type, outcome).observe(
+                    max(0, time.time() - enqueued_at)
+                )
+            record_job_usage(event_type, usage)
+            job_id_var.reset(job_id_token)
+
+
+def record_job_usage(event_type, usage):
+    """Logs and exports what a job's child processes used."""
+    totals = usage.as_dict()
+    if not totals["processes"]:
+        return
+    log_event("job_resources", event_type=event_type, **totals)
+    JOB_PEAK_RSS_BYTES.labels(event_type).observe(totals["peak_rss_bytes"])
+    JOB_CPU_SECONDS.labels(event_type).observe(totals["cpu_seconds"])
+    if totals["limits_hit"]:
+        CHILD_LIMITS_HIT.labels(event_type).inc(totals["limits_hit"])
+
 
-                if not all([repo_name, clone_url, pr_number]):
-                    print("Payload missing required data.")
-                    continue
+def log_lane_stats(queue):
+    """Prints per-lane queue depth and wait times while there is a backlog."""
+    stats = queue.lane_stats()
+    if not any(lane["depth"] for lane in stats.values()):
+        return
+    print(
+        "Queue lanes: "
+        + ", ".join(
+            f"{name} depth={lane['depth']} avg_wait={lane['avg_wait_seconds']:.1f}s "
+            f"last_wait={lane['last_wait_seconds']:.1f}s"
+            for name, lane in stats.items()
+        )
+    )
 
-                print(f"Processing PR #{pr_number} from {repo_name}")
 
-                repo = gh_client.get_repo(repo_name)
-                pr = repo.get_pull(pr_number)
+def running_job_ids(job_jsons):
+    job_ids = []
+    for job_json in job_jsons:
+        job_data = decode_job(job_json)
+        if job_data is not None:
+            job_ids.append(job_id_for(job_data))
+    return job_ids
 
-                diff_response = requests.get(pr.diff_url)
-                diff_response.raise_for_status()
-                diff_text = diff_response.text
-                added_lines_map = parse_diff_to_get_added_lines(diff_response.text)
-                changed_files = list(added_lines_map.keys())
 
-                language = detect_language(changed_files)
-                print(f"Detected primary language of PR:{language}")
+def request_shutdown(signum, frame):
+    print(f"Received signal {signum}. Finishing in-flight jobs before exit...")
+    shutdown_event.set()
 
-                # Clone repo and install dependencies
-                repo_path = os.path.join(
-                    CLONE_DIR, repo_name.replace("/", "_"), str(pr_number)
-                )
-                auth_clone_url = clone_url.replace(
-                    "https://", f"https://oauth2:{GITHUB_PAT}@"
-                )
-                print(f"Cloning default branch of {repo_name}...")
-                cloned_repo = git.Repo.clone_from(auth_clone_url, repo_path)
-                pr_refspec = f"refs/pull/{pr_number}/head"
-                local_pr_branch = f"pr-{pr_number}"
-                print(f"Fetching PR refspec: {pr_refspec}...")
-                cloned_repo.git.fetch("origin", f"{pr_refspec}:{local_pr_branch}")
-                cloned_repo.git.checkout(local_pr_branch)
-                print(f"Successfully checked out code for PR #{pr_number}")
-
-                # Filter diagnostics and run LSP
-                relevant_diagnostics = []
-                if language == "python":
-                    install_python_dependencies(repo_path)
-                    diagnostics = run_pyright_analysis(repo_path)
-                    for diag in diagnostics:
-                        file_path = diag.get("file")
-                        if file_path.startswith(repo_path):
-                            relative_path = os.path.relpath(file_path, repo_path)
-                            start_line = (
-                                diag.get("range", {}).get("start", {}).get("line")
-                            )
-
-                            if relative_path in added_lines_map:
-                                if (start_line + 1) in added_lines_map[relative_path]:
-                                    relevant_diagnostics.append(diag)
-                elif language == "c":
-                    diagnostics = run_clang_tidy_analysis(repo_path)
-                    for diag in diagnostics:
-                        file_path = diag.get("file", "")
-                        if file_path.startswith(repo_path):
-                            relative_path = os.path.relpath(file_path, repo_path)
-                            start_line = (
-                                diag.get("range", {}).get("start", {}).get("line")
-                            )
-
-                            if relative_path in added_lines_map:
-                                if (start_line + 1) in added_lines_map[relative_path]:
-                                    relevant_diagnostics.append(diag)
-
-                elif language == "javascript":
-                    install_node_dependencies(repo_path)
-                    diagnostics = run_eslint_analysis(repo_path)
-
-                    for diag in diagnostics:
-                        file_path = diag.get("file", "")
-                        if file_path.startswith(repo_path):
-                            relative_path = os.path.relpath(file_path, repo_path)
-                            start_line = (
-                                diag.get("range", {}).get("start", {}).get("line")
-                            )
-                            if relative_path in added_lines_map:
-                                if (start_line + 1) in added_lines_map[relative_path]:
-                                    relevant_diagnostics.append(diag)
-
-                print(
-                    f"Found {len(relevant_diagnostics)} relevant diagnostics on new lines."
-                )
 
-                if relevant_diagnostics or diff_text:
-                    ai_comment = format_comment_with_ai(relevant_diagnostics, diff_text)
-                    post_review_comment(pr, relevant_diagnostics, ai_comment, repo_path)
+def main():
+    """
+    Main worker loop. Runs up to WORKER_CONCURRENCY jobs at once, fewer while
+    memory is under pressure, and only pops a job from the Redis queue when a
+    slot is free. On SIGTERM/SIGINT it stops
+    pulling, waits SHUTDOWN_GRACE_SECONDS for in-flight jobs and pushes any
+    that are still running back onto the queue.
+    """
+    if LOG_FORMAT == "json":
+        install_json_logs()
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
 
-                    save_analysis_result(
-                        repo_name, pr_number, relevant_diagnostics, ai_comment, language
-                    )
+    redis_client = connect_to_redis()
+    queue = ReliableQueue(
+        redis_client,
+        PR_QUEUE_NAME,
+        WORKER_ID,
+        visibility_timeout=JOB_VISIBILITY_TIMEOUT,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        backoff_base=JOB_RETRY_BACKOFF_SECONDS,
+        lane_weights=JOB_LANE_WEIGHTS,
+        repo_concurrency=JOB_REPO_CONCURRENCY,
+        tools=INSTALLED_TOOLS,
+    )
+    start_lint_pool()
+    concurrency = governor.AdaptiveConcurrency(
+        WORKER_CONCURRENCY,
+        high_pressure=MEMORY_PRESSURE_HIGH,
+        low_pressure=MEMORY_PRESSURE_LOW,
+        min_available=MEMORY_MIN_AVAILABLE,
+    )
+    start_metrics_server(
+        METRICS_PORT,
+        StatsCollector(
+            env_cache, diagnostics_cache, llm, queue, analyzer_host, concurrency
+        ),
+    )
+
+    slots = threading.BoundedSemaphore(WORKER_CONCURRENCY)
+    job_executor = ThreadPoolExecutor(
+        max_workers=WORKER_CONCURRENCY, thread_name_prefix="job"
+    )
+    in_flight = {}
+    in_flight_lock = threading.Lock()
+    next_housekeeping = 0
+
+    def on_job_done(future):
+        with in_flight_lock:
+            in_flight.pop(future, None)
+        slots.release()
+
+    print(
+        f'Worker {WORKER_ID} is listening for jobs on queue: "{PR_QUEUE_NAME}" '
+        f"with concurrency {WORKER_CONCURRENCY} and analyzers: "
+        f"{', '.join(INSTALLED_TOOLS) or 'none'}"
+    )
+    while not shutdown_event.is_set():
+        try:
+            if time.time() >= next_housekeeping:
+                with in_flight_lock:
+                    running = list(in_flight.values())
+                queue.extend(running)
+                worker_registry.heartbeat(running_job_ids(running))
+                queue.promote_due()
+                queue.reap_expired()
+                log_lane_stats(queue)
+                if analyzer_host is not None:
+                    analyzer_host.reap_idle()
+                concurrency.update()
+                next_housekeeping = time.time() + min(
+                    REAPER_INTERVAL_SECONDS, JOB_VISIBILITY_TIMEOUT / 3
+                )
 
-                print("--- Job Complete ---\n")
+            if not slots.acquire(timeout=1):
+                continue
+            # Under memory pressure, leave some of the slots unused.
+            with in_flight_lock:
+                busy = len(in_flight)
+            if busy >= concurrency.limit:
+                slots.release()
+                shutdown_event.wait(1)
+                continue
 
+            try:
+                job_json = queue.claim(timeout=1)
+            except Exception:
+                slots.release()
+                raise
+        except redis.exceptions.ConnectionError as e:
+            print(f"Redis connection lost: {e}. Reconnecting...")
+            connect_to_redis()
+            continue
         except Exception as e:
-            print(f"An error occurred: {e}")
-            time.sleep(5)
-            if not redis_client.ping():
-                print("Redis connection lost. Reconnecting...")
-                redis_client = connect_to_redis()
-        finally:
-            if repo_path and os.path.exists(repo_path):
-                print(f"Cleaning up directory: {repo_path}")
-                shutil.rmtree(repo_path)
+            # One bad job or Redis reply must not take the worker down.
+            print(f"Worker loop error: {e}")
+            shutdown_event.wait(1)
+            continue
+
+        if job_json is None:
+            slots.release()
+            continue
+
+        future = job_executor.submit(handle_job, queue, job_json)
+        with in_flight_lock:
+            in_flight[future] = job_json
+        future.add_done_callback(on_job_done)
+
+    with in_flight_lock:
+        pending = dict(in_flight)
+    print(
+        f"Waiting up to {SHUTDOWN_GRACE_SECONDS}s for {len(pending)} in-flight jobs..."
+    )
+    _, not_done = wait(pending, timeout=SHUTDOWN_GRACE_SECONDS)
+
+    for future in not_done:
+        queue.requeue(pending[future])
+    if not_done:
+        print(f"Returned {len(not_done)} unfinished jobs to the queue.")
+
+    lint_pool.shutdown(wait=False, cancel_futures=True)
+    if analyzer_host is not None:
+        analyzer_host.close()
+    worker_registry.deregister()
+    clients.close_all()
+    # Job threads cannot be interrupted; exit without joining the unfinished ones.
+    os._exit(0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import socket
+
+# Read by the orchestrator, which retries the jobs of workers whose
+# heartbeats stop.
+WORKERS_KEY = "pr_workers"
+HEARTBEATS_KEY = "pr_workers:heartbeats"
+
+
+class WorkerRegistry:
+    """
+    Publishes this worker's liveness and status to Redis: a heartbeat
+    timestamp, the jobs it is running, its load and the analyzers it has
+    installed. Other workers consult the registry before handing a job on
+    to one with tools they lack.
+    """
+
+    def __init__(self, redis_client, worker_id, tools, languages, concurrency):
+        self.redis = redis_client
+        self.worker_id = worker_id
+        self.tools = sorted(tools)
+        self.languages = sorted(languages)
+        self.concurrency = concurrency
+        self.started_at = time.time()
+
+    def heartbeat(self, job_ids):
+        now = time.time()
+        status = {
+            "id": self.worker_id,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "heartbeat_at": now,
+            "jobs": job_ids,
+            "load": len(job_ids) / self.concurrency,
+            "loadavg": os.getloadavg()[0],
+            "concurrency": self.concurrency,
+            "capabilities": {"tools": self.tools, "languages": self.languages},
+        }
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(WORKERS_KEY, self.worker_id, json.dumps(status))
+        pipe.zadd(HEARTBEATS_KEY, {self.worker_id: now})
+        pipe.execute()
+
+    def deregister(self):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hdel(WORKERS_KEY, self.worker_id)
+        pipe.zrem(HEARTBEATS_KEY, self.worker_id)
+        pipe.execute()
+
+    def has_capable_worker(self, tools, heartbeat_timeout):
+        """Returns whether a live worker other than this one has all of tools."""
+        cutoff = time.time() - heartbeat_timeout
+        worker_ids = [
+            worker_id
+            for worker_id in self.redis.zrangebyscore(HEARTBEATS_KEY, cutoff, "+inf")
+            if worker_id != self.worker_id
+        ]
+        if not worker_ids:
+            return False
+        for status in self.redis.hmget(WORKERS_KEY, worker_ids):
+            if status and set(tools) <= set(
+                json.loads(status)["capabilities"]["tools"]
+            ):
+                return True
+        return False
@@ -16,6 +16,38 @@ const JWT_SECRET = process.env.JWT_SECRET;
 const REDIS_URL = process.env.REDIS_URL;
 const PUBLIC_URL = process.env.PUBLIC_URL || "http://localhost:5173";
 
+const PR_DEDUP_TTL = parseInt(process.env.PR_DEDUP_TTL || 7 * 24 * 3600, 10);
+// pull_request actions that change what there is to review. Labels,
+// assignees, edits and closing do not.
+const REVIEWED_PR_ACTIONS = new Set([
+  "opened",
+  "synchronize",
+  "reopened",
+  "ready_for_review",
+]);
+
+// Marks a PR head SHA as enqueued, records it as the PR's latest head and
+// pushes the job in one step, unless the SHA was already queued. The head
+// only moves to a SHA whose PR update time (ARGV[4], epoch seconds) is not
+// older than the head's. Shared with the orchestrator's poller
+// (orchestrator-service/pr_dedup.py); scripts/check_shared_copies.py fails
+// if the two differ.
+const ENQUEUE_PR_SCRIPT = `
+if not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[3]) then
+    return 0
+end
+local updated_at = tonumber(ARGV[4])
+local head_at = tonumber(redis.call('GET', KEYS[4]))
+if not (updated_at and head_at) or updated_at >= head_at then
+    redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[3])
+    if updated_at then
+        redis.call('SET', KEYS[4], ARGV[4], 'EX', ARGV[3])
+    end
+end
+redis.call('LPUSH', KEYS[3], ARGV[2])
+return 1
+`;
+
 let db;
 let redisClient;
 
@@ -250,14 +282,16 @@ app.get("/api/dashboard/stats", protectRoute, async (req, res) => {
       userId: req.user.userId,
     });
 
+    // Rollups hold one document per repository and day, written by the
+    // worker as it saves reviews (see analysis-service/review_rollups.py).
     const reviewStats = await db
-      .collection("reviews")
+      .collection("review_rollups")
       .aggregate([
         { $match: { userId: req.user.userId } },
         {
           $group: {
             _id: null,
-            totalReviews: { $sum: 1 },
+            totalReviews: { $sum: "$reviews" },
             totalIssues: { $sum: "$issues_found" },
           },
         },
@@ -267,17 +301,10 @@ app.get("/api/dashboard/stats", protectRoute, async (req, res) => {
     const stats = reviewStats[0] || { totalReviews: 0, totalIssues: 0 };
 
     const chartDataRaw = await db
-      .collection("reviews")
+      .collection("review_rollups")
       .aggregate([
         { $match: { userId: req.user.userId } },
-        {
-          $group: {
-            _id: {
-              $dateToString: { format: "%Y-%m-%d", date: "$analyzed_at" },
-            },
-            prs: { $sum: 1 },
-          },
-        },
+        { $group: { _id: "$day", prs: { $sum: "$reviews" } } },
         { $sort: { _id: 1 } },
         { $limit: 30 },
       ])
@@ -387,15 +414,51 @@ app.post("/api/webhook", async (req, res) => {
   const githubEvent = req.headers["x-github-event"];
   console.log(`Webhook received! Event type: ${githubEvent}`);
 
-  if (githubEvent === "pull_request") {
+  if (
+    githubEvent === "pull_request" &&
+    REVIEWED_PR_ACTIONS.has(req.body.action)
+  ) {
     try {
       const jobData = {
         eventType: githubEvent,
+        source: "webhook",
+        enqueuedAt: Date.now() / 1000,
         payload: req.body,
       };
-      await redisClient.lPush("pr_queue", JSON.stringify(jobData));
-      console.log("Job pushed to Redis queue.");
-      res.status(202).send("Accepted and queued for processing.");
+      const repoName = req.body.repository?.full_name?.toLowerCase();
+      const prNumber = req.body.number;
+      const headSha = req.body.pull_request?.head?.sha;
+      const updatedAt = Date.parse(req.body.pull_request?.updated_at) / 1000;
+
+      if (!repoName || !prNumber || !headSha) {
+        await redisClient.lPush("pr_queue", JSON.stringify(jobData));
+        console.log("Job pushed to Redis queue.");
+        return res.status(202).send("Accepted and queued for processing.");
+      }
+
+      const pushed = await redisClient.eval(ENQUEUE_PR_SCRIPT, {
+        keys: [
+          `pr_dedup:seen:${repoName}:${prNumber}:${headSha}`,
+          `pr_dedup:head:${repoName}:${prNumber}`,
+          "pr_queue",
+          `pr_dedup:head_at:${repoName}:${prNumber}`,
+        ],
+        arguments: [
+          headSha,
+          JSON.stringify(jobData),
+          String(PR_DEDUP_TTL),
+          Number.isNaN(updatedAt) ? "" : String(updatedAt),
+        ],
+      });
+      if (pushed) {
+        console.log("Job pushed to Redis queue.");
+        res.status(202).send("Accepted and queued for processing.");
+      } else {
+        console.log(
+          `Commit ${headSha} of ${repoName}#${prNumber} already queued.`,
+        );
+        res.status(200).send("Commit already queued for processing.");
+      }
     } catch (error) {
       console.error("Failed to queue job:", error);
       res.status(500).send("Internal Server Error.");
@@ -424,6 +487,8 @@ app.post("/api/repositories/:id/analyze", protectRoute, async (req, res) => {
 
     const jobData = {
       eventType: "repository_analysis",
+      source: "user",
+      enqueuedAt: Date.now() / 1000,
       payload: {
         repo_id: id,
         repo_name: repo.full_name,
@@ -467,6 +532,31 @@ app.delete("/api/repositories/:id", protectRoute, async (req, res) => {
   }
 });
 
+// Indexes backing the dashboard queries and the worker's lookup of the
+// users monitoring a repository. createIndexes is a no-op for existing ones.
+const ensureIndexes = async () => {
+  await db.collection("reviews").createIndexes([
+    { key: { userId: 1, analyzed_at: -1 } },
+    { key: { userId: 1, repo_name: 1, analyzed_at: -1 } },
+    // One review per user and head commit; older reviews have no head_sha.
+    {
+      key: { userId: 1, repo_name: 1, pr_number: 1, head_sha: 1 },
+      unique: true,
+      partialFilterExpression: { head_sha: { $type: "string" } },
+    },
+  ]);
+  // Unique, so concurrent upserts from the workers cannot split a day.
+  await db
+    .collection("review_rollups")
+    .createIndex({ userId: 1, repo_name: 1, day: 1 }, { unique: true });
+  await db.collection("repositories").createIndexes([
+    { key: { full_name: 1 } },
+    { key: { userId: 1 } },
+  ]);
+  await db.collection("users").createIndex({ githubId: 1 });
+  console.log("MongoDB indexes are in place.");
+};
+
 const startServer = async () => {
   try {
     redisClient = createClient({ url: REDIS_URL });
@@ -478,6 +568,7 @@ const startServer = async () => {
     await mongoClient.connect();
     db = mongoClient.db("code-reviewer-ai-db");
     console.log("Successfully connected to MongoDB Atlas!");
+    await ensureIndexes();
 
     app.listen(PORT, () => {
       console.log(`Ingestion service listening on port ${PORT}`);
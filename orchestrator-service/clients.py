@@ -0,0 +1,85 @@
+import os
+import threading
+
+# The analysis and orchestrator services each ship a copy of this module;
+# scripts/check_shared_copies.py fails if the two differ.
+
+_factories = {}
+_clients = {}
+_lock = threading.Lock()
+# Clients inherited from the parent across a fork. Kept referenced so that
+# garbage collection in the child never closes the parent's connections.
+_inherited = []
+
+
+def register(name, factory):
+    """Names a zero-argument factory for a client that get() builds on first use."""
+    _factories[name] = factory
+
+
+def get(name):
+    """Returns this process's client for name, creating it on first use."""
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = _factories[name]()
+    return client
+
+
+def lazy(name, *keys):
+    """
+    Returns a stand-in for get(name)[keys[0]][keys[1]]... that resolves it on
+    every use, so module-level clients and collections cost nothing at import
+    and follow the process across forks.
+    """
+    return LazyClient(name, keys)
+
+
+class LazyClient:
+    __slots__ = ("_name", "_keys")
+
+    def __init__(self, name, keys):
+        self._name = name
+        self._keys = keys
+
+    def _resolve(self):
+        target = get(self._name)
+        for key in self._keys:
+            target = target[key]
+        return target
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __repr__(self):
+        path = "".join(f"[{key!r}]" for key in self._keys)
+        return f"<lazy {self._name}{path}>"
+
+
+def close_all():
+    """Closes every client this process created."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                print(f"Failed to close {type(client).__name__}: {e}")
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.Lock()
+    _inherited.extend(_clients.values())
+    _clients.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,94 @@
+import json
+import time
+
+LEADER_KEY = "orchestrator:leader"
+# Written by the analysis workers: status JSON per worker ID, and the time
+# of each worker's last heartbeat.
+WORKERS_KEY = "pr_workers"
+HEARTBEATS_KEY = "pr_workers:heartbeats"
+
+# Extends the lease only if this instance still holds it.
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """
+    Leader election over a Redis key holding the leader's ID with a TTL. The
+    leader renews the lease well within its TTL; if it dies, the key expires
+    and the next instance to try takes over, so at most one instance leads
+    at a time (short of a Redis failover).
+    """
+
+    def __init__(self, redis_client, holder, ttl_seconds, key=LEADER_KEY):
+        self.redis = redis_client
+        self.holder = holder
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.key = key
+        self.is_leader = False
+        self._renew = redis_client.register_script(RENEW_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    def acquire(self):
+        """Takes or renews the lease and returns whether this instance leads."""
+        leading = bool(
+            self._renew(keys=[self.key], args=[self.holder, self.ttl_ms])
+        ) or bool(self.redis.set(self.key, self.holder, nx=True, px=self.ttl_ms))
+        if leading != self.is_leader:
+            print(
+                f"{self.holder} is now the leader."
+                if leading
+                else f"{self.holder} lost leadership."
+            )
+        self.is_leader = leading
+        return leading
+
+    def release(self):
+        if self.is_leader:
+            self._release(keys=[self.key], args=[self.holder])
+            self.is_leader = False
+
+
+def live_workers(redis_client, heartbeat_timeout):
+    """Returns the statuses of workers that sent a heartbeat recently."""
+    cutoff = time.time() - heartbeat_timeout
+    worker_ids = redis_client.zrangebyscore(HEARTBEATS_KEY, cutoff, "+inf")
+    if not worker_ids:
+        return []
+    statuses = redis_client.hmget(WORKERS_KEY, worker_ids)
+    return [json.loads(status) for status in statuses if status]
+
+
+def recover_dead_workers(redis_client, queue_name, heartbeat_timeout):
+    """
+    Expires the leases of jobs held by workers that stopped sending
+    heartbeats, so the next lease reaper retries them right away instead of
+    after the visibility timeout, and drops the workers from the registry.
+    Returns the IDs of the dead workers.
+    """
+    cutoff = time.time() - heartbeat_timeout
+    dead = redis_client.zrangebyscore(HEARTBEATS_KEY, "-inf", f"({cutoff}")
+    for worker_id in dead:
+        jobs = redis_client.lrange(f"{queue_name}:processing:{worker_id}", 0, -1)
+        if jobs:
+            redis_client.hset(
+                f"{queue_name}:leases:{worker_id}", mapping={job: 0 for job in jobs}
+            )
+        print(
+            f"Worker {worker_id} missed its heartbeats; "
+            f"released {len(jobs)} of its jobs for retry."
+        )
+        redis_client.zrem(HEARTBEATS_KEY, worker_id)
+        redis_client.hdel(WORKERS_KEY, worker_id)
+    return dead
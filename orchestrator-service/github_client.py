@@ -0,0 +1,100 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# The analysis and orchestrator services each ship a copy of this module;
+# scripts/check_shared_copies.py fails if the two differ.
+
+
+class RateLimitExhausted(Exception):
+    pass
+
+
+class RateLimitBudget:
+    """
+    Tracks the core rate limit GitHub reports on every response and turns it
+    into how many more requests this process may spend before the window
+    resets, keeping `reserve` requests for the rest of the system.
+    """
+
+    def __init__(self, reserve=0):
+        self.reserve = reserve
+        self.remaining = None
+        self.reset_at = 0
+        self.lock = threading.Lock()
+
+    def update(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset_at = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset_at is None:
+            return
+        with self.lock:
+            self.remaining = int(remaining)
+            self.reset_at = int(reset_at)
+
+    def available(self):
+        """Returns the requests that may still be spent, or None if unknown."""
+        with self.lock:
+            if self.remaining is None or time.time() >= self.reset_at:
+                return None
+            return max(0, self.remaining - self.reserve)
+
+
+class GitHubClient:
+    """
+    Thin GitHub REST client over one pooled requests.Session. Every request
+    is checked against, and updates, the client's rate limit budget; once
+    the budget is spent, requests raise RateLimitExhausted until the reset.
+    """
+
+    def __init__(
+        self,
+        token,
+        api_url="https://api.github.com",
+        pool_size=10,
+        reserve=0,
+        timeout=30,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.rate_limit = RateLimitBudget(reserve)
+        self.session = requests.Session()
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+            }
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        """Sends a request to an absolute URL or to a path under the API URL."""
+        if self.rate_limit.available() == 0:
+            raise RateLimitExhausted("GitHub rate limit budget is spent.")
+        if not url.startswith(("https://", "http://")):
+            url = f"{self.api_url}{url}"
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, url, **kwargs)
+        self.rate_limit.update(response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def paginate(self, url, **kwargs):
+        """Yields the items of every page of a list endpoint."""
+        params = {"per_page": 100, **kwargs.pop("params", {})}
+        response = self.get(url, params=params, **kwargs)
+        response.raise_for_status()
+        yield from response.json()
+        while "next" in response.links:
+            response = self.get(response.links["next"]["url"], **kwargs)
+            response.raise_for_status()
+            yield from response.json()
@@ -0,0 +1,74 @@
+import os
+from datetime import datetime
+
+PR_DEDUP_TTL = int(os.getenv("PR_DEDUP_TTL", 7 * 24 * 3600))
+
+# Marks a PR head SHA as enqueued, records it as the PR's latest head and
+# pushes the job, all in one step; does nothing if the SHA was already seen.
+# The head only moves to a SHA whose PR update time (ARGV[4], epoch seconds)
+# is not older than the head's, so a poll that read the PR before a push
+# cannot set it back. The same script runs in the ingestion service's
+# webhook handler; scripts/check_shared_copies.py fails if the two differ.
+ENQUEUE_SCRIPT = """
+if not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[3]) then
+    return 0
+end
+local updated_at = tonumber(ARGV[4])
+local head_at = tonumber(redis.call('GET', KEYS[4]))
+if not (updated_at and head_at) or updated_at >= head_at then
+    redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[3])
+    if updated_at then
+        redis.call('SET', KEYS[4], ARGV[4], 'EX', ARGV[3])
+    end
+end
+redis.call('LPUSH', KEYS[3], ARGV[2])
+return 1
+"""
+
+
+def seen_key(repo_full_name, pr_number, sha):
+    return f"pr_dedup:seen:{repo_full_name.lower()}:{pr_number}:{sha}"
+
+
+def head_key(repo_full_name, pr_number):
+    return f"pr_dedup:head:{repo_full_name.lower()}:{pr_number}"
+
+
+def head_at_key(repo_full_name, pr_number):
+    return f"pr_dedup:head_at:{repo_full_name.lower()}:{pr_number}"
+
+
+class PREnqueuer:
+    """
+    Producer side of the PR idempotency layer shared with the ingestion
+    service and the analysis worker. A job is pushed at most once per
+    (repository, PR number, head SHA) within PR_DEDUP_TTL, whichever
+    producer sees the commit first.
+    """
+
+    def __init__(self, redis_client, queue_name, ttl=PR_DEDUP_TTL):
+        self.queue_name = queue_name
+        self.ttl = ttl
+        self.script = redis_client.register_script(ENQUEUE_SCRIPT)
+
+    def enqueue(
+        self, repo_full_name, pr_number, sha, job_json, updated_at=None, client=None
+    ):
+        """
+        Returns True if the job was pushed, False if the SHA was already queued.
+        updated_at is the PR's ISO 8601 update time as GitHub reports it.
+        """
+        updated_at = (
+            datetime.fromisoformat(updated_at).timestamp() if updated_at else ""
+        )
+        pushed = self.script(
+            keys=[
+                seen_key(repo_full_name, pr_number, sha),
+                head_key(repo_full_name, pr_number),
+                self.queue_name,
+                head_at_key(repo_full_name, pr_number),
+            ],
+            args=[sha, job_json, self.ttl, updated_at],
+            client=client,
+        )
+        return bool(pushed)
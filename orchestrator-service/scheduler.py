@@ -1,34 +1,91 @@
 import os
 import time
+import socket
 import json
 from datetime import datetime, timezone
-from pymongo import MongoClient
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
 import redis
 from dotenv import load_dotenv
 from apscheduler.schedulers.blocking import BlockingScheduler
-from github import Github
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+import clients
+from pr_dedup import PREnqueuer
+from github_client import GitHubClient, RateLimitExhausted
+from cluster import LeaderLease, live_workers, recover_dead_workers
 
 load_dotenv()
 MONGO_ATLAS_URI = os.getenv("MONGO_ATLAS_URI")
 GITHUB_PAT = os.getenv("GITHUB_PAT")
 REDIS_URL = os.getenv("REDIS_URL")
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
 
-# Initialize Clients
-client = MongoClient(MONGO_ATLAS_URI)
-db = client["code-reviewer-ai-db"]
-repositores_collection = db["repositories"]
-processed_prs_collection = db["processed_prs"]
+POLL_INTERVAL_SECONDS = int(os.getenv("POLL_INTERVAL_SECONDS", 30))
+POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY", 8))
+# Requests left for the analysis service, which shares the same token.
+RATE_LIMIT_RESERVE = int(os.getenv("RATE_LIMIT_RESERVE", 500))
+METRICS_PORT = int(os.getenv("METRICS_PORT", 8000))
+# Only the replica holding the leader lease polls; the others stand by.
+INSTANCE_ID = os.getenv("INSTANCE_ID", f"{socket.gethostname()}:{os.getpid()}")
+LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", 30))
+# Workers silent for this long are considered dead and their jobs retried.
+WORKER_HEARTBEAT_TIMEOUT = int(os.getenv("WORKER_HEARTBEAT_TIMEOUT", 45))
 
-gh_client = Github(GITHUB_PAT)
+# Backend clients are created on first use, once per process; see clients.py.
+clients.register(
+    "redis", lambda: redis.Redis.from_url(REDIS_URL, decode_responses=True)
+)
+clients.register("mongo", lambda: MongoClient(MONGO_ATLAS_URI))
+clients.register(
+    "github",
+    lambda: GitHubClient(
+        GITHUB_PAT,
+        GITHUB_API_URL,
+        pool_size=POLL_CONCURRENCY,
+        reserve=RATE_LIMIT_RESERVE,
+    ),
+)
+
+DB_NAME = "code-reviewer-ai-db"
+repositores_collection = clients.lazy("mongo", DB_NAME, "repositories")
+processed_prs_collection = clients.lazy("mongo", DB_NAME, "processed_prs")
+github = clients.lazy("github")
 
 PR_QUEUE_NAME = "pr_queue"
+ETAGS_KEY = "pr_poller:etags"
+CHECK_JOB_ID = "check_repositories"
+
+scheduler = BlockingScheduler()
+
+TICK_SECONDS = Histogram(
+    "poller_tick_seconds",
+    "Duration of one polling pass over all active repositories.",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+REPO_POLLS = Counter(
+    "poller_repository_polls_total",
+    "Repository polls by result.",
+    ["result"],
+)
+PRS_QUEUED = Counter("poller_prs_queued_total", "PR head commits queued for review.")
+RATE_LIMIT_REMAINING = Gauge(
+    "poller_github_rate_limit_remaining",
+    "Core rate limit remaining as of the last GitHub response.",
+)
+RATE_LIMIT_REMAINING.set_function(lambda: github.rate_limit.remaining or 0)
+IS_LEADER = Gauge("poller_is_leader", "1 if this instance holds the leader lease.")
+LIVE_WORKERS = Gauge("poller_live_workers", "Analysis workers with a recent heartbeat.")
+DEAD_WORKERS = Counter(
+    "poller_dead_workers_total", "Analysis workers found dead and recovered."
+)
 
 
 def connect_to_redis():
-    """Attempt to connect to Redis, with retries."""
+    """Waits until Redis answers and returns the process's shared client."""
     while True:
         try:
-            r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+            r = clients.get("redis")
             r.ping()
             print("Successfully connected to Redis!")
             return r
@@ -37,77 +94,285 @@ def connect_to_redis():
             time.sleep(5)
 
 
-def check_repositories():
-    """Fetches PRs for active repos and queues them for analysis."""
+def ensure_indexes():
+    """
+    Creates the indexes the poller's queries rely on. The processed_prs
+    index is unique so a commit can only be recorded once; if existing
+    duplicates prevent building it, a plain index is used instead.
+    """
+    processed_prs_key = [
+        ("repo_full_name", ASCENDING),
+        ("pr_number", ASCENDING),
+        ("commit_sha", ASCENDING),
+    ]
+    try:
+        processed_prs_collection.create_index(
+            processed_prs_key, unique=True, name="repo_pr_commit_unique"
+        )
+    except OperationFailure as e:
+        print(f"Could not build unique processed_prs index ({e}). Using a plain one.")
+        processed_prs_collection.create_index(processed_prs_key, name="repo_pr_commit")
+    repositores_collection.create_index(
+        [("status", ASCENDING), ("last_checked_at", ASCENDING)]
+    )
+    print("MongoDB indexes are in place.")
+
+
+def next_interval(tick_cost):
+    """
+    Returns the seconds to wait between ticks so that ticks costing
+    tick_cost requests do not run out of budget before the reset.
+    """
+    available = github.rate_limit.available()
+    if available is None or tick_cost == 0:
+        return POLL_INTERVAL_SECONDS
+    until_reset = max(0, github.rate_limit.reset_at - time.time())
+    if available == 0:
+        return max(POLL_INTERVAL_SECONDS, until_reset)
+    return max(POLL_INTERVAL_SECONDS, until_reset * tick_cost / available)
+
+
+def fetch_open_prs(full_name, etag):
+    """
+    Returns (open PRs, ETag of the listing), or (None, etag) if nothing
+    changed since the listing with that ETag. PRs are listed most recently
+    updated first, so a new PR or a push to any PR changes the first page;
+    only that page is requested conditionally, and a 304 costs no rate limit.
+    """
+    response = github.get(
+        f"/repos/{full_name}/pulls",
+        params={
+            "state": "open",
+            "sort": "updated",
+            "direction": "desc",
+            "per_page": 100,
+        },
+        headers={"If-None-Match": etag} if etag else {},
+    )
+    if response.status_code == 304:
+        return None, etag
+    response.raise_for_status()
+    new_etag = response.headers.get("ETag")
+
+    pulls = response.json()
+    while "next" in response.links:
+        response = github.get(response.links["next"]["url"])
+        response.raise_for_status()
+        pulls.extend(response.json())
+    return pulls, new_etag
+
+
+def poll_repository(redis_client, enqueuer, full_name):
+    """
+    Queues the repository's open PRs whose head commit was not seen yet.
+    Commits the webhook already queued are recorded but not queued again.
+    """
+    etag = redis_client.hget(ETAGS_KEY, full_name)
+    pulls, new_etag = fetch_open_prs(full_name, etag)
+    if pulls is None:
+        REPO_POLLS.labels("unchanged").inc()
+        return 0
+    REPO_POLLS.labels("changed").inc()
+
+    seen = {
+        (doc["pr_number"], doc["commit_sha"])
+        for doc in processed_prs_collection.find(
+            {
+                "repo_full_name": full_name,
+                "pr_number": {"$in": [pr["number"] for pr in pulls]},
+            },
+            {"_id": 0, "pr_number": 1, "commit_sha": 1},
+        )
+    }
+
+    jobs, records = [], []
+    for pr in pulls:
+        latest_commit_sha = pr["head"]["sha"]
+        if (pr["number"], latest_commit_sha) in seen:
+            continue
+
+        github_payload = {
+            "number": pr["number"],
+            "repository": {
+                "full_name": full_name,
+                "clone_url": pr["base"]["repo"]["clone_url"],
+            },
+            "pull_request": {
+                "head": {"ref": pr["head"]["ref"], "sha": latest_commit_sha},
+                "diff_url": pr.get("diff_url"),
+            },
+        }
+
+        job_to_queue = {
+            "eventType": "pull_request",
+            "source": "poll",
+            "enqueuedAt": time.time(),
+            "payload": github_payload,
+        }
+        jobs.append(
+            (
+                pr["number"],
+                latest_commit_sha,
+                json.dumps(job_to_queue),
+                pr.get("updated_at"),
+            )
+        )
+        records.append(
+            UpdateOne(
+                {
+                    "repo_full_name": full_name,
+                    "pr_number": pr["number"],
+                    "commit_sha": latest_commit_sha,
+                },
+                {"$setOnInsert": {"processed_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+        )
+
+    queued_count = 0
+    if jobs:
+        pipe = redis_client.pipeline(transaction=False)
+        for pr_number, sha, job_json, updated_at in jobs:
+            enqueuer.enqueue(
+                full_name, pr_number, sha, job_json, updated_at, client=pipe
+            )
+        queued_count = sum(pipe.execute())
+        processed_prs_collection.bulk_write(records, ordered=False)
+        PRS_QUEUED.inc(queued_count)
+        if queued_count > 0:
+            print(f"Queued {queued_count} new/updated PRs from {full_name}.")
+
+    # Only remember the listing once its PRs are queued, so a failed poll
+    # is retried in full on the next tick.
+    if new_etag:
+        redis_client.hset(ETAGS_KEY, full_name, new_etag)
+    return queued_count
+
+
+def maintain_cluster(leader):
+    """
+    Takes or renews the leader lease and, as leader, releases the jobs of
+    analysis workers that stopped sending heartbeats.
+    """
+    try:
+        leading = leader.acquire()
+    except redis.exceptions.ConnectionError as e:
+        print(f"Could not renew the leader lease: {e}")
+        leader.is_leader = False
+        leading = False
+    IS_LEADER.set(int(leading))
+    if not leading:
+        return
+
+    dead = recover_dead_workers(leader.redis, PR_QUEUE_NAME, WORKER_HEARTBEAT_TIMEOUT)
+    DEAD_WORKERS.inc(len(dead))
+    workers = live_workers(leader.redis, WORKER_HEARTBEAT_TIMEOUT)
+    LIVE_WORKERS.set(len(workers))
+    if dead:
+        print(
+            f"{len(workers)} analysis workers alive: "
+            + (", ".join(w["id"] for w in workers) or "none")
+        )
+
+
+def check_repositories(leader=None):
+    """
+    Polls every active repository for new or updated PRs, POLL_CONCURRENCY
+    at a time and least recently checked first, then stretches the polling
+    interval if the last tick's cost would exhaust the rate limit before it
+    resets.
+    """
+    if leader is not None and not leader.is_leader:
+        return
     print(
         f"\nScheduler running at {datetime.now(timezone.utc)} UTC: Checking for repositories..."
     )
 
-    redis_client = connect_to_redis()
+    if github.rate_limit.available() == 0:
+        print("Skipping this run: GitHub rate limit budget for polling is spent.")
+        return
 
-    active_repos = repositores_collection.find({"status": "active"})
+    redis_client = clients.get("redis")
+    enqueuer = PREnqueuer(redis_client, PR_QUEUE_NAME)
+    active_repos = list(
+        repositores_collection.find(
+            {"status": "active"}, {"full_name": 1, "last_checked_at": 1}
+        ).sort("last_checked_at", 1)
+    )
+    remaining_before = github.rate_limit.available()
 
-    for repo_doc in active_repos:
+    def poll(repo_doc):
         full_name = repo_doc["full_name"]
-        print(f" -> Processing repository: {full_name}")
-
         try:
-            repo = gh_client.get_repo(full_name)
-            open_prs = repo.get_pulls(state="open", sort="created", direction="desc")
-
-            queued_count = 0
-            for pr in open_prs:
-                latest_commit_sha = pr.head.sha
-                is_processed = processed_prs_collection.find_one(
-                    {
-                        "repo_full_name": full_name,
-                        "pr_number": pr.number,
-                        "commit_sha": latest_commit_sha,
-                    }
-                )
-
-                if is_processed:
-                    continue
-
-                github_payload = {
-                    "number": pr.number,
-                    "repository": {"full_name": full_name, "clone_url": repo.clone_url},
-                    "pull_request": {"head": {"ref": pr.head.ref}},
-                }
-
-                job_to_queue = {"eventType": "pull_request", "payload": github_payload}
-
-                redis_client.lpush(PR_QUEUE_NAME, json.dumps(job_to_queue))
-                queued_count += 1
-
-                processed_prs_collection.insert_one(
-                    {
-                        "repo_full_name": full_name,
-                        "pr_number": pr.number,
-                        "commit_sha": latest_commit_sha,
-                        "processed_at": datetime.now(timezone.utc),
-                    }
-                )
-
-            if queued_count > 0:
-                print(f"Queued {queued_count} new/updated PRs for analysis.")
-
-            repositores_collection.update_one(
-                {"_id": repo_doc["_id"]},
-                {"$set": {"last_checked_at": datetime.now(timezone.utc)}},
-            )
-
+            poll_repository(redis_client, enqueuer, full_name)
+            return repo_doc["_id"]
+        except RateLimitExhausted:
+            REPO_POLLS.labels("rate_limited").inc()
+            return None
         except Exception as e:
+            REPO_POLLS.labels("error").inc()
             print(f"ERROR: Failed to process repository {full_name}: {e}")
+            return None
+
+    with (
+        TICK_SECONDS.time(),
+        ThreadPoolExecutor(max_workers=POLL_CONCURRENCY) as executor,
+    ):
+        checked_ids = [i for i in executor.map(poll, active_repos) if i is not None]
+
+    if checked_ids:
+        repositores_collection.update_many(
+            {"_id": {"$in": checked_ids}},
+            {"$set": {"last_checked_at": datetime.now(timezone.utc)}},
+        )
+
+    remaining_after = github.rate_limit.available()
+    tick_cost = (
+        max(0, remaining_before - remaining_after)
+        if remaining_before is not None and remaining_after is not None
+        else 0
+    )
+    print(
+        f"Checked {len(checked_ids)} of {len(active_repos)} repositories "
+        f"using {tick_cost} rate-limited requests."
+    )
+
+    interval = next_interval(tick_cost)
+    job = scheduler.get_job(CHECK_JOB_ID)
+    if job and abs(job.trigger.interval.total_seconds() - interval) >= 1:
+        print(f"Polling every {interval:.0f}s to stay within the rate limit.")
+        scheduler.reschedule_job(CHECK_JOB_ID, trigger="interval", seconds=interval)
 
 
 if __name__ == "__main__":
-    scheduler = BlockingScheduler()
-    scheduler.add_job(check_repositories, "interval", seconds=30)
+    ensure_indexes()
+    start_http_server(METRICS_PORT)
+    leader = LeaderLease(connect_to_redis(), INSTANCE_ID, LEADER_LEASE_SECONDS)
+    maintain_cluster(leader)
+    scheduler.add_job(
+        maintain_cluster,
+        "interval",
+        seconds=LEADER_LEASE_SECONDS / 3,
+        args=[leader],
+        coalesce=True,
+        max_instances=1,
+    )
+    scheduler.add_job(
+        check_repositories,
+        "interval",
+        seconds=POLL_INTERVAL_SECONDS,
+        args=[leader],
+        id=CHECK_JOB_ID,
+        coalesce=True,
+        max_instances=1,
+    )
 
-    print("Orchestrator scheduler started. Press Ctrl+C to exit.")
+    print(f"Orchestrator scheduler {INSTANCE_ID} started. Press Ctrl+C to exit.")
 
     try:
         scheduler.start()
     except (KeyboardInterrupt, SystemExit):
         pass
+    finally:
+        leader.release()
+        clients.close_all()
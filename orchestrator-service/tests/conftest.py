@@ -0,0 +1,29 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def redis_client():
+    """
+    A Redis that runs Lua scripts: TEST_REDIS_URL if set, otherwise fakeredis
+    (which needs lupa for scripts). Skips the test when neither is usable.
+    The database is flushed before and after.
+    """
+    url = os.getenv("TEST_REDIS_URL")
+    if url:
+        import redis
+
+        client = redis.Redis.from_url(url, decode_responses=True)
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        client = fakeredis.FakeRedis(decode_responses=True)
+    try:
+        client.eval("return 1", 0)
+    except Exception as e:
+        pytest.skip(f"Redis without Lua scripting: {e}")
+    client.flushdb()
+    yield client
+    client.flushdb()
@@ -0,0 +1,53 @@
+import json
+import pytest
+from pr_dedup import PREnqueuer, head_key
+
+
+@pytest.fixture
+def enqueuer(redis_client):
+    return PREnqueuer(redis_client, "pr_queue", ttl=60)
+
+
+def enqueue(enqueuer, sha, updated_at=None, number=7, repo="Octo/Widgets"):
+    job = json.dumps({"payload": {"number": number, "sha": sha}})
+    return enqueuer.enqueue(repo, number, sha, job, updated_at)
+
+
+def test_commit_is_queued_once(redis_client, enqueuer):
+    assert enqueue(enqueuer, "a" * 40)
+    assert not enqueue(enqueuer, "a" * 40)
+    # Another PR with the same commit is its own job.
+    assert enqueue(enqueuer, "a" * 40, number=8)
+    assert redis_client.llen("pr_queue") == 2
+
+
+def test_repository_name_is_case_insensitive(redis_client, enqueuer):
+    assert enqueue(enqueuer, "a" * 40, repo="Octo/Widgets")
+    assert not enqueue(enqueuer, "a" * 40, repo="octo/widgets")
+
+
+def test_head_follows_newer_commits(redis_client, enqueuer):
+    enqueue(enqueuer, "a" * 40, "2026-03-01T10:00:00Z")
+    enqueue(enqueuer, "b" * 40, "2026-03-01T10:05:00Z")
+    assert redis_client.get(head_key("octo/widgets", 7)) == "b" * 40
+
+
+def test_head_never_moves_back(redis_client, enqueuer):
+    enqueue(enqueuer, "b" * 40, "2026-03-01T10:05:00Z")
+    # A poll that listed the PR before the push arrives late.
+    assert enqueue(enqueuer, "a" * 40, "2026-03-01T10:00:00Z")
+    assert redis_client.get(head_key("octo/widgets", 7)) == "b" * 40
+    assert redis_client.llen("pr_queue") == 2
+
+
+def test_head_without_update_time_always_moves(redis_client, enqueuer):
+    enqueue(enqueuer, "b" * 40, "2026-03-01T10:05:00Z")
+    enqueue(enqueuer, "c" * 40)
+    assert redis_client.get(head_key("octo/widgets", 7)) == "c" * 40
+
+
+def test_enqueue_in_a_pipeline(redis_client, enqueuer):
+    pipe = redis_client.pipeline(transaction=False)
+    for sha in ("a" * 40, "b" * 40, "a" * 40):
+        enqueuer.enqueue("octo/widgets", 7, sha, "{}", client=pipe)
+    assert pipe.execute() == [1, 1, 0]
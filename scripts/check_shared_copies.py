@@ -0,0 +1,57 @@
+"""
+Fails if code the services keep their own copies of has drifted apart: the
+Redis/MongoDB client registry and the GitHub client of the analysis and
+orchestrator services, and the PR enqueue script the orchestrator's poller
+and the ingestion service's webhook handler both run.
+
+    python scripts/check_shared_copies.py
+"""
+
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IDENTICAL_FILES = (
+    ("analysis-service/clients.py", "orchestrator-service/clients.py"),
+    ("analysis-service/github_client.py", "orchestrator-service/github_client.py"),
+)
+
+# (file, pattern capturing the script's source)
+ENQUEUE_SCRIPTS = (
+    ("orchestrator-service/pr_dedup.py", r'ENQUEUE_SCRIPT = """(.*?)"""'),
+    ("ingestion-service/index.js", r"const ENQUEUE_PR_SCRIPT = `(.*?)`;"),
+)
+
+
+def read(relative_path):
+    with open(os.path.join(ROOT, relative_path), "rb") as f:
+        return f.read()
+
+
+def main():
+    failures = []
+    for first, second in IDENTICAL_FILES:
+        if read(first) != read(second):
+            failures.append(f"{first} and {second} differ.")
+
+    scripts = {}
+    for path, pattern in ENQUEUE_SCRIPTS:
+        match = re.search(pattern, read(path).decode(), re.DOTALL)
+        if match is None:
+            failures.append(f"No PR enqueue script found in {path}.")
+        else:
+            scripts[path] = match.group(1).strip()
+    if len(set(scripts.values())) > 1:
+        failures.append(f"The PR enqueue scripts in {' and '.join(scripts)} differ.")
+
+    for failure in failures:
+        print(failure)
+    if not failures:
+        print("Shared copies are identical.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()